@@ -0,0 +1,206 @@
+import asyncio
+import importlib
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+import psutil
+
+from browser_pool import close_browser_pool, configure_browser_pool
+from fixtures import FixtureRecorder, FixtureReplay, FixtureStore
+from geo_db import configure_geo_database
+from http_sources import close_http_session
+from lookup_cache import configure_lookup_cache
+from range_index import RangeIndex
+from resilience import reset_guards
+
+# Движок поиска находится в ip-text.py, имя модуля с дефисом
+engine = importlib.import_module("ip-text")
+
+# Режимы сравнения: способ загрузки источников и настройки пула браузеров.
+# "browser" - все источники через браузер, запуск браузера на каждую
+# загрузку, как до пула; "pooled" - те же четыре страницы в одном
+# долгоживущем браузере
+MODES = {
+    "browser": {
+        "transport": "browser", "browsers": 4, "contexts_per_browser": 1, "relaunch": True,
+    },
+    "pooled": {"transport": "browser", "browsers": 1, "contexts_per_browser": 4},
+    "http": {"transport": None, "browsers": 1, "contexts_per_browser": 4},
+}
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Перцентиль по отсортированному списку значений"""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, round(q * (len(values) - 1))))
+    return values[index]
+
+
+class RssSampler:
+    """Пиковое потребление памяти процессом вместе с дочерними (Chrome)"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self._process = psutil.Process()
+        self._task: Optional[asyncio.Task] = None
+
+    def sample(self) -> int:
+        total = self._process.memory_info().rss
+        for child in self._process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        self.peak = max(self.peak, total)
+        return total
+
+    async def _run(self) -> None:
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self.sample()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+def reset_engine() -> None:
+    """Холодный старт: без кэшей, локальной базы и истории источников"""
+    configure_lookup_cache(None)
+    configure_geo_database(None)
+    engine.configure_unified_memo(max_entries=100000, max_bytes=256 * 1024 * 1024, ttl=600)
+    engine.range_index = RangeIndex()
+    reset_guards()
+
+
+async def record_fixtures(
+    ips: List[str], path: str, sources: Optional[List[str]] = None
+) -> FixtureStore:
+    """Запись ответов всех источников для списка IP"""
+    reset_engine()
+    store = FixtureStore(ips)
+    recorder = FixtureRecorder(store)
+    recorder.install()
+    try:
+        for ip_address in ips:
+            await engine.get_unified_ip_data(ip_address, sources)
+    finally:
+        recorder.uninstall()
+        await close_browser_pool()
+        await close_http_session()
+    store.save(path)
+    return store
+
+
+async def run_mode(
+    store: FixtureStore,
+    mode: str,
+    concurrency: int = 8,
+    rounds: int = 1,
+    sources: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Замер одного режима на сохраненных ответах"""
+    settings = MODES[mode]
+    transports = dict(engine.TRANSPORTS)
+    if settings["transport"] is not None:
+        engine.TRANSPORTS.update({name: settings["transport"] for name in transports})
+    configure_browser_pool(
+        browsers=settings["browsers"],
+        contexts_per_browser=settings["contexts_per_browser"],
+        relaunch=settings.get("relaunch", False),
+    )
+
+    latencies: List[float] = []
+    errors = 0
+    sampler = RssSampler()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(ip_address: str) -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            result = await engine.get_unified_ip_data(ip_address, sources)
+            latencies.append(time.perf_counter() - started)
+            if result["combined"].get("error"):
+                errors += 1
+
+    replay = FixtureReplay(store)
+    await replay.start()
+    sampler.start()
+    started = time.perf_counter()
+    try:
+        for _ in range(rounds):
+            # Каждый круг с холодными кэшами, иначе замеряется только память
+            reset_engine()
+            await asyncio.gather(*(timed(ip) for ip in store.ips))
+        elapsed = time.perf_counter() - started
+    finally:
+        await sampler.stop()
+        await replay.stop()
+        await close_browser_pool()
+        await close_http_session()
+        engine.TRANSPORTS.clear()
+        engine.TRANSPORTS.update(transports)
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "lookups": len(latencies),
+        "errors": errors,
+        "replay_misses": replay.misses,
+        "seconds": elapsed,
+        "lookups_per_second": len(latencies) / elapsed if elapsed else None,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "peak_rss_mb": sampler.peak / (1024 * 1024),
+    }
+
+
+async def run_benchmark(
+    fixture_path: str,
+    modes: Optional[List[str]] = None,
+    concurrency: int = 8,
+    rounds: int = 1,
+    sources: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """Замер всех режимов подряд на одном наборе сохраненных ответов"""
+    store = FixtureStore.load(fixture_path)
+    results = []
+    for mode in modes or list(MODES):
+        results.append(await run_mode(store, mode, concurrency, rounds, sources))
+    return results
+
+
+def format_results(results: List[Dict[str, Any]]) -> str:
+    """Таблица результатов замера"""
+    def ms(value: Optional[float]) -> str:
+        return f"{value * 1000:8.1f}" if value is not None else "       -"
+
+    lines = [
+        f"{'режим':<8} {'поисков':>7} {'ошибок':>6} {'в сек':>8} "
+        f"{'p50 мс':>8} {'p95 мс':>8} {'p99 мс':>8} {'RSS МБ':>8}"
+    ]
+    for r in results:
+        lines.append(
+            f"{r['mode']:<8} {r['lookups']:>7} {r['errors']:>6} "
+            f"{r['lookups_per_second'] or 0:>8.2f} {ms(r['p50'])} {ms(r['p95'])} "
+            f"{ms(r['p99'])} {r['peak_rss_mb']:>8.0f}"
+        )
+    return "\n".join(lines)
+
+
+def save_results(results: List[Dict[str, Any]], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,259 @@
+from playwright.async_api import async_playwright, Browser, BrowserContext, Page, Playwright
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from resilience import queue_wait
+from scrape_profile import ScrapeProfile
+from tracing import span
+
+
+@dataclass
+class PageSlot:
+    """Слот пула: отдельный контекст браузера с переиспользуемой страницей"""
+
+    browser_index: int
+    key: Optional[Tuple[Optional[str], Optional[str]]] = None
+    context: Optional[BrowserContext] = None
+    page: Optional[Page] = None
+    uses: int = 0
+
+
+class BrowserPool:
+    """Долгоживущий пул браузеров Playwright с арендой страниц
+
+    С relaunch=True каждая аренда запускает свой браузер и закрывает его
+    после использования, как до появления пула: режим для сравнительных
+    замеров, на каждый браузер приходится один контекст.
+    """
+
+    def __init__(
+        self,
+        browsers: int = 1,
+        contexts_per_browser: int = 4,
+        max_page_uses: int = 50,
+        channel: Optional[str] = "chrome",
+        headless: bool = True,
+        launch_options: Optional[Dict[str, Any]] = None,
+        relaunch: bool = False,
+    ):
+        if relaunch and contexts_per_browser != 1:
+            raise ValueError("С relaunch на браузер приходится один контекст")
+        self.browsers = browsers
+        self.contexts_per_browser = contexts_per_browser
+        self.max_page_uses = max_page_uses
+        self.channel = channel
+        self.headless = headless
+        self.launch_options = launch_options or {}
+        self.relaunch = relaunch
+
+        self._playwright: Optional[Playwright] = None
+        self._browsers: List[Optional[Browser]] = []
+        self._browser_locks: List[asyncio.Lock] = []
+        self._idle: List[PageSlot] = []
+        self._free: Optional[asyncio.Semaphore] = None
+        self._start_lock = asyncio.Lock()
+        self._started = False
+        self._context_hooks: List[Callable[[BrowserContext], Awaitable[None]]] = []
+
+    def add_context_hook(self, hook: Callable[[BrowserContext], Awaitable[None]]) -> None:
+        """Настройка каждого нового контекста, например запись или подмена ответов
+
+        Хук вызывается после профиля, поэтому его маршруты имеют приоритет.
+        Уже созданные контексты не затрагиваются.
+        """
+        self._context_hooks.append(hook)
+
+    def remove_context_hook(self, hook: Callable[[BrowserContext], Awaitable[None]]) -> None:
+        self._context_hooks.remove(hook)
+
+    @property
+    def started(self) -> bool:
+        """Запущен ли пул"""
+        return self._started
+
+    @property
+    def size(self) -> int:
+        """Общее количество одновременно арендуемых страниц"""
+        return self.browsers * self.contexts_per_browser
+
+    async def start(self) -> None:
+        """Запуск Playwright и всех браузеров пула"""
+        async with self._start_lock:
+            if self._started:
+                return
+
+            self._playwright = await async_playwright().start()
+            if self.relaunch:
+                # Браузеры запускаются при аренде
+                self._browsers = [None] * self.browsers
+            else:
+                self._browsers = [await self._launch() for _ in range(self.browsers)]
+            self._browser_locks = [asyncio.Lock() for _ in range(self.browsers)]
+            self._idle = [
+                PageSlot(browser_index=i)
+                for _ in range(self.contexts_per_browser)
+                for i in range(self.browsers)
+            ]
+            self._free = asyncio.Semaphore(self.size)
+            self._started = True
+
+    async def close(self) -> None:
+        """Закрытие всех контекстов, браузеров и Playwright"""
+        async with self._start_lock:
+            if not self._started:
+                return
+
+            for slot in self._idle:
+                await self._recycle(slot)
+            for browser in self._browsers:
+                if browser is not None:
+                    try:
+                        await browser.close()
+                    except Exception:
+                        pass
+            await self._playwright.stop()
+
+            self._playwright = None
+            self._browsers = []
+            self._idle = []
+            self._started = False
+
+    async def _launch(self) -> Browser:
+        """Запуск одного экземпляра Chrome"""
+        with span("browser.launch"):
+            return await self._playwright.chromium.launch(
+                channel=self.channel, headless=self.headless, **self.launch_options
+            )
+
+    async def _ensure_browser(self, index: int) -> Browser:
+        """Перезапуск браузера, если он упал или был отключен"""
+        async with self._browser_locks[index]:
+            browser = self._browsers[index]
+            if browser is None or not browser.is_connected():
+                self._browsers[index] = await self._launch()
+            return self._browsers[index]
+
+    async def _close_browser(self, index: int) -> None:
+        """Закрытие браузера, следующая аренда запустит новый"""
+        async with self._browser_locks[index]:
+            browser, self._browsers[index] = self._browsers[index], None
+            if browser is not None:
+                try:
+                    await browser.close()
+                except Exception:
+                    pass
+
+    async def _open(
+        self, slot: PageSlot, device: Optional[str], profile: Optional[ScrapeProfile]
+    ) -> None:
+        """Создание нового контекста и страницы для слота"""
+        browser = await self._ensure_browser(slot.browser_index)
+        options = dict(self._playwright.devices[device]) if device else {}
+
+        with span("browser.context", profile=profile.name if profile else None):
+            slot.context = await browser.new_context(**options)
+            if profile is not None:
+                await profile.apply(slot.context)
+                slot.context.set_default_timeout(profile.selector_timeout)
+                slot.context.set_default_navigation_timeout(profile.goto_timeout)
+            for hook in self._context_hooks:
+                await hook(slot.context)
+            slot.page = await slot.context.new_page()
+        slot.key = (device, profile.name if profile else None)
+        slot.uses = 0
+
+    async def _recycle(self, slot: PageSlot) -> None:
+        """Закрытие контекста слота, следующая аренда создаст новый"""
+        if slot.context is not None:
+            try:
+                await slot.context.close()
+            except Exception:
+                pass
+
+        slot.context = None
+        slot.page = None
+        slot.key = None
+        slot.uses = 0
+
+    def _take_slot(self, key: Tuple[Optional[str], Optional[str]]) -> PageSlot:
+        """Выбор свободного слота, предпочтительно с теми же настройками"""
+        for i, slot in enumerate(self._idle):
+            if slot.page is not None and slot.key == key:
+                return self._idle.pop(i)
+        # Иначе берем пустой слот, а при их отсутствии - давно не использованный
+        for i, slot in enumerate(self._idle):
+            if slot.page is None:
+                return self._idle.pop(i)
+        return self._idle.pop(0)
+
+    @asynccontextmanager
+    async def page(
+        self, device: Optional[str] = None, profile: Optional[ScrapeProfile] = None
+    ) -> AsyncIterator[Page]:
+        """Аренда страницы из пула
+
+        Страница возвращается в пул после использования. При исключении внутри
+        блока или после max_page_uses использований контекст пересоздается.
+        Профиль задает устройство, блокировку ресурсов и таймауты контекста.
+        """
+        if not self._started:
+            await self.start()
+
+        if device is None and profile is not None:
+            device = profile.device
+        key = (device, profile.name if profile else None)
+
+        # Очередь за страницей не входит в таймаут и задержку источника
+        with span("browser.acquire"), queue_wait():
+            await self._free.acquire()
+        slot = self._take_slot(key)
+        try:
+            if slot.page is None or slot.page.is_closed() or slot.key != key:
+                await self._recycle(slot)
+                await self._open(slot, device, profile)
+
+            slot.uses += 1
+            try:
+                yield slot.page
+            except BaseException:
+                await self._recycle(slot)
+                raise
+
+            if slot.uses >= self.max_page_uses:
+                await self._recycle(slot)
+        finally:
+            try:
+                if self.relaunch:
+                    await self._recycle(slot)
+                    await self._close_browser(slot.browser_index)
+            finally:
+                self._idle.append(slot)
+                self._free.release()
+
+
+_default_pool: Optional[BrowserPool] = None
+
+
+def configure_browser_pool(**kwargs) -> BrowserPool:
+    """Замена общего пула пулом с новыми настройками"""
+    global _default_pool
+    if _default_pool is not None and _default_pool._started:
+        raise RuntimeError("Пул браузеров уже запущен, сначала закройте его")
+    _default_pool = BrowserPool(**kwargs)
+    return _default_pool
+
+
+def get_browser_pool() -> BrowserPool:
+    """Общий пул браузеров для всех источников"""
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = BrowserPool()
+    return _default_pool
+
+
+async def close_browser_pool() -> None:
+    """Закрытие общего пула браузеров"""
+    if _default_pool is not None:
+        await _default_pool.close()
@@ -0,0 +1,292 @@
+import argparse
+import glob
+import ipaddress
+import json
+import math
+import os
+import struct
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from geo_db import (
+    FLOAT_FIELDS,
+    FORMAT_VERSION,
+    HEADER_FORMAT,
+    HEADER_SIZE,
+    MAGIC,
+    NO_STRING,
+    RECORD_FORMAT,
+    STRING_FIELDS,
+    V4_RANGE_FORMAT,
+    V6_RANGE_FORMAT,
+    GeoDatabase,
+)
+from range_index import parse_ip_range
+from source_registry import coordinate
+
+_U64 = (1 << 64) - 1
+
+# Соответствие полей сырых данных источников полям записи
+RAW_FIELD_ALIASES = {"zip": "zip_code", "postal_code": "zip_code", "asn_number": "asn"}
+
+
+def _to_float(value: Any) -> Optional[float]:
+    """Преобразование координаты в число"""
+    try:
+        return float(value) if value not in (None, "") else None
+    except (ValueError, TypeError):
+        return None
+
+
+def normalize_record(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Приведение записи к полям базы"""
+    record: Dict[str, Any] = {}
+    for key, value in data.items():
+        key = RAW_FIELD_ALIASES.get(key, key)
+        if value in (None, "") or key in record:
+            continue
+        if key in STRING_FIELDS:
+            record[key] = str(value).strip()
+        elif key in FLOAT_FIELDS:
+            number = _to_float(value)
+            if number is not None:
+                record[key] = number
+        elif key == "is_anycast" and isinstance(value, bool):
+            record[key] = value
+
+    # Координаты строкой 'широта, долгота' (whatismyipaddress.com), отдельные
+    # поля широты и долготы имеют приоритет
+    for index, name in enumerate(FLOAT_FIELDS):
+        if name not in record:
+            try:
+                number = coordinate(index)(data.get("coordinates"))
+            except ValueError:
+                number = None
+            if number is not None:
+                record[name] = number
+    return record
+
+
+def extract_records(document: Any) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Извлечение пар (ip_address, запись) из сохраненных результатов
+
+    Поддерживаются снимки ip_data_*.json, результаты get_unified_ip_data
+    и отдельные записи UnifiedIPData.to_dict(), а также их списки.
+    """
+    if isinstance(document, list):
+        for item in document:
+            yield from extract_records(item)
+        return
+    if not isinstance(document, dict):
+        return
+
+    # Снимок ip-to-geo.py: сырые данные всех источников
+    if "combined_data" in document:
+        combined = document["combined_data"]
+        merged: Dict[str, Any] = {}
+        for source_data in combined.get("sources", {}).values():
+            if "error" in source_data:
+                continue
+            for key, value in normalize_record(source_data).items():
+                merged.setdefault(key, value)
+        if merged:
+            yield combined["ip_address"], merged
+        return
+
+    # Результат get_unified_ip_data
+    if "combined" in document:
+        yield from extract_records(document["combined"])
+        return
+
+    if "ip_address" in document and not document.get("range_derived"):
+        record = normalize_record(document)
+        if set(record) - {"ip_range"}:
+            yield document["ip_address"], record
+
+
+def iter_input_documents(paths: Iterable[str]) -> Iterator[Any]:
+    """Чтение JSON и JSONL файлов, шаблоны путей раскрываются"""
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            with open(path, "r", encoding="utf-8") as f:
+                if path.endswith(".jsonl"):
+                    for line in f:
+                        line = line.strip()
+                        if line:
+                            yield json.loads(line)
+                else:
+                    yield json.load(f)
+
+
+def flatten_ranges(
+    ranges: Dict[Tuple[int, int], int]
+) -> List[Tuple[int, int, int]]:
+    """Преобразование вложенных диапазонов в непересекающиеся
+
+    Диапазоны - CIDR-блоки, поэтому любые два либо вложены, либо не
+    пересекаются. Более узкий диапазон перекрывает объемлющий.
+    """
+    out: List[List[int]] = []
+
+    def emit(start: int, end: int, record: int) -> None:
+        if start > end:
+            return
+        if out and out[-1][2] == record and out[-1][1] + 1 == start:
+            out[-1][1] = end
+        else:
+            out.append([start, end, record])
+
+    stack: List[Tuple[int, int, int]] = []
+    cursor = 0
+    for (start, end), record in sorted(ranges.items(), key=lambda x: (x[0][0], -x[0][1])):
+        while stack and stack[-1][1] < start:
+            top = stack.pop()
+            emit(cursor, top[1], top[2])
+            cursor = top[1] + 1
+        if stack:
+            emit(cursor, start - 1, stack[-1][2])
+        stack.append((start, end, record))
+        cursor = start
+
+    while stack:
+        top = stack.pop()
+        emit(cursor, top[1], top[2])
+        cursor = top[1] + 1
+
+    return [tuple(item) for item in out]
+
+
+class GeoDatabaseBuilder:
+    """Сборка компактной базы из собранных результатов"""
+
+    def __init__(self):
+        self._strings = bytearray()
+        self._string_offsets: Dict[str, int] = {}
+        self._records: List[bytes] = []
+        self._record_index: Dict[bytes, int] = {}
+        self._ranges: Dict[int, Dict[Tuple[int, int], int]] = {4: {}, 6: {}}
+
+    def _intern_string(self, value: Optional[str]) -> int:
+        """Смещение строки в таблице строк, одинаковые строки хранятся один раз"""
+        if value is None:
+            return NO_STRING
+        offset = self._string_offsets.get(value)
+        if offset is None:
+            encoded = value.encode("utf-8")[:0xFFFF]
+            offset = len(self._strings)
+            self._strings += struct.pack("<H", len(encoded)) + encoded
+            self._string_offsets[value] = offset
+        return offset
+
+    def _intern_record(self, record: Dict[str, Any]) -> int:
+        """Номер записи фиксированной ширины, одинаковые записи хранятся один раз"""
+        anycast = record.get("is_anycast")
+        packed = struct.pack(
+            RECORD_FORMAT,
+            *(self._intern_string(record.get(name)) for name in STRING_FIELDS),
+            *(record.get(name, math.nan) for name in FLOAT_FIELDS),
+            -1 if anycast is None else int(anycast),
+        )
+        index = self._record_index.get(packed)
+        if index is None:
+            index = len(self._records)
+            self._records.append(packed)
+            self._record_index[packed] = index
+        return index
+
+    def add(self, ip_address: str, record: Dict[str, Any]) -> int:
+        """Добавление записи по ее ip_range или по самому адресу
+
+        Повторный диапазон заменяет предыдущий, поэтому более поздние
+        входные данные имеют приоритет. Возвращает количество префиксов.
+        """
+        try:
+            if record.get("ip_range"):
+                networks = parse_ip_range(record["ip_range"])
+            else:
+                networks = [ipaddress.ip_network(ip_address)]
+        except ValueError:
+            return 0
+
+        index = self._intern_record(record)
+        for network in networks:
+            key = (int(network.network_address), int(network.broadcast_address))
+            self._ranges[network.version][key] = index
+        return len(networks)
+
+    def build(self, path: str) -> Dict[str, int]:
+        """Запись базы в файл, файл заменяется атомарно"""
+        v4 = flatten_ranges(self._ranges[4])
+        v6 = flatten_ranges(self._ranges[6])
+
+        v4_table = b"".join(struct.pack(V4_RANGE_FORMAT, *item) for item in v4)
+        v6_table = b"".join(
+            struct.pack(
+                V6_RANGE_FORMAT, start >> 64, start & _U64, end >> 64, end & _U64, record
+            )
+            for start, end, record in v6
+        )
+        records = b"".join(self._records)
+
+        strings_offset = HEADER_SIZE
+        records_offset = strings_offset + len(self._strings)
+        v4_offset = records_offset + len(records)
+        v6_offset = v4_offset + len(v4_table)
+        header = struct.pack(
+            HEADER_FORMAT,
+            MAGIC,
+            FORMAT_VERSION,
+            len(self._records),
+            len(v4),
+            len(v6),
+            strings_offset,
+            records_offset,
+            v4_offset,
+            v6_offset,
+        )
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            f.write(self._strings)
+            f.write(records)
+            f.write(v4_table)
+            f.write(v6_table)
+        # Работающие процессы продолжают читать старый файл через свой mmap
+        os.replace(tmp_path, path)
+
+        return {
+            "records": len(self._records),
+            "strings": len(self._string_offsets),
+            "v4_ranges": len(v4),
+            "v6_ranges": len(v6),
+            "bytes": v6_offset + len(v6_table),
+        }
+
+
+def build_geo_db(inputs: Iterable[str], output: str) -> Dict[str, int]:
+    """Сборка базы из JSON/JSONL файлов с результатами"""
+    builder = GeoDatabaseBuilder()
+    for document in iter_input_documents(inputs):
+        for ip_address, record in extract_records(document):
+            builder.add(ip_address, record)
+    return builder.build(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Сборка локальной базы гео-данных из собранных результатов"
+    )
+    parser.add_argument("inputs", nargs="+", help="JSON/JSONL файлы или шаблоны путей")
+    parser.add_argument("-o", "--output", default="ipgeo.db", help="Файл базы")
+    args = parser.parse_args()
+
+    stats = build_geo_db(args.inputs, args.output)
+    print(f"База сохранена в {args.output}: {stats}")
+
+    # Проверяем, что база открывается
+    with GeoDatabase(args.output) as db:
+        print(f"Записей: {db.record_count}, диапазонов IPv4: {db.v4_count}, IPv6: {db.v6_count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,18 @@
 from huggingface_hub import snapshot_download
-from transformers import AutoTokenizer, AutoModel
+from transformers import AutoTokenizer, AutoModel, AutoModelForSequenceClassification
+import torch
 
+import argparse
 import os
 
+from traffic_capture import capture_features, chunk_rows, iter_capture_chunks
+from traffic_inference import (
+    ONNX_FILE,
+    ONNX_INT8_FILE,
+    compare_classifiers,
+    load_classifier,
+)
+
 def download_model_hub(model_id, local_dir):
     """Скачать модель используя huggingface_hub"""
     
@@ -47,5 +57,123 @@ def test_local_model(model_path):
         print(f"❌ Ошибка тестирования: {e}")
         return False
 
-# Проверить скачанную модель
-test_local_model("./models/deberta-v3-base-full")
\ No newline at end of file
+class LogitsOnly(torch.nn.Module):
+    """Обертка модели для экспорта: позиционные входы, на выходе только логиты"""
+
+    def __init__(self, model, input_names):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+
+    def forward(self, *inputs):
+        return self.model(**dict(zip(self.input_names, inputs))).logits
+
+
+def export_onnx(model_path, output_dir, quantize=True, opset=17):
+    """Экспорт классификатора в ONNX и динамическое квантование в int8
+
+    В output_dir сохраняются model.onnx, model.int8.onnx (при quantize),
+    конфигурация и токенизатор, поэтому каталог загружается
+    traffic_inference.load_classifier(output_dir, backend="onnx") или
+    backend="onnx-int8".
+    """
+    print(f"📦 Экспорт в ONNX: {model_path}")
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForSequenceClassification.from_pretrained(model_path).eval()
+    os.makedirs(output_dir, exist_ok=True)
+
+    sample = tokenizer(
+        ["SRC:10.0.0.1 DST:10.0.0.2 PROTO:TCP", "Test input"],
+        padding=True,
+        return_tensors="pt",
+    )
+    input_names = [
+        name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample
+    ]
+    onnx_path = os.path.join(output_dir, ONNX_FILE)
+    torch.onnx.export(
+        LogitsOnly(model, input_names),
+        tuple(sample[name] for name in input_names),
+        onnx_path,
+        input_names=input_names,
+        output_names=["logits"],
+        dynamic_axes={
+            **{name: {0: "batch", 1: "sequence"} for name in input_names},
+            "logits": {0: "batch"},
+        },
+        opset_version=opset,
+        dynamo=False,
+    )
+    model.config.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    print(f"✅ Модель ONNX: {onnx_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = os.path.join(output_dir, ONNX_INT8_FILE)
+        quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"✅ Квантованная модель: {int8_path}")
+
+
+def check_parity(model_path, candidate_path, csv_path, backend="onnx", rows=512):
+    """Сравнение меток и уверенности варианта модели с исходной моделью PyTorch"""
+    chunk = next(iter_capture_chunks(csv_path, chunk_size=rows))
+    texts = capture_features(chunk_rows(chunk))
+
+    reference = load_classifier(model_path, "eager")
+    candidate = load_classifier(candidate_path, backend)
+    report = compare_classifiers(texts, reference, candidate)
+    if report["label_agreement"] is None:
+        # Все строки с ошибкой хотя бы у одной из моделей
+        print(f"❌ {backend}: нет строк для сверки из {report['rows']}")
+        return report
+    print(
+        f"🔎 {backend}: совпадение меток {report['label_agreement']:.2%} на "
+        f"{report['compared']} строках, разница уверенности до "
+        f"{report['max_score_diff']:.4f} (в среднем {report['mean_score_diff']:.4f})"
+    )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Загрузка, проверка и экспорт модели")
+    commands = parser.add_subparsers(dest="command")
+
+    download_parser = commands.add_parser("download", help="Скачать модель с Hugging Face")
+    download_parser.add_argument("model_id")
+    download_parser.add_argument("local_dir")
+
+    test_parser = commands.add_parser("test", help="Проверить локальную модель")
+    test_parser.add_argument("model_path", nargs="?", default="./models/deberta-v3-base-full")
+
+    export_parser = commands.add_parser("export", help="Экспорт в ONNX и квантование int8")
+    export_parser.add_argument("model_path")
+    export_parser.add_argument("output_dir")
+    export_parser.add_argument("--no-quantize", action="store_true")
+    export_parser.add_argument("--opset", type=int, default=17)
+    export_parser.add_argument(
+        "--check", help="CSV захвата трафика для сверки с исходной моделью"
+    )
+    export_parser.add_argument("--rows", type=int, default=512, help="Строк для сверки")
+
+    args = parser.parse_args()
+    if args.command == "download":
+        download_model_hub(args.model_id, args.local_dir)
+    elif args.command == "export":
+        export_onnx(args.model_path, args.output_dir, not args.no_quantize, args.opset)
+        if args.check:
+            check_parity(args.model_path, args.output_dir, args.check, "onnx", args.rows)
+            if not args.no_quantize:
+                check_parity(
+                    args.model_path, args.output_dir, args.check, "onnx-int8", args.rows
+                )
+            check_parity(args.model_path, args.model_path, args.check, "int8", args.rows)
+    else:
+        # Проверить скачанную модель
+        test_local_model(getattr(args, "model_path", "./models/deberta-v3-base-full"))
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
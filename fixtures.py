@@ -0,0 +1,285 @@
+import base64
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from aiohttp import web
+from playwright.async_api import BrowserContext, Response, Route
+
+from browser_pool import get_browser_pool
+from http_sources import BASE_URLS, add_response_hook, remove_response_hook
+
+# Типы ресурсов браузера, ответы которых сохраняются: без скриптов ipapi.com
+# не заполнит результаты, картинки и шрифты профили и так блокируют
+RECORDED_RESOURCE_TYPES = {"document", "xhr", "fetch", "script"}
+
+# Заголовки, которые не имеют смысла при воспроизведении сохраненного тела
+SKIPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+TEXT_MIME_PREFIXES = ("text/", "application/json", "application/javascript", "application/xml")
+
+
+def _url_key(url: str) -> str:
+    """URL без фрагмента"""
+    return url.split("#", 1)[0]
+
+
+def _path_key(url: str) -> str:
+    """Путь с параметрами запроса без схемы и хоста"""
+    parts = urlsplit(url)
+    return parts.path + ("?" + parts.query if parts.query else "")
+
+
+class FixtureStore:
+    """Сохраненные ответы источников в формате, близком к HAR 1.2
+
+    Для одного URL хранится последний ответ. Список IP, для которых
+    делалась запись, хранится в поле _ips журнала.
+    """
+
+    def __init__(self, ips: Optional[List[str]] = None):
+        self.entries: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.ips: List[str] = list(ips or [])
+        self._by_path: Dict[Tuple[str, str], List[Tuple[str, str]]] = {}
+
+    def add(
+        self,
+        method: str,
+        url: str,
+        status: int,
+        headers: Dict[str, str],
+        body: bytes,
+        mime_type: str = "",
+    ) -> None:
+        """Добавление ответа"""
+        content: Dict[str, Any] = {"size": len(body), "mimeType": mime_type}
+        if mime_type.startswith(TEXT_MIME_PREFIXES):
+            content["text"] = body.decode("utf-8", errors="replace")
+        else:
+            content["text"] = base64.b64encode(body).decode("ascii")
+            content["encoding"] = "base64"
+
+        key = (method.upper(), _url_key(url))
+        self.entries[key] = {
+            "startedDateTime": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+            "time": 0,
+            "request": {"method": key[0], "url": key[1], "headers": [], "queryString": []},
+            "response": {
+                "status": status,
+                "statusText": "",
+                "headers": [
+                    {"name": k, "value": v}
+                    for k, v in headers.items()
+                    if k.lower() not in SKIPPED_HEADERS
+                ],
+                "content": content,
+            },
+        }
+        self._by_path.setdefault((key[0], _path_key(url)), []).append(key)
+
+    def get(self, method: str, url: str) -> Optional[Dict[str, Any]]:
+        """Сохраненный ответ по URL
+
+        Если точного совпадения нет, ищется единственный ответ с тем же путем
+        на любом хосте: так находятся относительные ресурсы страниц,
+        открытых через локальный сервер воспроизведения.
+        """
+        key = (method.upper(), _url_key(url))
+        entry = self.entries.get(key)
+        if entry is None:
+            candidates = self._by_path.get((key[0], _path_key(url)), [])
+            if len(set(candidates)) == 1:
+                entry = self.entries[candidates[0]]
+        return entry
+
+    @staticmethod
+    def body(entry: Dict[str, Any]) -> bytes:
+        """Тело сохраненного ответа"""
+        content = entry["response"]["content"]
+        if content.get("encoding") == "base64":
+            return base64.b64decode(content["text"])
+        return content.get("text", "").encode("utf-8")
+
+    @staticmethod
+    def headers(entry: Dict[str, Any]) -> Dict[str, str]:
+        return {h["name"]: h["value"] for h in entry["response"]["headers"]}
+
+    def save(self, path: str) -> None:
+        """Атомарное сохранение в файл"""
+        document = {
+            "log": {
+                "version": "1.2",
+                "creator": {"name": "ipgeo", "version": "1"},
+                "entries": list(self.entries.values()),
+                "_ips": self.ips,
+            }
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(document, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "FixtureStore":
+        with open(path, "r", encoding="utf-8") as f:
+            log = json.load(f)["log"]
+
+        store = cls(log.get("_ips"))
+        for entry in log["entries"]:
+            request = entry["request"]
+            key = (request["method"].upper(), _url_key(request["url"]))
+            store.entries[key] = entry
+            store._by_path.setdefault((key[0], _path_key(key[1])), []).append(key)
+        return store
+
+
+class FixtureRecorder:
+    """Запись ответов источников: браузерных и загруженных через aiohttp"""
+
+    def __init__(self, store: FixtureStore):
+        self.store = store
+
+    async def _attach(self, context: BrowserContext) -> None:
+        async def on_response(response: Response) -> None:
+            request = response.request
+            if request.resource_type not in RECORDED_RESOURCE_TYPES:
+                return
+            try:
+                body = await response.body()
+            except Exception:
+                # Тело недоступно для перенаправлений и прерванных запросов
+                return
+            headers = await response.all_headers()
+            self.store.add(
+                request.method,
+                response.url,
+                response.status,
+                headers,
+                body,
+                headers.get("content-type", "").split(";")[0],
+            )
+
+        context.on("response", on_response)
+
+    def _on_http_response(self, url: str, status: int, headers: Dict[str, str], text: str) -> None:
+        mime_type = headers.get("Content-Type", "text/html").split(";")[0]
+        self.store.add("GET", url, status, headers, text.encode("utf-8"), mime_type)
+
+    def install(self) -> None:
+        get_browser_pool().add_context_hook(self._attach)
+        add_response_hook(self._on_http_response)
+
+    def uninstall(self) -> None:
+        get_browser_pool().remove_context_hook(self._attach)
+        remove_response_hook(self._on_http_response)
+
+
+class FixtureReplay:
+    """Воспроизведение сохраненных ответов без сети
+
+    Браузер получает ответы через перехват маршрутов контекста, HTTP-путь -
+    через локальный сервер, на который переключаются BASE_URLS. Запросы,
+    которых нет в хранилище, отклоняются (браузер) или получают 404.
+    """
+
+    def __init__(self, store: FixtureStore, host: str = "127.0.0.1", port: int = 0):
+        self.store = store
+        self.host = host
+        self.port = port
+        self.misses = 0
+        self._runner: Optional[web.AppRunner] = None
+        self._original_urls: Dict[str, str] = {}
+        self._schemes: Dict[str, str] = {}
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def original_url(self, url: str, referer: Optional[str] = None) -> str:
+        """Исходный URL для адреса локального сервера: /{хост}/{путь}
+
+        Ресурсы страницы с путем от корня (/static/app.js) приходят без
+        хоста источника: они относятся к хосту страницы из Referer. Без
+        Referer возвращается только путь, и FixtureStore.get ищет ответ
+        по нему.
+        """
+        if not url.startswith(self.base_url + "/"):
+            return url
+        rest = url[len(self.base_url) + 1:]
+        host, _, path = rest.partition("/")
+        if host in self._schemes:
+            return f"{self._schemes[host]}://{host}/{path}"
+
+        if referer:
+            page = urlsplit(self.original_url(referer))
+            if page.netloc in self._schemes:
+                return f"{page.scheme}://{page.netloc}/{rest}"
+        return "/" + rest
+
+    async def _route(self, route: Route) -> None:
+        request = route.request
+        entry = self.store.get(
+            request.method,
+            self.original_url(request.url, request.headers.get("referer")),
+        )
+        if entry is None:
+            self.misses += 1
+            await route.abort()
+            return
+        await route.fulfill(
+            status=entry["response"]["status"],
+            headers=self.store.headers(entry),
+            body=self.store.body(entry),
+        )
+
+    async def _attach(self, context: BrowserContext) -> None:
+        await context.route("**/*", self._route)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        entry = self.store.get(
+            request.method,
+            self.original_url(str(request.url), request.headers.get("Referer")),
+        )
+        if entry is None:
+            self.misses += 1
+            return web.Response(status=404, text="Нет сохраненного ответа")
+        headers = self.store.headers(entry)
+        return web.Response(
+            status=entry["response"]["status"],
+            body=self.store.body(entry),
+            content_type=entry["response"]["content"].get("mimeType") or "text/html",
+            headers={k: v for k, v in headers.items() if k.lower() != "content-type"},
+        )
+
+    async def start(self) -> None:
+        """Запуск сервера и переключение источников на сохраненные ответы"""
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+        self._original_urls = dict(BASE_URLS)
+        for name, url in self._original_urls.items():
+            parts = urlsplit(url)
+            self._schemes[parts.netloc] = parts.scheme
+            BASE_URLS[name] = f"{self.base_url}/{parts.netloc}"
+        get_browser_pool().add_context_hook(self._attach)
+
+    async def stop(self) -> None:
+        BASE_URLS.update(self._original_urls)
+        get_browser_pool().remove_context_hook(self._attach)
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "FixtureReplay":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.stop()
@@ -0,0 +1,231 @@
+"""Локальная бинарная база гео-данных с отображением файла в память
+
+Формат файла (все числа little-endian):
+
+    заголовок      HEADER_FORMAT, начинается с MAGIC
+    строки         для каждой строки: uint16 длина + UTF-8 байты
+    записи         record_count записей фиксированной ширины RECORD_FORMAT:
+                   смещения строк STRING_FIELDS в таблице строк
+                   (NO_STRING - нет значения), затем FLOAT_FIELDS как
+                   float64 (NaN - нет значения) и is_anycast как int8
+                   (-1 - нет значения)
+    диапазоны v4   отсортированные по началу непересекающиеся диапазоны
+                   V4_RANGE_FORMAT: начало, конец, номер записи
+    диапазоны v6   то же для IPv6, V6_RANGE_FORMAT: начало и конец как
+                   пары uint64 (старшая, младшая части), номер записи
+
+Одинаковые строки хранятся один раз, одинаковые записи - тоже, поэтому
+размер файла определяется количеством различных диапазонов.
+"""
+
+import ipaddress
+import math
+import mmap
+import os
+import struct
+from typing import Any, Dict, Optional
+
+from tracing import record_error
+
+MAGIC = b"IPGEODB1"
+FORMAT_VERSION = 1
+
+STRING_FIELDS = (
+    "country",
+    "country_code",
+    "region",
+    "city",
+    "zip_code",
+    "timezone",
+    "isp",
+    "asn",
+    "organization",
+    "asn_organization",
+    "company",
+    "asn_type",
+    "ip_range",
+)
+FLOAT_FIELDS = ("latitude", "longitude")
+
+NO_STRING = 0xFFFFFFFF
+
+# magic, версия, число записей, v4, v6, смещения строк, записей, v4, v6
+HEADER_FORMAT = "<8sIIIIQQQQ"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+RECORD_FORMAT = "<" + "I" * len(STRING_FIELDS) + "d" * len(FLOAT_FIELDS) + "b"
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+V4_RANGE_FORMAT = "<III"
+V4_RANGE_SIZE = struct.calcsize(V4_RANGE_FORMAT)
+V6_RANGE_FORMAT = "<QQQQI"
+V6_RANGE_SIZE = struct.calcsize(V6_RANGE_FORMAT)
+
+_U64 = (1 << 64) - 1
+
+
+class GeoDatabase:
+    """Чтение локальной базы гео-данных через mmap
+
+    Поиск - двоичный поиск по таблице диапазонов прямо в отображенном файле:
+    не больше 32 шагов для IPv4 и 128 для IPv6, без загрузки базы в память.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Пустой файл отобразить нельзя
+            self._file.close()
+            raise ValueError(f"{path}: файл не является базой гео-данных")
+        if len(self._mm) < HEADER_SIZE:
+            self.close()
+            raise ValueError(f"{path}: файл не является базой гео-данных")
+
+        (
+            magic,
+            version,
+            self.record_count,
+            self.v4_count,
+            self.v6_count,
+            self._strings_offset,
+            self._records_offset,
+            self._v4_offset,
+            self._v6_offset,
+        ) = struct.unpack_from(HEADER_FORMAT, self._mm, 0)
+
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path}: файл не является базой гео-данных")
+        if version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path}: неподдерживаемая версия формата {version}")
+        if (
+            self._v4_offset + self.v4_count * V4_RANGE_SIZE > self._v6_offset
+            or self._v6_offset + self.v6_count * V6_RANGE_SIZE > len(self._mm)
+            or self._records_offset + self.record_count * RECORD_SIZE > self._v4_offset
+        ):
+            self.close()
+            raise ValueError(f"{path}: файл базы обрезан или поврежден")
+
+        self._record_struct = struct.Struct(RECORD_FORMAT)
+        self._v4_struct = struct.Struct(V4_RANGE_FORMAT)
+        self._v6_struct = struct.Struct(V6_RANGE_FORMAT)
+
+    def close(self) -> None:
+        """Закрытие отображения и файла"""
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self) -> "GeoDatabase":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _string(self, offset: int) -> Optional[str]:
+        """Строка из таблицы строк по смещению"""
+        if offset == NO_STRING:
+            return None
+        position = self._strings_offset + offset
+        (length,) = struct.unpack_from("<H", self._mm, position)
+        return self._mm[position + 2 : position + 2 + length].decode("utf-8")
+
+    def record(self, index: int) -> Dict[str, Any]:
+        """Декодирование записи по номеру"""
+        values = self._record_struct.unpack_from(
+            self._mm, self._records_offset + index * RECORD_SIZE
+        )
+
+        data: Dict[str, Any] = {}
+        for name, offset in zip(STRING_FIELDS, values):
+            if offset != NO_STRING:
+                data[name] = self._string(offset)
+
+        floats = values[len(STRING_FIELDS) : len(STRING_FIELDS) + len(FLOAT_FIELDS)]
+        for name, value in zip(FLOAT_FIELDS, floats):
+            if not math.isnan(value):
+                data[name] = value
+
+        if values[-1] >= 0:
+            data["is_anycast"] = bool(values[-1])
+        return data
+
+    def _find_v4(self, value: int) -> Optional[int]:
+        """Номер записи диапазона IPv4, содержащего адрес"""
+        unpack = self._v4_struct.unpack_from
+        base = self._v4_offset
+        lo, hi = 0, self.v4_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start, end, index = unpack(self._mm, base + mid * V4_RANGE_SIZE)
+            if value < start:
+                hi = mid
+            elif value > end:
+                lo = mid + 1
+            else:
+                return index
+        return None
+
+    def _find_v6(self, value: int) -> Optional[int]:
+        """Номер записи диапазона IPv6, содержащего адрес"""
+        unpack = self._v6_struct.unpack_from
+        base = self._v6_offset
+        key = (value >> 64, value & _U64)
+        lo, hi = 0, self.v6_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start_hi, start_lo, end_hi, end_lo, index = unpack(
+                self._mm, base + mid * V6_RANGE_SIZE
+            )
+            if key < (start_hi, start_lo):
+                hi = mid
+            elif key > (end_hi, end_lo):
+                lo = mid + 1
+            else:
+                return index
+        return None
+
+    def lookup(self, ip_address: str) -> Optional[Dict[str, Any]]:
+        """Данные диапазона, содержащего адрес, или None"""
+        try:
+            address = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return None
+
+        if address.version == 4:
+            index = self._find_v4(int(address))
+        else:
+            index = self._find_v6(int(address))
+        return self.record(index) if index is not None else None
+
+
+DEFAULT_GEO_DB_PATH = os.environ.get("IPGEO_DB", "ipgeo.db")
+
+_default_db: Optional[GeoDatabase] = None
+_default_db_path: Optional[str] = DEFAULT_GEO_DB_PATH
+
+
+def configure_geo_database(path: Optional[str]) -> Optional[GeoDatabase]:
+    """Смена файла локальной базы, path=None отключает источник"""
+    global _default_db, _default_db_path
+    if _default_db is not None:
+        _default_db.close()
+    _default_db = None
+    _default_db_path = path
+    return get_geo_database()
+
+
+def get_geo_database() -> Optional[GeoDatabase]:
+    """Общая локальная база или None, если файла нет или он поврежден
+
+    Поврежденный файл отключает источник до следующего configure_geo_database.
+    """
+    global _default_db, _default_db_path
+    if _default_db is None and _default_db_path and os.path.exists(_default_db_path):
+        try:
+            _default_db = GeoDatabase(_default_db_path)
+        except ValueError as e:
+            record_error("geo_db", e)
+            _default_db_path = None
+    return _default_db
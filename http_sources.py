@@ -0,0 +1,298 @@
+import aiohttp
+import asyncio
+from html.parser import HTMLParser
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from ip_parsers import (
+    THREAT_COLUMNS,
+    parse_geo_rows,
+    parse_ipinfo_rows,
+    parse_network_rows,
+    parse_osm_coordinates,
+    parse_threat_flags,
+)
+from tracing import span
+
+# Базовые адреса источников (и для HTTP, и для браузера), для тестов
+# заменяются адресом локального сервера
+BASE_URLS = {
+    "ipapi.com": "https://ipapi.com",
+    "ipinfo.io": "https://ipinfo.io",
+    "db-ip.com": "https://db-ip.com",
+    "whatismyipaddress.com": "https://whatismyipaddress.com",
+}
+
+DEFAULT_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36"
+    ),
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+}
+
+
+class Element:
+    """Элемент упрощенного DOM-дерева"""
+
+    __slots__ = ("tag", "attrs", "children", "parent")
+
+    def __init__(self, tag: str, attrs: Dict[str, str], parent: Optional["Element"]):
+        self.tag = tag
+        self.attrs = attrs
+        self.children: List = []
+        self.parent = parent
+
+    @property
+    def classes(self) -> set:
+        return set(self.attrs.get("class", "").split())
+
+    def text_content(self) -> str:
+        """Текст элемента со всеми вложенными элементами"""
+        parts = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                parts.append(node)
+            elif node.tag not in ("script", "style"):
+                stack.extend(reversed(node.children))
+        return "".join(parts)
+
+    def iter(self) -> Iterator["Element"]:
+        """Обход всех вложенных элементов в порядке документа"""
+        stack = list(reversed([c for c in self.children if isinstance(c, Element)]))
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed([c for c in node.children if isinstance(c, Element)]))
+
+    def find_all(self, tag: Optional[str] = None, classes: Tuple[str, ...] = ()) -> List["Element"]:
+        """Поиск вложенных элементов по тегу и набору классов"""
+        wanted = set(classes)
+        return [
+            node
+            for node in self.iter()
+            if (tag is None or node.tag == tag) and wanted <= node.classes
+        ]
+
+    def find(self, tag: Optional[str] = None, classes: Tuple[str, ...] = ()) -> Optional["Element"]:
+        """Первый вложенный элемент по тегу и набору классов"""
+        wanted = set(classes)
+        for node in self.iter():
+            if (tag is None or node.tag == tag) and wanted <= node.classes:
+                return node
+        return None
+
+    def element_children(self) -> Iterator[Tuple[int, "Element"]]:
+        """Дочерние элементы с номером, начиная с 1 (nth-child)"""
+        return enumerate((c for c in self.children if isinstance(c, Element)), 1)
+
+
+class TreeBuilder(HTMLParser):
+    """Построение упрощенного DOM-дерева с неявным закрытием ячеек таблиц"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Element("#document", {}, None)
+        self._stack = [self.root]
+
+    def _close_until(self, tags: set, stop: set) -> None:
+        """Закрытие открытых элементов tags, не выходя за пределы stop"""
+        for i in range(len(self._stack) - 1, 0, -1):
+            tag = self._stack[i].tag
+            if tag in stop:
+                return
+            if tag in tags:
+                del self._stack[i:]
+                return
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("td", "th"):
+            self._close_until({"td", "th"}, {"tr", "table"})
+        elif tag == "tr":
+            self._close_until({"tr"}, {"table", "tbody", "thead"})
+
+        element = Element(tag, {k: v or "" for k, v in attrs}, self._stack[-1])
+        self._stack[-1].children.append(element)
+        if tag not in VOID_TAGS:
+            self._stack.append(element)
+
+    def handle_startendtag(self, tag, attrs):
+        element = Element(tag, {k: v or "" for k, v in attrs}, self._stack[-1])
+        self._stack[-1].children.append(element)
+
+    def handle_endtag(self, tag):
+        for i in range(len(self._stack) - 1, 0, -1):
+            if self._stack[i].tag == tag:
+                del self._stack[i:]
+                return
+
+    def handle_data(self, data):
+        self._stack[-1].children.append(data)
+
+
+def parse_html(html: str) -> Element:
+    """Разбор HTML в упрощенное DOM-дерево"""
+    builder = TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.root
+
+
+def extract_ipinfo(document: Element) -> Dict:
+    """Извлечение полей ipinfo.io из HTML, аналог get_ipinfo_data"""
+    rows = []
+    for tbody in document.find_all("tbody"):
+        for row in tbody.find_all("tr"):
+            cells = row.find_all("td")
+            if not cells:
+                continue
+            value_elem = cells[-1]
+            email = None
+            for link in value_elem.find_all("a"):
+                if link.attrs.get("href", "").startswith("mailto:"):
+                    email = link.text_content()
+                    break
+            rows.append((cells[0].text_content(), value_elem.text_content(), email))
+    return parse_ipinfo_rows(rows)
+
+
+def _header_rows(container: Element) -> List[Tuple[str, str]]:
+    """Пары (th, td) из строк таблиц контейнера"""
+    rows = []
+    for table in container.find_all("table"):
+        for row in table.find_all("tr"):
+            th = row.find("th")
+            td = row.find("td")
+            if th is not None and td is not None:
+                rows.append((th.text_content(), td.text_content()))
+    return rows
+
+
+def extract_dbip(document: Element) -> Dict:
+    """Извлечение полей db-ip.com из HTML, аналог get_dbip_data"""
+    data = {}
+    blocks = document.find_all(classes=("menu", "results", "shadow"))
+    if not blocks:
+        raise ValueError("Таблицы db-ip.com не найдены на странице")
+
+    # Первая таблица - сетевые данные, третья - географические
+    data.update(parse_network_rows(_header_rows(blocks[0])))
+
+    badge = document.find(classes=("label", "badge-success"))
+    safe_columns = set()
+    threat_columns = set(THREAT_COLUMNS.values())
+    # Номера ячеек считаются одним проходом по строке
+    for row in document.find_all("tr"):
+        for column, cell in row.element_children():
+            if (
+                cell.tag == "td"
+                and column in threat_columns
+                and cell.find(classes=("fa-times", "text-success"))
+            ):
+                safe_columns.add(column)
+    data.update(parse_threat_flags(badge.text_content() if badge else None, safe_columns))
+
+    if len(blocks) >= 3:
+        data.update(parse_geo_rows(_header_rows(blocks[2])))
+
+    for iframe in document.find_all("iframe"):
+        src = iframe.attrs.get("data-src") or iframe.attrs.get("src")
+        if src and "openstreetmap" in src:
+            coordinates = parse_osm_coordinates(src)
+            if coordinates:
+                data["latitude"], data["longitude"] = coordinates
+            break
+
+    return data
+
+
+_session: Optional[aiohttp.ClientSession] = None
+_session_limit = 32
+
+# Обработчики полученных ответов (url, статус, заголовки, текст), например запись фикстур
+_response_hooks: List[Callable[[str, int, Dict[str, str], str], None]] = []
+
+
+def add_response_hook(hook: Callable[[str, int, Dict[str, str], str], None]) -> None:
+    """Подписка на ответы, загруженные через fetch_html"""
+    _response_hooks.append(hook)
+
+
+def remove_response_hook(hook: Callable[[str, int, Dict[str, str], str], None]) -> None:
+    _response_hooks.remove(hook)
+
+
+def configure_http_sources(
+    base_urls: Optional[Dict[str, str]] = None, connection_limit: Optional[int] = None
+) -> None:
+    """Смена базовых адресов источников и размера пула соединений"""
+    global _session_limit
+    if base_urls:
+        BASE_URLS.update(base_urls)
+    if connection_limit:
+        _session_limit = connection_limit
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Общая сессия aiohttp с пулом keep-alive соединений"""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=_session_limit, limit_per_host=_session_limit, keepalive_timeout=60
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            headers=DEFAULT_HEADERS,
+            timeout=aiohttp.ClientTimeout(total=15, connect=5),
+        )
+    return _session
+
+
+async def close_http_session() -> None:
+    """Закрытие общей сессии aiohttp"""
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+async def fetch_html(url: str) -> str:
+    """Загрузка страницы через общую сессию"""
+    async with get_http_session().get(url) as response:
+        text = await response.text()
+        for hook in _response_hooks:
+            hook(url, response.status, dict(response.headers), text)
+        response.raise_for_status()
+        return text
+
+
+async def get_ipinfo_data_http(ip_address: str) -> Dict:
+    """Получение данных с ipinfo.io без браузера"""
+    try:
+        with span("http.fetch", source="ipinfo.io"):
+            html = await fetch_html(f"{BASE_URLS['ipinfo.io']}/{ip_address}")
+        with span("html.extract", source="ipinfo.io"):
+            data = extract_ipinfo(parse_html(html))
+        if not data:
+            raise ValueError("Таблица ipinfo.io не найдена на странице")
+        return data
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        return {"source": "ipinfo.io", "error": str(e) or type(e).__name__}
+
+
+async def get_dbip_data_http(ip_address: str) -> Dict:
+    """Получение данных с db-ip.com без браузера"""
+    try:
+        with span("http.fetch", source="db-ip.com"):
+            html = await fetch_html(f"{BASE_URLS['db-ip.com']}/{ip_address}")
+        with span("html.extract", source="db-ip.com"):
+            return extract_dbip(parse_html(html))
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        return {"source": "db-ip.com", "error": str(e) or type(e).__name__}
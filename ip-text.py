@@ -1,51 +1,126 @@
-from playwright.async_api import async_playwright, Playwright
 import asyncio
 import time
-from typing import Dict, List, Any, Optional
-from dataclasses import dataclass
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 import json
 
+from browser_pool import close_browser_pool, get_browser_pool
+from scrape_profile import get_profile
+from geo_db import get_geo_database
+from http_sources import (
+    BASE_URLS,
+    close_http_session,
+    get_dbip_data_http,
+    get_ipinfo_data_http,
+)
+from ip_parsers import (
+    THREAT_COLUMNS,
+    parse_geo_rows,
+    parse_ipinfo_rows,
+    parse_network_rows,
+    parse_osm_coordinates,
+    parse_threat_flags,
+)
+from lookup_cache import cached_source, get_lookup_cache
+from memo_cache import MemoCache
+from output_sinks import OutputSink
+from range_index import RangeIndex
+from resilience import CircuitOpenError, SourceTimeoutError, SourceUnavailableError, get_guard
+from unified_data import FIELD_NAMES, UnifiedIPData
+from source_registry import (
+    FieldMapping,
+    SourceRegistry,
+    SourceSpec,
+    coordinate,
+    to_float,
+    to_int,
+)
+from tracing import count, record_error, span
+
+
+# Извлечение таблиц db-ip.com за один вызов: строки (th, td) сетевой и
+# географической таблиц, уровень угрозы, колонки без угроз и адрес карты
+DBIP_EXTRACT_JS = """
+(threatColumns) => {
+    const headerRows = (root) => root ? Array.from(root.querySelectorAll('table tr'))
+        .map((tr) => [tr.querySelector('th'), tr.querySelector('td')])
+        .filter(([th, td]) => th && td)
+        .map(([th, td]) => [th.textContent, td.textContent]) : [];
+
+    const network = Array.from(
+        document.querySelectorAll('.menu.results.shadow:first-child table tr')
+    )
+        .map((tr) => [tr.querySelector('th'), tr.querySelector('td')])
+        .filter(([th, td]) => th && td)
+        .map(([th, td]) => [th.textContent, td.textContent]);
+
+    const blocks = document.querySelectorAll('.menu.results.shadow');
+    const badge = document.querySelector('.label.badge-success');
+    const iframe = document.querySelector('iframe[data-src*="openstreetmap"]');
+
+    return {
+        network: network,
+        geo: blocks.length >= 3 ? headerRows(blocks[2]) : [],
+        threat_level: badge ? badge.textContent : null,
+        safe_columns: threatColumns.filter((n) =>
+            document.querySelector(`td:nth-child(${n}) .fa-times.text-success`)
+        ),
+        iframe_src: iframe
+            ? iframe.getAttribute('data-src') || iframe.getAttribute('src')
+            : null,
+    };
+}
+"""
+
+# Строки таблицы ipinfo.io: (первая ячейка, последняя ячейка, email из mailto)
+IPINFO_EXTRACT_JS = """
+() => Array.from(document.querySelectorAll('tbody tr'))
+    .map((tr) => [tr.querySelector('td:first-child'), tr.querySelector('td:last-child')])
+    .filter(([name, value]) => name && value)
+    .map(([name, value]) => {
+        const email = value.querySelector('a[href^="mailto:"]');
+        return [name.textContent, value.textContent, email ? email.textContent : null];
+    })
+"""
+
+# Виджет ipapi.com сначала показывает данные посетителя: ждем, пока поле ip
+# виджета покажет запрошенный адрес (широта может совпасть с посетителем)
+IPAPI_RESULT_READY_JS = """
+(ip) => {
+    const shown = document.querySelector('[data-demo-fill="ip"]');
+    const latitude = document.querySelector('[data-demo-fill="latitude"]');
+    return !!shown && !!latitude
+        && shown.textContent.trim().toLowerCase() === ip.toLowerCase()
+        && latitude.textContent.trim() !== '';
+}
+"""
+
+# Значения полей демо-виджета ipapi.com по атрибуту data-demo-fill
+IPAPI_EXTRACT_JS = """
+(fields) => Object.fromEntries(fields.map((field) => {
+    const element = document.querySelector(`[data-demo-fill="${field}"]`);
+    return [field, element ? element.textContent : null];
+}))
+"""
+
+
+async def extract_dbip_page(page) -> Dict[str, Any]:
+    """Все данные страницы db-ip.com одним вызовом в браузер"""
+    with span("page.extract", source="db-ip.com"):
+        return await page.evaluate(DBIP_EXTRACT_JS, list(THREAT_COLUMNS.values()))
 
-@dataclass
-class UnifiedIPData:
-    """Унифицированная структура данных IP"""
-
-    ip_address: str
-    source: str
-    country: Optional[str] = None
-    country_code: Optional[str] = None
-    region: Optional[str] = None
-    city: Optional[str] = None
-    zip_code: Optional[str] = None
-    latitude: Optional[float] = None
-    longitude: Optional[float] = None
-    isp: Optional[str] = None
-    asn: Optional[str] = None
-    organization: Optional[str] = None
-    asn_organization: Optional[str] = None
-    hostname: Optional[str] = None
-    ip_range: Optional[str] = None
-    company: Optional[str] = None
-    hosted_domains_count: Optional[int] = None
-    is_private: Optional[bool] = None
-    is_anycast: Optional[bool] = None
-    asn_type: Optional[str] = None
-    district: Optional[str] = None
-    abuse_email: Optional[str] = None
-    timezone: Optional[str] = None
-    error: Optional[str] = None
-
-    def to_dict(self) -> Dict[str, Any]:
-        """Преобразование в словарь"""
-        return {
-            k: v
-            for k, v in self.__dict__.items()
-            if v is not None or k in ["ip_address", "source"]
-        }
-
-    def to_json(self) -> str:
-        """Преобразование в JSON"""
-        return json.dumps(self.to_dict(), indent=2, ensure_ascii=False)
 
 async def parse_ip_data(page) -> Dict[str, Any]:
     """Парсинг данных с IP-информацией"""
@@ -53,633 +128,684 @@ async def parse_ip_data(page) -> Dict[str, Any]:
     
     try:
         # Ждем загрузки основных таблиц
-        await page.wait_for_selector('.menu.results.shadow table', timeout=10000)
-        
-        # Парсим первую таблицу (сетевые данные)
-        network_data = await parse_network_table(page)
-        data.update(network_data)
-        
-        # Парсим вторую таблицу (угрозы)
-        threat_data = await parse_threat_table(page)
-        data.update(threat_data)
-        
-        # Парсим третью таблицу (географические данные)
-        geo_data = await parse_geo_table(page)
-        data.update(geo_data)
-        
-        # Парсим координаты из iframe
-        coordinates = await parse_coordinates_from_iframe(page)
+        with span("page.wait", source="db-ip.com"):
+            await page.wait_for_selector('.menu.results.shadow table', state='attached')
+
+        extracted = await extract_dbip_page(page)
+
+        # Первая таблица - сетевые данные, вторая - угрозы, третья - гео
+        data.update(parse_network_rows(extracted['network']))
+        data.update(
+            parse_threat_flags(extracted['threat_level'], set(extracted['safe_columns']))
+        )
+        data.update(parse_geo_rows(extracted['geo']))
+
+        # Координаты из iframe
+        coordinates = parse_osm_coordinates(extracted['iframe_src'])
         if coordinates:
             data['latitude'], data['longitude'] = coordinates
         
     except Exception as e:
-        print(f"Ошибка при парсинге: {e}")
+        record_error("parse", e, source="db-ip.com")
     
     return data
 
 async def parse_network_table(page) -> Dict[str, Any]:
     """Парсинг первой таблицы с сетевыми данными"""
-    data = {}
-    
     try:
-        # Получаем все строки первой таблицы
-        rows = await page.query_selector_all('.menu.results.shadow:first-child table tr')
-        
-        for row in rows:
-            try:
-                th = await row.query_selector('th')
-                td = await row.query_selector('td')
-                
-                if th and td:
-                    key = await th.text_content()
-                    value = await td.text_content()
-                    
-                    key = key.strip().lower().replace(' ', '_')
-                    value = value.strip()
-                    
-                    # Обрабатываем специальные случаи
-                    if key == 'asn':
-                        # Извлекаем номер ASN и название
-                        asn_parts = value.split(' - ')
-                        if len(asn_parts) > 1:
-                            data['asn_number'] = asn_parts[0].strip()
-                            data['asn_organization'] = asn_parts[1].strip()
-                        else:
-                            data['asn'] = value
-                    elif key == 'hostname':
-                        data['hostname'] = value
-                    elif key == 'isp':
-                        data['isp'] = value
-                    elif key == 'connection':
-                        data['connection_type'] = value
-                    elif key == 'organization':
-                        data['organization'] = value
-                    elif key == 'address_type':
-                        data['ip_version'] = value.replace('&nbsp;', ' ').strip()
-                        
-            except Exception as e:
-                print(f"Ошибка парсинга строки сети: {e}")
-                continue
-                
+        extracted = await extract_dbip_page(page)
+        return parse_network_rows(extracted['network'])
     except Exception as e:
-        print(f"Ошибка парсинга сетевой таблицы: {e}")
-    
-    return data
+        record_error("parse", e, source="db-ip.com")
+        return {}
 
 async def parse_threat_table(page) -> Dict[str, Any]:
     """Парсинг таблицы с информацией об угрозах"""
-    data = {}
-    
     try:
-        # Уровень угрозы
-        threat_level_elem = await page.query_selector('.label.badge-success')
-        if threat_level_elem:
-            data['threat_level'] = await threat_level_elem.text_content()
-        
-        # Проверяем статусы угроз
-        threat_selectors = {
-            'is_crawler': 'td:nth-child(1) .fa-times.text-success',
-            'is_proxy': 'td:nth-child(2) .fa-times.text-success',
-            'is_attack_source': 'td:nth-child(3) .fa-times.text-success'
-        }
-        
-        for key, selector in threat_selectors.items():
-            element = await page.query_selector(selector)
-            data[key] = element is not None  # True если элемент найден (значит "нет" угрозы)
-            
+        extracted = await extract_dbip_page(page)
+        return parse_threat_flags(extracted['threat_level'], set(extracted['safe_columns']))
     except Exception as e:
-        print(f"Ошибка парсинга таблицы угроз: {e}")
-    
-    return data
+        record_error("parse", e, source="db-ip.com")
+        return {}
 
 async def parse_geo_table(page) -> Dict[str, Any]:
     """Парсинг географической таблицы"""
-    data = {}
-    
     try:
-        # Получаем все строки географической таблицы (вторая таблица с shadow)
-        geo_tables = await page.query_selector_all('.menu.results.shadow')
-        if len(geo_tables) >= 3:
-            geo_table = geo_tables[2]  # Третья таблица
-            rows = await geo_table.query_selector_all('table tr')
-            
-            for row in rows:
-                try:
-                    th = await row.query_selector('th')
-                    td = await row.query_selector('td')
-                    
-                    if th and td:
-                        key = await th.text_content()
-                        value = await td.text_content()
-                        
-                        key = key.strip().lower().replace(' ', '_')
-                        value = value.strip()
-                        
-                        # Обрабатываем специальные случаи
-                        if key == 'country':
-                            # Извлекаем только название страны (без флага)
-                            country_parts = value.split('\n')
-                            data['country'] = country_parts[0].strip()
-                        elif key == 'state_/_region':
-                            # Берем только английское название
-                            state_parts = value.split('\n')
-                            data['region'] = state_parts[0].strip()
-                        elif key == 'district_/_county':
-                            county_parts = value.split('\n')
-                            data['county'] = county_parts[0].strip()
-                        elif key == 'city':
-                            city_parts = value.split('\n')
-                            data['city'] = city_parts[0].strip()
-                        elif key == 'zip_/_postal_code':
-                            data['postal_code'] = value
-                        elif key == 'coordinates':
-                            data['coordinates'] = value
-                        elif key == 'timezone':
-                            data['timezone'] = value.split('(')[0].strip()
-                        elif key == 'local_time':
-                            data['local_time'] = value
-                        elif key == 'languages':
-                            data['languages'] = value
-                        elif key == 'currency':
-                            data['currency'] = value
-                        elif key == 'weather_station':
-                            data['weather_station'] = value
-                            
-                except Exception as e:
-                    print(f"Ошибка парсинга строки гео: {e}")
-                    continue
-                    
+        extracted = await extract_dbip_page(page)
+        return parse_geo_rows(extracted['geo'])
     except Exception as e:
-        print(f"Ошибка парсинга географической таблицы: {e}")
-    
-    return data
+        record_error("parse", e, source="db-ip.com")
+        return {}
 
 async def parse_coordinates_from_iframe(page) -> Optional[tuple]:
     """Парсинг координат из iframe"""
     try:
-        iframe = await page.query_selector('iframe[data-src*="openstreetmap"]')
-        if iframe:
-            src = await iframe.get_attribute('data-src') or await iframe.get_attribute('src')
-            if src and 'marker=' in src:
-                # Извлекаем координаты из URL
-                marker_part = src.split('marker=')[1]
-                coords = marker_part.split('&')[0].split(',')
-                if len(coords) == 2:
-                    return float(coords[0]), float(coords[1])
+        extracted = await extract_dbip_page(page)
+        return parse_osm_coordinates(extracted['iframe_src'])
     except Exception as e:
-        print(f"Ошибка парсинга координат из iframe: {e}")
+        record_error("parse", e, source="db-ip.com")
     
     return None
 
-def transform_ipapi_data(ipapi_data: Dict[str, Any], ip_address: str) -> UnifiedIPData:
-    """Преобразование данных из ipapi.com"""
-    if "error" in ipapi_data:
-        return UnifiedIPData(
-            ip_address=ip_address, source="ipapi.com", error=ipapi_data["error"]
-        )
-
-    # Преобразуем координаты в числа
-    lat = None
-    lon = None
-    try:
-        if "latitude" in ipapi_data and ipapi_data["latitude"]:
-            lat = float(ipapi_data["latitude"])
-        if "longitude" in ipapi_data and ipapi_data["longitude"]:
-            lon = float(ipapi_data["longitude"])
-    except (ValueError, TypeError):
-        pass
-
-    return UnifiedIPData(
-        ip_address=ip_address,
-        source="ipapi.com",
-        country=ipapi_data.get("country"),
-        city=ipapi_data.get("city"),
-        zip_code=ipapi_data.get("zip"),
-        latitude=lat,
-        longitude=lon,
-        isp=ipapi_data.get("isp"),
-        asn=ipapi_data.get("asn"),
-    )
-
-
-def transform_ipinfo_data(
-    ipinfo_data: Dict[str, Any], ip_address: str
-) -> UnifiedIPData:
-    """Преобразование данных из ipinfo.io"""
-    if "error" in ipinfo_data:
-        return UnifiedIPData(
-            ip_address=ip_address, source="ipinfo.io", error=ipinfo_data["error"]
-        )
-    print(ipinfo_data)
-    # Преобразуем количество доменов в число
-
-    lon = None
-    lat = None
-
-    domains_count = None
-    try:
-        if (
-            "hosted_domains_count" in ipinfo_data
-            and ipinfo_data["hosted_domains_count"]
-        ):
-            domains_count = int(ipinfo_data["hosted_domains_count"])
-    except (ValueError, TypeError):
-        pass
-
-    try:
-        if "coordinates" in ipinfo_data and ipinfo_data["coordinates"]:
-            coords = ipinfo_data["coordinates"].split(",")
-            if len(coords) >= 2:
-                lat = float(coords[0].strip())
-                lon = float(coords[1].strip())
-    except (ValueError, TypeError, AttributeError) as e:
-        print(f"Ошибка обработки координат: {e}")
-        pass
-
-    return UnifiedIPData(
-        ip_address=ip_address,
-        source="ipinfo.io",
-        asn=ipinfo_data.get("asn_number"),
-        asn_organization=ipinfo_data.get("asn_organization"),
-        hostname=ipinfo_data.get("hostname"),
-        ip_range=ipinfo_data.get("ip_range"),
-        company=ipinfo_data.get("company"),
-        hosted_domains_count=domains_count,
-        is_private=ipinfo_data.get("is_private"),
-        is_anycast=ipinfo_data.get("is_anycast"),
-        asn_type=ipinfo_data.get("asn_type"),
-        abuse_email=ipinfo_data.get("abuse_email"),
-        latitude=lat,
-        longitude=lon,
-    )
-
-
-def transform_db_ip_data(
-    ipinfo_data: Dict[str, Any], ip_address: str
-) -> UnifiedIPData:
-    """Преобразование данных из ipinfo.io"""
-    if "error" in ipinfo_data:
-        return UnifiedIPData(
-            ip_address=ip_address, source="db-ip.com", error=ipinfo_data["error"]
-        )
-    print(ipinfo_data)
-    # Преобразуем количество доменов в число
-
-    lon = None
-    lat = None
-
-    domains_count = None
-    try:
-        if (
-            "hosted_domains_count" in ipinfo_data
-            and ipinfo_data["hosted_domains_count"]
-        ):
-            domains_count = int(ipinfo_data["hosted_domains_count"])
-    except (ValueError, TypeError):
-        pass
-
-    try:
-        if "coordinates" in ipinfo_data and ipinfo_data["coordinates"]:
-            coords = ipinfo_data["coordinates"].split(",")
-            if len(coords) >= 2:
-                lat = float(coords[0].strip())
-                lon = float(coords[1].strip())
-    except (ValueError, TypeError, AttributeError) as e:
-        print(f"Ошибка обработки координат: {e}")
-        pass
-
-    return UnifiedIPData(
-        ip_address=ip_address,
-        source="db-ip.com",
-        asn=ipinfo_data.get("asn_number"),
-        asn_organization=ipinfo_data.get("asn_organization"),
-        hostname=ipinfo_data.get("hostname"),
-        ip_range=ipinfo_data.get("ip_range"),
-        organization=ipinfo_data.get("organization"),
-        country = ipinfo_data.get("country"),
-        region = ipinfo_data.get("region"),
-        company=ipinfo_data.get("isp"),
-        city=ipinfo_data.get("city"),
-        isp=ipinfo_data.get("isp"),
-        zip_code = ipinfo_data.get("zip"),
-        district=ipinfo_data.get("country"),
-        hosted_domains_count=domains_count,
-        is_private=ipinfo_data.get("is_private"),
-        is_anycast=ipinfo_data.get("is_anycast"),
-        asn_type=ipinfo_data.get("asn_type"),
-        abuse_email=ipinfo_data.get("abuse_email"),
-        latitude=lat,
-        longitude=lon,
-    )
-
-
-def merge_ip_data(
-    ipapi_data: UnifiedIPData, ipinfo_data: UnifiedIPData, dbip_data: UnifiedIPData
-) -> UnifiedIPData:
-    """Объединение данных из трех источников"""
-    merged = UnifiedIPData(
-        ip_address=ipapi_data.ip_address or ipinfo_data.ip_address or dbip_data.ip_address,
-        source="combined",
-        error=ipapi_data.error or ipinfo_data.error or dbip_data.error,
-    )
-
-    # Все поля через or с тремя источниками
-    merged.country = ipapi_data.country or ipinfo_data.country or dbip_data.country
-    merged.country_code = ipapi_data.country_code or ipinfo_data.country_code or dbip_data.country_code
-    merged.region = ipapi_data.region or ipinfo_data.region or dbip_data.region
-    merged.city = ipapi_data.city or ipinfo_data.city or dbip_data.city
-    merged.zip_code = ipapi_data.zip_code or ipinfo_data.zip_code or dbip_data.zip_code
-    merged.latitude = ipapi_data.latitude or ipinfo_data.latitude or dbip_data.latitude
-    merged.longitude = ipapi_data.longitude or ipinfo_data.longitude or dbip_data.longitude
-    merged.isp = ipapi_data.isp or ipinfo_data.isp or dbip_data.isp
-    merged.asn = ipapi_data.asn or ipinfo_data.asn or dbip_data.asn
-    merged.asn_organization = ipapi_data.asn_organization or ipinfo_data.asn_organization or dbip_data.asn_organization
-    merged.hostname = ipapi_data.hostname or ipinfo_data.hostname or dbip_data.hostname
-    merged.ip_range = ipapi_data.ip_range or ipinfo_data.ip_range or dbip_data.ip_range
-    merged.company = ipapi_data.company or ipinfo_data.company or dbip_data.company
-    merged.hosted_domains_count = ipapi_data.hosted_domains_count or ipinfo_data.hosted_domains_count or dbip_data.hosted_domains_count
-    merged.is_private = ipinfo_data.is_private if ipinfo_data.is_private is not None else dbip_data.is_private if dbip_data.is_private is not None else ipapi_data.is_private
-    merged.is_anycast = ipinfo_data.is_anycast if ipinfo_data.is_anycast is not None else dbip_data.is_anycast if dbip_data.is_anycast is not None else ipapi_data.is_anycast
-    merged.asn_type = ipapi_data.asn_type or ipinfo_data.asn_type or dbip_data.asn_type
-    merged.abuse_email = ipapi_data.abuse_email or ipinfo_data.abuse_email or dbip_data.abuse_email
-    merged.timezone = ipapi_data.timezone or ipinfo_data.timezone or dbip_data.timezone
-
-    return merged
-
-
+@cached_source("ipapi.com")
 async def get_ipapi_data(ip_address: str) -> Dict:
     """Получение данных с ipapi.com"""
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(channel="chrome", headless=False)
-        device = p.devices["Desktop Firefox"]
-        page = await browser.new_page(**device)
-
-        try:
-            await page.goto("https://ipapi.com/")
-            await page.wait_for_selector('input[name="ip_to_lookup"]', timeout=10000)
+    profile = get_profile("ipapi.com")
+    try:
+        async with get_browser_pool().page(profile=profile) as page:
+            with span("page.goto", source="ipapi.com"):
+                await page.goto(f"{BASE_URLS['ipapi.com']}/", wait_until=profile.wait_until)
+            with span("page.wait", source="ipapi.com"):
+                await page.wait_for_selector('input[name="ip_to_lookup"]')
 
-            input_ip_to_lookup = page.locator('input[name="ip_to_lookup"]')
-            await input_ip_to_lookup.clear()
-            await input_ip_to_lookup.type(ip_address, delay=200)
-            await input_ip_to_lookup.press("Enter")
+            with span("page.submit", source="ipapi.com"):
+                input_ip_to_lookup = page.locator('input[name="ip_to_lookup"]')
+                await input_ip_to_lookup.clear()
+                await input_ip_to_lookup.type(ip_address, delay=profile.type_delay)
+                await input_ip_to_lookup.press("Enter")
 
-            await page.wait_for_selector('[data-demo-fill="latitude"]', timeout=10000)
-            await page.wait_for_timeout(2000)
+                await page.wait_for_function(IPAPI_RESULT_READY_JS, arg=ip_address)
 
             ip_data = {"source": "ipapi.com"}
 
-            # Location данные
-            ip_data["latitude"] = await page.locator(
-                '[data-demo-fill="latitude"]'
-            ).text_content()
-            ip_data["longitude"] = await page.locator(
-                '[data-demo-fill="longitude"]'
-            ).text_content()
-            ip_data["country"] = await page.locator(
-                '[data-demo-fill="country"]'
-            ).text_content()
-            ip_data["city"] = await page.locator(
-                '[data-demo-fill="city"]'
-            ).text_content()
-            ip_data["zip"] = await page.locator('[data-demo-fill="zip"]').text_content()
-
-            # Connection данные
-            await page.locator('[data-demo-switch="connection"]').click()
-            await page.wait_for_selector('[data-demo-fill="ip"]', timeout=5000)
-            ip_data["isp"] = await page.locator('[data-demo-fill="isp"]').text_content()
-            ip_data["asn"] = await page.locator('[data-demo-fill="asn"]').text_content()
+            with span("page.extract", source="ipapi.com"):
+                # Location данные
+                ip_data.update(
+                    await page.evaluate(
+                        IPAPI_EXTRACT_JS, ["latitude", "longitude", "country", "city", "zip"]
+                    )
+                )
+
+                # Connection данные
+                await page.locator('[data-demo-switch="connection"]').click()
+                await page.wait_for_selector('[data-demo-fill="ip"]', state="attached")
+                ip_data.update(await page.evaluate(IPAPI_EXTRACT_JS, ["isp", "asn"]))
 
             return ip_data
 
-        except Exception as e:
-            return {"source": "ipapi.com", "error": str(e)}
-        finally:
-            await browser.close()
+    except Exception as e:
+        return {"source": "ipapi.com", "error": str(e)}
+
 
+# Способ получения данных: "http" - загрузка страницы без браузера,
+# "browser" - Playwright. При ошибке HTTP источник повторяется через браузер
+TRANSPORTS = {
+    "ipapi.com": "browser",
+    "ipinfo.io": "http",
+    "db-ip.com": "http",
+    "whatismyipaddress.com": "browser",
+}
 
+
+@cached_source("ipinfo.io")
 async def get_ipinfo_data(ip_address: str) -> Dict:
     """Получение данных с ipinfo.io"""
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(channel="chrome", headless=False)
-        page = await browser.new_page()
-
-        try:
-            await page.goto(
-                f"https://ipinfo.io/{ip_address}",
-                wait_until="domcontentloaded",
-                timeout=3000,
-            )
+    if TRANSPORTS.get("ipinfo.io") == "http":
+        data = await get_ipinfo_data_http(ip_address)
+        if "error" not in data:
+            return data
+    return await get_ipinfo_data_browser(ip_address)
+
+
+async def get_ipinfo_data_browser(ip_address: str) -> Dict:
+    """Получение данных с ipinfo.io через браузер"""
+    profile = get_profile("ipinfo.io")
+    try:
+        async with get_browser_pool().page(profile=profile) as page:
+            with span("page.goto", source="ipinfo.io"):
+                await page.goto(
+                    f"{BASE_URLS['ipinfo.io']}/{ip_address}", wait_until=profile.wait_until
+                )
 
             data = {}
 
             # Ждем загрузки таблицы
-            await page.wait_for_selector("tbody tr", timeout=10000)
-
-            # Получаем все строки таблицы
-            rows = await page.query_selector_all("tbody tr")
-            print(rows)
-            for row in rows:
-                try:
-                    # Получаем название поля
-                    field_name_elem = await row.query_selector("td:first-child")
-                    field_name = await field_name_elem.text_content()
-                    field_name = field_name.strip()
-
-                    # Получаем значение поля
-                    value_elem = await row.query_selector("td:last-child")
-                    value = await value_elem.text_content()
-                    value = value.strip()
-
-                    # Очищаем и нормализуем названия полей
-                    field_name = field_name.lower().replace(" ", "_")
-
-                    # Обрабатываем специальные случаи
-                    if field_name == "asn":
-                        # Извлекаем ASN номер и название компании
-                        asn_parts = value.split(" - ")
-                        if len(asn_parts) > 1:
-                            data["asn_number"] = asn_parts[0].strip()
-                            data["asn_organization"] = asn_parts[1].strip()
-                        else:
-                            data["asn"] = value
-
-                    elif field_name == "range":
-                        # Извлекаем CIDR диапазон
-                        data["ip_range"] = value
-
-                    elif field_name == "company":
-                        data["company"] = value
-
-                    elif field_name == "hosted_domains":
-                        # Преобразуем число в integer (убираем запятые)
-                        data["hosted_domains_count"] = int(value.replace(",", ""))
-
-                    elif field_name == "privacy":
-                        # Преобразуем в boolean
-                        data["is_private"] = "true" in value.lower()
-
-                    elif field_name == "anycast":
-                        # Преобразуем в boolean
-                        data["is_anycast"] = "true" in value.lower()
-
-                    elif field_name == "asn_type":
-                        data["asn_type"] = value.lower()
-
-                    elif field_name == "abuse_contact":
-                        # Извлекаем email
-                        email_elem = await value_elem.query_selector(
-                            'a[href^="mailto:"]'
-                        )
-                        if email_elem:
-                            data["abuse_email"] = await email_elem.text_content()
-                        else:
-                            data["abuse_contact"] = value
-
-                    elif field_name == "hostname":
-                        data["hostname"] = value
-
-                    else:
-                        # Для остальных полей сохраняем как есть
-                        data[field_name] = value
-
-                except Exception as e:
-                    print(f"Ошибка при парсинге строки: {e}")
-                    continue
+            with span("page.wait", source="ipinfo.io"):
+                await page.wait_for_selector("tbody tr", state="attached")
+
+            # Получаем все строки таблицы одним вызовом
+            with span("page.extract", source="ipinfo.io"):
+                rows = await page.evaluate(IPINFO_EXTRACT_JS)
+            data.update(parse_ipinfo_rows(rows))
 
             return data
 
-        except Exception as e:
-            return {"source": "ipinfo.io", "error": str(e)}
-        finally:
-            await browser.close()
+    except Exception as e:
+        return {"source": "ipinfo.io", "error": str(e)}
 
 
+@cached_source("db-ip.com")
 async def get_dbip_data(ip_address: str) -> Dict:
     """Получение данных с db-ip.com"""
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(channel="chrome", headless=False)
-        page = await browser.new_page()
-
-        try:
-            await page.goto(
-                f"https://db-ip.com/{ip_address}",
-                wait_until="domcontentloaded",
-                timeout=3000,
-            )
-            
+    if TRANSPORTS.get("db-ip.com") == "http":
+        data = await get_dbip_data_http(ip_address)
+        if "error" not in data:
+            return data
+    return await get_dbip_data_browser(ip_address)
+
+
+async def get_dbip_data_browser(ip_address: str) -> Dict:
+    """Получение данных с db-ip.com через браузер"""
+    profile = get_profile("db-ip.com")
+    try:
+        async with get_browser_pool().page(profile=profile) as page:
+            with span("page.goto", source="db-ip.com"):
+                await page.goto(
+                    f"{BASE_URLS['db-ip.com']}/{ip_address}", wait_until=profile.wait_until
+                )
+
             data = {}
-            
-            await page.wait_for_selector('.menu.results.shadow table', timeout=10000)
-
-            try:
-                   # Ждем загрузки основных таблиц
-                   await page.wait_for_selector('.menu.results.shadow table', timeout=10000)
-
-                   # Парсим первую таблицу (сетевые данные)
-                   network_data = await parse_network_table(page)
-                   data.update(network_data)
-
-                   # Парсим вторую таблицу (угрозы)
-                   threat_data = await parse_threat_table(page)
-                   data.update(threat_data)
-
-                   # Парсим третью таблицу (географические данные)
-                   geo_data = await parse_geo_table(page)
-                   data.update(geo_data)
-
-                   # Парсим координаты из iframe
-                   coordinates = await parse_coordinates_from_iframe(page)
-                   if coordinates:
-                       data['latitude'], data['longitude'] = coordinates
-            except Exception as e:
-                   print(f"Ошибка при парсинге: {e}")
+
+            data.update(await parse_ip_data(page))
             return data
-        except Exception as e:
-            return {"source": "db-ip.com", "error": str(e)}
-        finally:
-            await browser.close()
+    except Exception as e:
+        return {"source": "db-ip.com", "error": str(e)}
 
 
+@cached_source("whatismyipaddress.com")
 async def get_whatismyipaddress_data(ip_address: str) -> Dict:
     """Получение данных с whatismyipaddress.com"""
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(channel="chrome", headless=False)
-        page = await browser.new_page()
-
-        try:
-            await page.goto(f"https://whatismyipaddress.com/ip/{ip_address}")
-            await page.wait_for_selector("#section_left_3rd", timeout=10000)
+    profile = get_profile("whatismyipaddress.com")
+    try:
+        async with get_browser_pool().page(profile=profile) as page:
+            with span("page.goto", source="whatismyipaddress.com"):
+                await page.goto(
+                    f"{BASE_URLS['whatismyipaddress.com']}/ip/{ip_address}",
+                    wait_until=profile.wait_until,
+                )
+            with span("page.wait", source="whatismyipaddress.com"):
+                await page.wait_for_selector("#section_left_3rd", state="attached")
 
             ip_data = {"source": "whatismyipaddress.com"}
 
             # Извлекаем данные
-            details = await page.query_selector_all("#section_left_3rd .card div")
-            for detail in details:
-                text = await detail.text_content()
+            with span("page.extract", source="whatismyipaddress.com"):
+                details = await page.eval_on_selector_all(
+                    "#section_left_3rd .card div",
+                    "(elements) => elements.map((element) => element.textContent)",
+                )
+            for text in details:
                 if text and ":" in text:
                     key, value = text.split(":", 1)
                     ip_data[key.strip().lower()] = value.strip()
 
             return ip_data
 
-        except Exception as e:
-            return {"source": "whatismyipaddress.com", "error": str(e)}
-        finally:
-            await browser.close()
+    except Exception as e:
+        return {"source": "whatismyipaddress.com", "error": str(e)}
 
 
-async def get_unified_ip_data(ip_address: str) -> Dict[str, Any]:
-    """Получение унифицированных данных IP из всех источников"""
-    # Получаем данные из обоих источников
-    ipapi_raw = await get_ipapi_data(ip_address)
-    ipinfo_raw = await get_ipinfo_data(ip_address)
-    
+async def get_geodb_data(ip_address: str) -> Dict:
+    """Получение данных из локальной базы гео-данных"""
+    db = get_geo_database()
+    if db is None:
+        return {"source": "geo-db", "error": "Локальная база гео-данных не найдена"}
 
-    dbip_raw = await get_dbip_data(ip_address)
-    # whatismyipaddress_raw = await get_whatismyipaddress_data(ip_address)
+    record = db.lookup(ip_address)
+    if record is None:
+        return {"source": "geo-db", "error": "Адрес не найден в локальной базе"}
+    return {"source": "geo-db", **record}
 
-    # Преобразуем к единому формату
-    ipapi_unified = transform_ipapi_data(ipapi_raw, ip_address)
-    ipinfo_unified = transform_ipinfo_data(ipinfo_raw, ip_address)
-    dbip_unified = transform_db_ip_data(dbip_raw,ip_address)
 
-    print(f"Source 'dbip' {dbip_raw}")
-    # print(f"Source 'whatismyipaddress' {whatismyipaddress_raw}")
-    
-    # Объединяем данные
-    combined_data = merge_ip_data(ipapi_unified, ipinfo_unified,dbip_unified)
+def transform_geodb_data(geodb_data: Dict[str, Any], ip_address: str) -> UnifiedIPData:
+    """Преобразование данных из локальной базы"""
+    if "error" in geodb_data:
+        return UnifiedIPData(
+            ip_address=ip_address, source="geo-db", error=geodb_data["error"]
+        )
+
+    fields = {k: v for k, v in geodb_data.items() if k != "source"}
+    return UnifiedIPData(ip_address=ip_address, source="geo-db", **fields)
+
+
+# Источники унифицированного поиска: загрузка сырых данных, соответствие
+# полей и приоритет. При объединении для каждого поля берется непустое
+# значение источника с наибольшим приоритетом
+SOURCES = SourceRegistry(FIELD_NAMES)
+
+SOURCES.register(
+    SourceSpec(
+        name="ipapi.com",
+        fetcher=get_ipapi_data,
+        priority=30,
+        fields=(
+            FieldMapping("country", "country"),
+            FieldMapping("city", "city"),
+            FieldMapping("zip_code", "zip"),
+            FieldMapping("latitude", "latitude", to_float),
+            FieldMapping("longitude", "longitude", to_float),
+            FieldMapping("isp", "isp"),
+            FieldMapping("asn", "asn"),
+        ),
+    )
+)
+
+SOURCES.register(
+    SourceSpec(
+        name="ipinfo.io",
+        fetcher=get_ipinfo_data,
+        priority=20,
+        fields=(
+            FieldMapping("asn", "asn_number"),
+            FieldMapping("asn_organization", "asn_organization"),
+            FieldMapping("hostname", "hostname"),
+            FieldMapping("ip_range", "ip_range"),
+            FieldMapping("company", "company"),
+            FieldMapping("hosted_domains_count", "hosted_domains_count", to_int),
+            # Флаги приватности и anycast ipinfo.io определяет точнее остальных
+            FieldMapping("is_private", "is_private", priority=50),
+            FieldMapping("is_anycast", "is_anycast", priority=50),
+            FieldMapping("asn_type", "asn_type"),
+            FieldMapping("abuse_email", "abuse_email"),
+            FieldMapping("latitude", "coordinates", coordinate(0)),
+            FieldMapping("longitude", "coordinates", coordinate(1)),
+        ),
+    )
+)
+
+SOURCES.register(
+    SourceSpec(
+        name="db-ip.com",
+        fetcher=get_dbip_data,
+        priority=10,
+        fields=(
+            FieldMapping("asn", "asn_number"),
+            FieldMapping("asn_organization", "asn_organization"),
+            FieldMapping("hostname", "hostname"),
+            FieldMapping("ip_range", "ip_range"),
+            FieldMapping("organization", "organization"),
+            FieldMapping("country", "country"),
+            FieldMapping("region", "region"),
+            FieldMapping("company", "isp"),
+            FieldMapping("city", "city"),
+            FieldMapping("isp", "isp"),
+            FieldMapping("zip_code", "postal_code"),
+            FieldMapping("district", "county"),
+            FieldMapping("hosted_domains_count", "hosted_domains_count", to_int),
+            FieldMapping("is_private", "is_private", priority=40),
+            FieldMapping("is_anycast", "is_anycast", priority=40),
+            FieldMapping("asn_type", "asn_type"),
+            FieldMapping("abuse_email", "abuse_email"),
+            FieldMapping("latitude", "coordinates", coordinate(0)),
+            FieldMapping("longitude", "coordinates", coordinate(1)),
+        ),
+    )
+)
+
+
+async def fetch_unified_source(source: str, ip_address: str) -> UnifiedIPData:
+    """Получение данных одного источника в унифицированном формате"""
+    if source not in SOURCES:
+        return UnifiedIPData(
+            ip_address=ip_address, source=source, error=f"Неизвестный источник: {source}"
+        )
+    cache = get_lookup_cache()
+    if cache is not None:
+        cached = cache.get(source, ip_address, "unified")
+        if cached is not None:
+            count("cache_hits", source=source, kind="unified")
+            return UnifiedIPData(**cached)
+        count("cache_misses", source=source, kind="unified")
+
+    fetcher = SOURCES[source].fetcher
+    try:
+        with span("source.fetch", source=source):
+            raw = await get_guard(source).call(
+                lambda: fetcher(ip_address), is_failure=lambda data: "error" in data
+            )
+    except SourceUnavailableError as e:
+        if isinstance(e, CircuitOpenError):
+            count("breaker_rejections", source=source)
+        elif isinstance(e, SourceTimeoutError):
+            count("source_timeout_events", source=source)
+        # Источник пропущен или не ответил вовремя: такой результат не кэшируем
+        return UnifiedIPData(ip_address=ip_address, source=source, error=str(e))
+    except Exception as e:
+        record_error("fetch", e, source=source)
+        raw = {"source": source, "error": str(e)}
+    if "error" in raw:
+        count("source_errors", source=source)
+    with span("transform", source=source):
+        unified = UnifiedIPData(
+            ip_address=ip_address, source=source, **SOURCES.transform(source, raw)
+        )
+
+    if cache is not None:
+        cache.set(source, ip_address, unified.to_dict(), "unified")
+    return unified
+
+
+def build_unified_result(
+    ip_address: str, unified: Dict[str, UnifiedIPData]
+) -> Dict[str, Any]:
+    """Объединение данных источников и формирование результата"""
+    with span("merge"):
+        sources = {source: data.to_dict() for source, data in unified.items()}
+        merged = SOURCES.merge(sources)
+        merged.update(ip_address=ip_address, source="combined")
+
+    return {
+        "sources": sources,
+        "combined": UnifiedIPData(**merged).to_dict(),
+    }
+
+
+# Кэш объединенных результатов в памяти перед постоянным кэшем
+unified_memo = MemoCache(max_entries=100000, max_bytes=256 * 1024 * 1024, ttl=600)
+
+
+def configure_unified_memo(**kwargs) -> MemoCache:
+    """Замена кэша объединенных результатов в памяти"""
+    global unified_memo
+    unified_memo = MemoCache(**kwargs)
+    return unified_memo
 
-    # Возвращаем результат в виде словаря
+
+# Индекс уже известных диапазонов для ответа на соседние адреса
+range_index = RangeIndex()
+
+
+def build_range_result(ip_address: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Результат по известному диапазону без обращения к источникам"""
+    derived = UnifiedIPData(
+        ip_address=ip_address, source="range-index", range_derived=True, **fields
+    )
+    combined = UnifiedIPData(
+        ip_address=ip_address, source="combined", range_derived=True, **fields
+    )
     return {
-        'sources': {
-            'ipapi.com': ipapi_unified.to_dict(),
-            'ipinfo.io': ipinfo_unified.to_dict(),
-            'db-ip.com': dbip_unified.to_dict()
-        },
-        'combined': combined_data.to_dict()
+        "sources": {"range-index": derived.to_dict()},
+        "combined": combined.to_dict(),
     }
 
 
+def build_local_result(unified: UnifiedIPData) -> Dict[str, Any]:
+    """Результат из одного локального источника"""
+    combined = dict(unified.to_dict(), source="combined")
+    return {"sources": {unified.source: unified.to_dict()}, "combined": combined}
+
+
+UNIFIED_FIELDS = frozenset(FIELD_NAMES)
+
+# Источники, оставленные догружаться в фоне после раннего ответа.
+# Ссылки храним до завершения, иначе задачи может собрать сборщик мусора
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def normalize_required(required_fields: Optional[Iterable[str]]) -> Tuple[str, ...]:
+    """Проверка и упорядочивание набора обязательных полей"""
+    if not required_fields:
+        return ()
+    required = tuple(sorted(set(required_fields)))
+    unknown = [name for name in required if name not in UNIFIED_FIELDS]
+    if unknown:
+        raise ValueError(f"Неизвестные поля: {', '.join(unknown)}")
+    return required
+
+
+def _finish_background(task: asyncio.Task) -> None:
+    """Завершение фоновой догрузки источника"""
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        record_error("background", task.exception())
+
+
+async def _load_until_satisfied(
+    ip_address: str,
+    names: List[str],
+    fetch: Callable[[str, str], Awaitable[UnifiedIPData]],
+    required: Tuple[str, ...],
+    background: bool,
+) -> Dict[str, Any]:
+    """Опрос источников до заполнения обязательных полей
+
+    После каждого ответа данные объединяются заново. Как только все поля
+    required заполнены, результат возвращается, а оставшиеся источники
+    отменяются или (background=True) догружаются в фоне и попадают в кэш.
+    Незавершенные источники перечислены в ключе "pending" результата.
+    """
+    tasks = {asyncio.create_task(fetch(name, ip_address)): name for name in names}
+    pending = set(tasks)
+    unified: Dict[str, UnifiedIPData] = {}
+    result: Dict[str, Any] = {}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                unified[tasks[task]] = task.result()
+
+            result = build_unified_result(ip_address, unified)
+            if pending and covers_required(result, required):
+                result["pending"] = [tasks[task] for task in tasks if task in pending]
+                break
+        return result
+    finally:
+        for task in pending:
+            if background:
+                _background_tasks.add(task)
+                task.add_done_callback(_finish_background)
+            else:
+                task.cancel()
+
+
+async def _lookup_unified(
+    ip_address: str,
+    names: List[str],
+    fetch: Callable[[str, str], Awaitable[UnifiedIPData]],
+    required: Tuple[str, ...] = (),
+    background: bool = False,
+    local: bool = True,
+) -> Dict[str, Any]:
+    """Поиск через локальную базу, индекс диапазонов и кэш в памяти
+
+    Одновременные запросы одного IP используют одну общую загрузку.
+    Первой проверяется локальная база, браузер нужен только при промахе.
+    Локальный ответ используется, только если он заполняет все поля
+    required; local=False (явный список источников) отключает его.
+    """
+    with span("lookup", ip=ip_address) as lookup_span:
+        if local:
+            with span("geo_db"):
+                geodb_unified = transform_geodb_data(
+                    await get_geodb_data(ip_address), ip_address
+                )
+            if geodb_unified.error is None:
+                result = build_local_result(geodb_unified)
+                if covers_required(result, required):
+                    lookup_span.set(resolved="geo_db")
+                    return result
+
+            fields = range_index.lookup(ip_address)
+            if fields is not None:
+                result = build_range_result(ip_address, fields)
+                if covers_required(result, required):
+                    lookup_span.set(resolved="range_index")
+                    return result
+
+        result = await unified_memo.get_or_load(
+            (ip_address, tuple(names), required),
+            lambda: _load_unified(ip_address, names, fetch, required, background),
+            cacheable=is_complete,
+        )
+        # В индекс попадают только полные результаты без ошибки: иначе соседний
+        # адрес получил бы неполный набор полей как готовый ответ
+        if is_complete(result):
+            range_index.add_record(result["combined"])
+        return result
+
+
+def covers_required(result: Dict[str, Any], required: Tuple[str, ...]) -> bool:
+    """Все обязательные поля объединенного результата заполнены"""
+    combined = result["combined"]
+    return all(combined.get(name) is not None for name in required)
+
+
+def is_complete(result: Dict[str, Any]) -> bool:
+    """Результат без ошибки и без недогруженных источников
+
+    Ошибки уже закэшированы по источникам, объединенный результат с ошибкой
+    пересобирается из них, когда источники восстановятся. Неполный
+    результат раннего ответа тоже не сохраняется ни в одном кэше.
+    """
+    return "pending" not in result and not result["combined"].get("error")
+
+
+def combined_cache_kind(names: Iterable[str]) -> str:
+    """Вид записи постоянного кэша для объединенного результата набора источников"""
+    return "unified:" + ",".join(names)
+
+
+async def _load_unified(
+    ip_address: str,
+    names: List[str],
+    fetch: Callable[[str, str], Awaitable[UnifiedIPData]],
+    required: Tuple[str, ...] = (),
+    background: bool = False,
+) -> Dict[str, Any]:
+    """Поиск по набору источников с кэшированием объединенного результата"""
+    cache = get_lookup_cache()
+    kind = combined_cache_kind(names)
+    if cache is not None:
+        cached = cache.get("combined", ip_address, kind)
+        if cached is not None:
+            count("cache_hits", source="combined", kind="unified")
+            return cached
+        count("cache_misses", source="combined", kind="unified")
+
+    if required:
+        result = await _load_until_satisfied(
+            ip_address, names, fetch, required, background
+        )
+    else:
+        # Источники независимы, опрашиваем их параллельно
+        results = await asyncio.gather(*(fetch(name, ip_address) for name in names))
+        result = build_unified_result(ip_address, dict(zip(names, results)))
+
+    if cache is not None and is_complete(result):
+        cache.set("combined", ip_address, result, kind)
+    return result
+
+
+async def get_unified_ip_data(
+    ip_address: str,
+    sources: Optional[Iterable[str]] = None,
+    required_fields: Optional[Iterable[str]] = None,
+    background: bool = False,
+) -> Dict[str, Any]:
+    """Получение унифицированных данных IP из всех источников
+
+    Если задан required_fields, ответ возвращается сразу после заполнения
+    этих полей, не дожидаясь остальных источников (см. _load_until_satisfied).
+    Явный список sources опрашивается без локальной базы и индекса диапазонов.
+    """
+    names = list(sources or SOURCES)
+    required = normalize_required(required_fields)
+    return await _lookup_unified(
+        ip_address, names, fetch_unified_source, required, background, local=not sources
+    )
+
+
+async def _iterate_ips(ips: Union[Iterable[str], AsyncIterable[str]]) -> AsyncIterator[str]:
+    """Единый асинхронный обход обычного или асинхронного источника IP"""
+    if hasattr(ips, "__aiter__"):
+        async for ip in ips:
+            yield ip
+    else:
+        for ip in ips:
+            yield ip
+
+
+async def lookup_many(
+    ips: Union[Iterable[str], AsyncIterable[str]],
+    sources: Optional[Iterable[str]] = None,
+    max_concurrency: int = 8,
+    per_source_limit: Optional[Union[int, Dict[str, int]]] = None,
+    required_fields: Optional[Iterable[str]] = None,
+    background: bool = False,
+    semaphores: Optional[Dict[str, asyncio.Semaphore]] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Пакетный поиск по множеству IP с ограничением параллельности
+
+    Одновременно обрабатывается не более max_concurrency адресов, а задачи
+    каждого источника дополнительно ограничены своим семафором
+    (per_source_limit, по умолчанию равен max_concurrency). Результаты
+    возвращаются по мере готовности, а не в порядке входных IP. Следующий
+    адрес берется из ips только при появлении свободного места, поэтому
+    ips может быть ленивым генератором любого размера.
+    required_fields и background работают как в get_unified_ip_data.
+    semaphores - семафоры источников по имени, общие для нескольких
+    вызовов (например, defaultdict, см. ipgeo_service.LookupBatcher);
+    с ними per_source_limit не используется.
+    """
+    names = list(sources or SOURCES)
+    required = normalize_required(required_fields)
+    if semaphores is None:
+        if isinstance(per_source_limit, dict):
+            limits = {name: per_source_limit.get(name, max_concurrency) for name in names}
+        else:
+            limits = {name: per_source_limit or max_concurrency for name in names}
+        semaphores = {name: asyncio.Semaphore(limit) for name, limit in limits.items()}
+
+    async def fetch(name: str, ip_address: str) -> UnifiedIPData:
+        async with semaphores[name]:
+            return await fetch_unified_source(name, ip_address)
+
+    async def lookup(ip_address: str) -> Dict[str, Any]:
+        return await _lookup_unified(
+            ip_address, names, fetch, required, background, local=not sources
+        )
+
+    pending = set()
+    try:
+        async for ip_address in _iterate_ips(ips):
+            if len(pending) >= max_concurrency:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+            pending.add(asyncio.create_task(lookup(ip_address)))
+
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def enrich_to_sink(
+    ips: Union[Iterable[str], AsyncIterable[str]], sink: OutputSink, **options
+) -> int:
+    """Поиск по множеству IP с записью результатов в приемник по готовности
+
+    options передаются в lookup_many. Возвращает количество записанных
+    результатов.
+    """
+    written = 0
+    async for result in lookup_many(ips, **options):
+        sink.write(result)
+        written += 1
+    return written
+
+
 async def main():
     ip_address = "169.46.64.41"
-    result = await get_unified_ip_data(ip_address)
+    try:
+        result = await get_unified_ip_data(ip_address)
+    finally:
+        await close_browser_pool()
+        await close_http_session()
 
+    # Источники и объединенные данные выводятся одним документом
     print("Унифицированные данные IP:")
     print(json.dumps(result, indent=2, ensure_ascii=False))
 
-    # Можно также получить отдельные источники
-    print("\nДанные из ipapi.com:")
-    print(json.dumps(result["sources"]["ipapi.com"], indent=2))
-
-    print("\nДанные из ipinfo.io:")
-    print(json.dumps(result["sources"]["ipinfo.io"], indent=2))
-    
-    print("\nДанные из db-ip.com:")
-    print(json.dumps(result["sources"]["db-ip.com"], indent=2))
-
-    print("\nОбъединенные данные:")
-    print(json.dumps(result["combined"], indent=2))
-
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,132 +1,145 @@
-from playwright.async_api import async_playwright, Playwright
 import asyncio
 import json
-from typing import Dict, List
+from typing import Dict, List, Optional
 import time
 
+from browser_pool import close_browser_pool, get_browser_pool
+from http_sources import BASE_URLS
+from lookup_cache import cached_source
+from output_sinks import JsonLinesSink, OutputSink
+from resilience import SourceUnavailableError, get_guard
+from scrape_profile import get_profile
+from tracing import record_error, span
+
+# Ждем, пока поле ip виджета ipapi.com покажет запрошенный адрес вместо
+# адреса посетителя
+IPAPI_RESULT_READY_JS = """
+(ip) => {
+    const shown = document.querySelector('[data-demo-fill="ip"]');
+    const latitude = document.querySelector('[data-demo-fill="latitude"]');
+    return !!shown && !!latitude
+        && shown.textContent.trim().toLowerCase() === ip.toLowerCase()
+        && latitude.textContent.trim() !== '';
+}
+"""
+
+# Значения полей демо-виджета ipapi.com по атрибуту data-demo-fill
+IPAPI_EXTRACT_JS = """
+(fields) => Object.fromEntries(fields.map((field) => {
+    const element = document.querySelector(`[data-demo-fill="${field}"]`);
+    return [field, element ? element.textContent : null];
+}))
+"""
+
+@cached_source("ipapi.com", kind="ip-to-geo")
 async def get_ipapi_data(ip_address: str) -> Dict:
     """Получение данных с ipapi.com"""
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(channel='chrome', headless=False)
-        device = p.devices['Desktop Firefox']
-        page = await browser.new_page(**device)
-        
-        try:
-            await page.goto('https://ipapi.com/')
-            await page.wait_for_selector('input[name="ip_to_lookup"]', timeout=10000)
-            
+    profile = get_profile('ipapi.com')
+    try:
+        async with get_browser_pool().page(profile=profile) as page:
+            await page.goto(f"{BASE_URLS['ipapi.com']}/", wait_until=profile.wait_until)
+            await page.wait_for_selector('input[name="ip_to_lookup"]')
+
             input_ip_to_lookup = page.locator('input[name="ip_to_lookup"]')
             await input_ip_to_lookup.clear()
-            await input_ip_to_lookup.type(ip_address, delay=200)
+            await input_ip_to_lookup.type(ip_address, delay=profile.type_delay)
             await input_ip_to_lookup.press('Enter')
             
-            await page.wait_for_selector('[data-demo-fill="latitude"]', timeout=10000)
-            await page.wait_for_timeout(2000)
+            await page.wait_for_function(IPAPI_RESULT_READY_JS, arg=ip_address)
 
             ip_data = {"source": "ipapi.com"}
             
             # Location данные
-            ip_data['latitude'] = await page.locator('[data-demo-fill="latitude"]').text_content()
-            ip_data['longitude'] = await page.locator('[data-demo-fill="longitude"]').text_content()
-            ip_data['country'] = await page.locator('[data-demo-fill="country"]').text_content()
-            ip_data['city'] = await page.locator('[data-demo-fill="city"]').text_content()
-            ip_data['zip'] = await page.locator('[data-demo-fill="zip"]').text_content()
+            ip_data.update(await page.evaluate(
+                IPAPI_EXTRACT_JS, ['latitude', 'longitude', 'country', 'city', 'zip']
+            ))
             
             # Connection данные
             await page.locator('[data-demo-switch="connection"]').click()
-            await page.wait_for_selector('[data-demo-fill="ip"]', timeout=5000)
-            ip_data['isp'] = await page.locator('[data-demo-fill="isp"]').text_content()
-            ip_data['asn'] = await page.locator('[data-demo-fill="asn"]').text_content()
+            await page.wait_for_selector('[data-demo-fill="ip"]', state='attached')
+            ip_data.update(await page.evaluate(IPAPI_EXTRACT_JS, ['isp', 'asn']))
 
             return ip_data
-            
-        except Exception as e:
-            return {"source": "ipapi.com", "error": str(e)}
-        finally:
-            await browser.close()
 
+    except Exception as e:
+        return {"source": "ipapi.com", "error": str(e)}
+
+@cached_source("ipinfo.io", kind="ip-to-geo")
 async def get_ipinfo_data(ip_address: str) -> Dict:
     """Получение данных с ipinfo.io"""
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(channel='chrome', headless=False)
-        page = await browser.new_page()
-        
-        try:
-            await page.goto(f'https://ipinfo.io/{ip_address}')
-            await page.wait_for_selector('.card', timeout=10000)
+    profile = get_profile('ipinfo.io')
+    try:
+        async with get_browser_pool().page(profile=profile) as page:
+            await page.goto(f"{BASE_URLS['ipinfo.io']}/{ip_address}", wait_until=profile.wait_until)
+            await page.wait_for_selector('.card', state='attached')
             
             ip_data = {"source": "ipinfo.io"}
             
             # Извлекаем основные данные
-            elements = await page.query_selector_all('.card .p-4 div')
-            for element in elements:
-                text = await element.text_content()
+            elements = await page.eval_on_selector_all(
+                '.card .p-4 div', '(elements) => elements.map((element) => element.textContent)'
+            )
+            for text in elements:
                 if text and ':' in text:
                     key, value = text.split(':', 1)
                     ip_data[key.strip().lower()] = value.strip()
             
             return ip_data
-            
-        except Exception as e:
-            return {"source": "ipinfo.io", "error": str(e)}
-        finally:
-            await browser.close()
 
+    except Exception as e:
+        return {"source": "ipinfo.io", "error": str(e)}
+
+@cached_source("db-ip.com", kind="ip-to-geo")
 async def get_dbip_data(ip_address: str) -> Dict:
     """Получение данных с db-ip.com"""
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(channel='chrome', headless=False)
-        page = await browser.new_page()
-        
-        try:
-            await page.goto(f'https://db-ip.com/{ip_address}')
-            await page.wait_for_selector('.ip-info-table', timeout=10000)
+    profile = get_profile('db-ip.com')
+    try:
+        async with get_browser_pool().page(profile=profile) as page:
+            await page.goto(f"{BASE_URLS['db-ip.com']}/{ip_address}", wait_until=profile.wait_until)
+            await page.wait_for_selector('.ip-info-table', state='attached')
             
             ip_data = {"source": "db-ip.com"}
             
             # Извлекаем данные из таблицы
-            rows = await page.query_selector_all('.ip-info-table tr')
-            for row in rows:
-                cells = await row.query_selector_all('td')
+            rows = await page.eval_on_selector_all(
+                '.ip-info-table tr',
+                '(rows) => rows.map((row) => Array.from(row.querySelectorAll("td"), (td) => td.textContent))',
+            )
+            for cells in rows:
                 if len(cells) >= 2:
-                    key = await cells[0].text_content()
-                    value = await cells[1].text_content()
+                    key, value = cells[0], cells[1]
                     if key and value:
                         ip_data[key.strip().lower()] = value.strip()
             
             return ip_data
-            
-        except Exception as e:
-            return {"source": "db-ip.com", "error": str(e)}
-        finally:
-            await browser.close()
 
+    except Exception as e:
+        return {"source": "db-ip.com", "error": str(e)}
+
+@cached_source("whatismyipaddress.com", kind="ip-to-geo")
 async def get_whatismyipaddress_data(ip_address: str) -> Dict:
     """Получение данных с whatismyipaddress.com"""
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(channel='chrome', headless=False)
-        page = await browser.new_page()
-        
-        try:
-            await page.goto(f'https://whatismyipaddress.com/ip/{ip_address}')
-            await page.wait_for_selector('#section_left_3rd', timeout=10000)
+    profile = get_profile('whatismyipaddress.com')
+    try:
+        async with get_browser_pool().page(profile=profile) as page:
+            await page.goto(f"{BASE_URLS['whatismyipaddress.com']}/ip/{ip_address}", wait_until=profile.wait_until)
+            await page.wait_for_selector('#section_left_3rd', state='attached')
             
             ip_data = {"source": "whatismyipaddress.com"}
             
             # Извлекаем данные
-            details = await page.query_selector_all('#section_left_3rd .card div')
-            for detail in details:
-                text = await detail.text_content()
+            details = await page.eval_on_selector_all(
+                '#section_left_3rd .card div', '(elements) => elements.map((element) => element.textContent)'
+            )
+            for text in details:
                 if text and ':' in text:
                     key, value = text.split(':', 1)
                     ip_data[key.strip().lower()] = value.strip()
             
             return ip_data
-            
-        except Exception as e:
-            return {"source": "whatismyipaddress.com", "error": str(e)}
-        finally:
-            await browser.close()
+
+    except Exception as e:
+        return {"source": "whatismyipaddress.com", "error": str(e)}
             
 async def get_combined_ip_data(ip_address: str) -> Dict:
     """Сбор данных из всех источников"""
@@ -137,22 +150,30 @@ async def get_combined_ip_data(ip_address: str) -> Dict:
     }
     
     # Создаем задачи для всех источников
+    fetchers = {
+        "ipapi.com": get_ipapi_data,
+        "ipinfo.io": get_ipinfo_data,
+        "db-ip.com": get_dbip_data,
+        "whatismyipaddress.com": get_whatismyipaddress_data,
+    }
     tasks = [
-        get_ipapi_data(ip_address),
-        get_ipinfo_data(ip_address),
-        get_dbip_data(ip_address),
-        get_whatismyipaddress_data(ip_address)
+        get_guard(name).call(
+            lambda fetcher=fetcher: fetcher(ip_address),
+            is_failure=lambda data: "error" in data,
+        )
+        for name, fetcher in fetchers.items()
     ]
     
     # Запускаем все задачи параллельно
     sources_data = await asyncio.gather(*tasks, return_exceptions=True)
     
     # Обрабатываем результаты
-    for data in sources_data:
-        if isinstance(data, Exception):
+    for source_name, data in zip(fetchers, sources_data):
+        if isinstance(data, SourceUnavailableError):
+            data = {"source": source_name, "error": str(data)}
+        elif isinstance(data, Exception):
             continue
-        source_name = data.get("source", "unknown")
-        results["sources"][source_name] = data
+        results["sources"][data.get("source", source_name)] = data
     
     return results
 
@@ -174,11 +195,11 @@ async def get_consistent_ip_data(ip_address: str) -> Dict:
     
     for source_name, source_func in sources:
         try:
-            data = await source_func(ip_address)
+            with span("source.fetch", source=source_name):
+                data = await source_func(ip_address)
             results["sources"][source_name] = data
-            print(f"Данные от {source_name} получены")
         except Exception as e:
-            print(f"Ошибка от {source_name}: {e}")
+            record_error("fetch", e, source=source_name)
             results["sources"][source_name] = {"error": str(e)}
     
     return results
@@ -220,29 +241,55 @@ def compare_sources(combined_data: Dict) -> Dict:
     }
     
     
-async def main():
-    ip_addresses = ["8.8.8.8", "1.1.1.1", "77.88.8.8"]
-    
-    for ip in ip_addresses:
-        print(f"\n=== Сбор данных для {ip} ===")
-        
-        # Параллельный сбор данных
-        combined_data = await get_combined_ip_data(ip)
+async def collect_ip_data(
+    ip_addresses: List[str], max_concurrency: int = 4, sink: Optional[OutputSink] = None
+) -> None:
+    """Сбор и сохранение данных для списка IP
+
+    Если задан sink, результаты дописываются в него, иначе каждый IP
+    сохраняется в отдельный JSON-файл.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def collect(ip: str):
+        async with semaphore:
+            print(f"\n=== Сбор данных для {ip} ===")
+            return ip, await get_combined_ip_data(ip)
+
+    # Адреса обрабатываются параллельно, результаты сохраняются по готовности
+    for task in asyncio.as_completed([collect(ip) for ip in ip_addresses]):
+        ip, combined_data = await task
         
         # Сравнение данных
         comparison = compare_sources(combined_data)
         
         # Сохраняем результаты
-        filename = f"ip_data_{ip.replace('.', '_')}.json"
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump({
+        if sink is not None:
+            sink.write({
+                "ip_address": ip,
                 "combined_data": combined_data,
                 "comparison": comparison
-            }, f, indent=2, ensure_ascii=False)
-        
-        print(f"Данные сохранены в {filename}")
+            })
+            print(f"Данные добавлены в {sink.path}")
+        else:
+            filename = f"ip_data_{ip.replace('.', '_')}.json"
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump({
+                    "combined_data": combined_data,
+                    "comparison": comparison
+                }, f, indent=2, ensure_ascii=False)
+            print(f"Данные сохранены в {filename}")
         print(f"Согласованность данных: {comparison['summary']['consistent_fields']}/{comparison['summary']['total_fields']}")
 
+async def main():
+    ip_addresses = ["8.8.8.8", "1.1.1.1", "77.88.8.8"]
+    
+    try:
+        with JsonLinesSink("ip_data.jsonl") as sink:
+            await collect_ip_data(ip_addresses, sink=sink)
+    finally:
+        await close_browser_pool()
+
 # Запуск
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,152 @@
+import asyncio
+import csv
+import ipaddress
+import itertools
+import json
+import sys
+from collections import OrderedDict
+from typing import IO, AsyncIterator, Iterable, Iterator, List, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+# Колонки CSV и поля JSONL с адресами, проверяемые по умолчанию
+DEFAULT_COLUMNS = ("src_ip", "dst_ip", "ip", "ip_address")
+
+
+def parse_ip(value, include_private: bool = False) -> Optional[str]:
+    """Нормализованный IP из значения или None
+
+    Частные, локальные и групповые адреса пропускаются: внешние источники
+    о них ничего не знают.
+    """
+    if not isinstance(value, str):
+        return None
+    try:
+        ip = ipaddress.ip_address(value.strip())
+    except ValueError:
+        return None
+    if not include_private and (not ip.is_global or ip.is_multicast):
+        return None
+    return str(ip)
+
+
+def iter_text(lines: Iterable[str]) -> Iterator[str]:
+    """Значения из текста: по одному или несколько через пробел на строку"""
+    for line in lines:
+        yield from line.split()
+
+
+def iter_csv(f: IO[str], columns: Optional[Sequence[str]] = None) -> Iterator[str]:
+    """Значения колонок CSV
+
+    Без columns берутся колонки из DEFAULT_COLUMNS, а если их нет в
+    заголовке - все ячейки строки (подходит для detailed_traffic_analysis.csv,
+    где адреса лежат в безымянных Field_N).
+    """
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if header is None:
+        return
+
+    wanted = list(columns) if columns else [c for c in DEFAULT_COLUMNS if c in header]
+    missing = [c for c in wanted if c not in header]
+    if missing:
+        raise ValueError(f"Колонки не найдены в CSV: {', '.join(missing)}")
+    indexes = [header.index(c) for c in wanted]
+
+    for row in reader:
+        if indexes:
+            yield from (row[i] for i in indexes if i < len(row))
+        else:
+            yield from row
+
+
+def iter_jsonl(f: IO[str], fields: Optional[Sequence[str]] = None) -> Iterator[str]:
+    """Значения полей JSON Lines, строки-не объекты считаются адресами"""
+    fields = list(fields) if fields else list(DEFAULT_COLUMNS)
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        document = json.loads(line)
+        if isinstance(document, dict):
+            yield from (document[k] for k in fields if k in document)
+        else:
+            yield document
+
+
+def detect_format(path: str) -> str:
+    """Формат входного файла по расширению"""
+    if path.endswith(".csv"):
+        return "csv"
+    if path.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return "text"
+
+
+def iter_values(
+    paths: Sequence[str], input_format: str = "auto", columns: Optional[Sequence[str]] = None
+) -> Iterator[str]:
+    """Значения из файлов или stdin ("-") по мере чтения"""
+    for path in paths or ["-"]:
+        fmt = input_format
+        if fmt == "auto":
+            fmt = "text" if path == "-" else detect_format(path)
+
+        f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8", newline="")
+        try:
+            if fmt == "csv":
+                yield from iter_csv(f, columns)
+            elif fmt == "jsonl":
+                yield from iter_jsonl(f, columns)
+            else:
+                yield from iter_text(f)
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+
+def dedupe(values: Iterable[str], window: int = 100000) -> Iterator[str]:
+    """Удаление повторов среди последних window уникальных значений
+
+    Память ограничена размером окна при любом размере входа; адрес,
+    вытесненный из окна, может встретиться повторно.
+    """
+    seen: "OrderedDict[str, None]" = OrderedDict()
+    for value in values:
+        if value in seen:
+            seen.move_to_end(value)
+            continue
+        seen[value] = None
+        if len(seen) > window:
+            seen.popitem(last=False)
+        yield value
+
+
+def read_ips(
+    paths: Sequence[str],
+    input_format: str = "auto",
+    columns: Optional[Sequence[str]] = None,
+    include_private: bool = False,
+    dedupe_window: int = 100000,
+) -> Iterator[str]:
+    """Уникальные внешние IP из входных файлов"""
+    values = iter_values(paths, input_format, columns)
+    ips = (parse_ip(value, include_private) for value in values)
+    return dedupe((ip for ip in ips if ip is not None), dedupe_window)
+
+
+async def iterate_in_thread(items: Iterator[T], chunk_size: int = 1000) -> AsyncIterator[T]:
+    """Асинхронный обход блокирующего итератора в отдельном потоке
+
+    Чтение stdin или файла не останавливает цикл событий, а элементы
+    запрашиваются блоками только по мере потребления.
+    """
+    while True:
+        chunk: List[T] = await asyncio.to_thread(
+            lambda: list(itertools.islice(items, chunk_size))
+        )
+        if not chunk:
+            return
+        for item in chunk:
+            yield item
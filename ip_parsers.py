@@ -0,0 +1,171 @@
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from tracing import record_error
+
+# Проверки отсутствия угроз db-ip.com: номер колонки таблицы угроз
+THREAT_COLUMNS = {
+    "is_crawler": 1,
+    "is_proxy": 2,
+    "is_attack_source": 3,
+}
+
+
+def normalize_key(key: str) -> str:
+    """Нормализация названия поля таблицы"""
+    return key.strip().lower().replace(" ", "_")
+
+
+def parse_ipinfo_rows(rows: Iterable[Tuple[str, str, Optional[str]]]) -> Dict[str, Any]:
+    """Разбор строк таблицы ipinfo.io: (поле, значение, email из mailto-ссылки)"""
+    data = {}
+
+    for field_name, value, email in rows:
+        try:
+            field_name = normalize_key(field_name)
+            value = value.strip()
+
+            # Обрабатываем специальные случаи
+            if field_name == "asn":
+                # Извлекаем ASN номер и название компании
+                asn_parts = value.split(" - ")
+                if len(asn_parts) > 1:
+                    data["asn_number"] = asn_parts[0].strip()
+                    data["asn_organization"] = asn_parts[1].strip()
+                else:
+                    data["asn"] = value
+
+            elif field_name == "range":
+                # Извлекаем CIDR диапазон
+                data["ip_range"] = value
+
+            elif field_name == "company":
+                data["company"] = value
+
+            elif field_name == "hosted_domains":
+                # Преобразуем число в integer (убираем запятые)
+                data["hosted_domains_count"] = int(value.replace(",", ""))
+
+            elif field_name == "privacy":
+                # Преобразуем в boolean
+                data["is_private"] = "true" in value.lower()
+
+            elif field_name == "anycast":
+                # Преобразуем в boolean
+                data["is_anycast"] = "true" in value.lower()
+
+            elif field_name == "asn_type":
+                data["asn_type"] = value.lower()
+
+            elif field_name == "abuse_contact":
+                if email:
+                    data["abuse_email"] = email.strip()
+                else:
+                    data["abuse_contact"] = value
+
+            elif field_name == "hostname":
+                data["hostname"] = value
+
+            else:
+                # Для остальных полей сохраняем как есть
+                data[field_name] = value
+
+        except Exception as e:
+            record_error("parse", e, source="ipinfo.io")
+            continue
+
+    return data
+
+
+def parse_network_rows(rows: Iterable[Tuple[str, str]]) -> Dict[str, Any]:
+    """Разбор строк сетевой таблицы db-ip.com: (th, td)"""
+    data = {}
+
+    for key, value in rows:
+        key = normalize_key(key)
+        value = value.strip()
+
+        # Обрабатываем специальные случаи
+        if key == "asn":
+            # Извлекаем номер ASN и название
+            asn_parts = value.split(" - ")
+            if len(asn_parts) > 1:
+                data["asn_number"] = asn_parts[0].strip()
+                data["asn_organization"] = asn_parts[1].strip()
+            else:
+                data["asn"] = value
+        elif key == "hostname":
+            data["hostname"] = value
+        elif key == "isp":
+            data["isp"] = value
+        elif key == "connection":
+            data["connection_type"] = value
+        elif key == "organization":
+            data["organization"] = value
+        elif key == "address_type":
+            data["ip_version"] = value.replace("&nbsp;", " ").replace("\xa0", " ").strip()
+
+    return data
+
+
+def parse_geo_rows(rows: Iterable[Tuple[str, str]]) -> Dict[str, Any]:
+    """Разбор строк географической таблицы db-ip.com: (th, td)"""
+    data = {}
+
+    for key, value in rows:
+        key = normalize_key(key)
+        value = value.strip()
+
+        # Обрабатываем специальные случаи
+        if key == "country":
+            # Извлекаем только название страны (без флага)
+            data["country"] = value.split("\n")[0].strip()
+        elif key == "state_/_region":
+            # Берем только английское название
+            data["region"] = value.split("\n")[0].strip()
+        elif key == "district_/_county":
+            data["county"] = value.split("\n")[0].strip()
+        elif key == "city":
+            data["city"] = value.split("\n")[0].strip()
+        elif key == "zip_/_postal_code":
+            data["postal_code"] = value
+        elif key == "coordinates":
+            data["coordinates"] = value
+        elif key == "timezone":
+            data["timezone"] = value.split("(")[0].strip()
+        elif key == "local_time":
+            data["local_time"] = value
+        elif key == "languages":
+            data["languages"] = value
+        elif key == "currency":
+            data["currency"] = value
+        elif key == "weather_station":
+            data["weather_station"] = value
+
+    return data
+
+
+def parse_threat_flags(threat_level: Optional[str], safe_columns: Set[int]) -> Dict[str, Any]:
+    """Флаги угроз db-ip.com
+
+    safe_columns - номера колонок таблицы угроз с отметкой "нет угрозы".
+    """
+    data: Dict[str, Any] = {}
+    if threat_level is not None:
+        data["threat_level"] = threat_level
+
+    for key, column in THREAT_COLUMNS.items():
+        data[key] = column in safe_columns  # True если угроза не найдена
+    return data
+
+
+def parse_osm_coordinates(src: Optional[str]) -> Optional[tuple]:
+    """Координаты маркера из адреса iframe OpenStreetMap"""
+    if src and "marker=" in src:
+        marker_part = src.split("marker=")[1]
+        coords = marker_part.split("&")[0].split(",")
+        if len(coords) == 2:
+            try:
+                return float(coords[0]), float(coords[1])
+            except ValueError:
+                return None
+    return None
@@ -0,0 +1,314 @@
+import argparse
+import asyncio
+import importlib
+import sys
+import time
+from contextlib import nullcontext
+from typing import Iterator
+
+from bench import MODES, format_results, record_fixtures, run_benchmark, save_results
+from browser_pool import close_browser_pool, configure_browser_pool
+from geo_db import DEFAULT_GEO_DB_PATH, configure_geo_database
+from http_sources import close_http_session, configure_http_sources
+from ip_inputs import iterate_in_thread, read_ips
+from ipgeo_service import run_service
+from ipgeo_workers import WorkerSupervisor
+from lookup_cache import DEFAULT_CACHE_PATH, configure_lookup_cache
+from output_sinks import SINKS, OutputSink, open_sink, sink_format
+from tracing import PROFILERS, configure_tracing, profile_run, render_prometheus
+
+# Движок поиска находится в ip-text.py, имя модуля с дефисом
+engine = importlib.import_module("ip-text")
+
+
+def split_list(value: str) -> list:
+    """Список из значения через запятую"""
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def source_list(value: str) -> list:
+    """Список источников через запятую, неизвестные имена - ошибка аргумента"""
+    names = split_list(value)
+    unknown = [name for name in names if name not in engine.SOURCES]
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"Неизвестные источники: {', '.join(unknown)}"
+            f" (доступны: {', '.join(engine.SOURCES)})"
+        )
+    return names
+
+
+def base_url(value: str) -> tuple:
+    """Пара источник=адрес для замены базового адреса источника"""
+    source, sep, url = value.partition("=")
+    if not sep or not url:
+        raise argparse.ArgumentTypeError("Ожидается источник=адрес")
+    return source, url.rstrip("/")
+
+
+def add_engine_arguments(parser: argparse.ArgumentParser) -> None:
+    """Общие настройки движка поиска"""
+    parser.add_argument("--browsers", type=int, default=1, help="Экземпляров Chrome")
+    parser.add_argument("--contexts", type=int, default=4, help="Страниц на браузер")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Файл кэша SQLite")
+    parser.add_argument("--no-cache", action="store_true", help="Без постоянного кэша")
+    parser.add_argument(
+        "--geo-db", default=DEFAULT_GEO_DB_PATH, help="Локальная база гео-данных"
+    )
+    parser.add_argument(
+        "--base-url", type=base_url, action="append", default=[],
+        help="Замена адреса источника, например ipinfo.io=http://127.0.0.1:9000",
+    )
+    parser.add_argument(
+        "--trace", action="store_true", help="Замер этапов поиска и счетчики кэша и ошибок"
+    )
+    parser.add_argument(
+        "--trace-log", help='Журнал этапов в JSON (дописывается), "-" - stderr; включает --trace'
+    )
+    parser.add_argument(
+        "--metrics", help="Файл метрик Prometheus по завершении; включает --trace"
+    )
+
+
+def configure_engine(args: argparse.Namespace) -> None:
+    """Настройка кэша, локальной базы, пула браузеров и адресов источников"""
+    configure_lookup_cache(None if args.no_cache else args.cache)
+    configure_geo_database(args.geo_db)
+    configure_browser_pool(browsers=args.browsers, contexts_per_browser=args.contexts)
+    if args.base_url:
+        configure_http_sources(base_urls=dict(args.base_url))
+    configure_tracing(tracing_enabled(args), log=args.trace_log)
+
+
+def tracing_enabled(args: argparse.Namespace) -> bool:
+    return bool(args.trace or args.trace_log or args.metrics)
+
+
+def write_metrics(args: argparse.Namespace) -> None:
+    """Сохранение метрик трассировки, если задан --metrics"""
+    if args.metrics:
+        with open(args.metrics, "w", encoding="utf-8") as f:
+            f.write(render_prometheus())
+
+
+def open_output(args: argparse.Namespace) -> OutputSink:
+    """Приемник результатов по аргументам командной строки"""
+    output_format = sink_format(args.output, args.format)
+    sink_options = {}
+    if args.row_group_size and output_format != "jsonl":
+        sink_options["row_group_size"] = args.row_group_size
+    return open_sink(args.output, output_format, **sink_options)
+
+
+async def enrich_async(args: argparse.Namespace, ips: Iterator[str], sink: OutputSink) -> int:
+    """Поиск в текущем процессе"""
+    try:
+        # lookup_many берет следующий адрес только при свободном месте,
+        # поэтому вход читается не быстрее, чем идет поиск
+        return await engine.enrich_to_sink(
+            iterate_in_thread(ips),
+            sink,
+            sources=args.sources,
+            max_concurrency=args.concurrency,
+            required_fields=args.required,
+        )
+    finally:
+        await close_browser_pool()
+        await close_http_session()
+
+
+def enrich_sharded(args: argparse.Namespace, ips: Iterator[str], sink: OutputSink) -> int:
+    """Поиск в нескольких процессах с распределением адресов по сетям"""
+    supervisor = WorkerSupervisor(
+        workers=args.workers,
+        concurrency=args.concurrency,
+        sources=args.sources,
+        required_fields=args.required,
+        worker_options={
+            "geo_db": args.geo_db,
+            "base_urls": dict(args.base_url),
+            "browser_pool": {"browsers": args.browsers, "contexts_per_browser": args.contexts},
+            "tracing": {"log": args.trace_log} if tracing_enabled(args) else None,
+        },
+    )
+    written = 0
+    with supervisor:
+        for result in supervisor.imap(ips):
+            sink.write(result)
+            written += 1
+    print(f"Процессы: {supervisor.stats()}", file=sys.stderr)
+    return written
+
+
+def enrich(args: argparse.Namespace) -> int:
+    """Обогащение потока IP с записью результатов по мере готовности"""
+    configure_engine(args)
+
+    ips = read_ips(
+        args.inputs,
+        input_format=args.input_format,
+        columns=args.columns,
+        include_private=args.include_private,
+        dedupe_window=args.dedupe_window,
+    )
+
+    started = time.monotonic()
+    with open_output(args) as sink:
+        if args.workers > 1:
+            written = enrich_sharded(args, ips, sink)
+        else:
+            written = asyncio.run(enrich_async(args, ips, sink))
+
+    elapsed = time.monotonic() - started
+    print(
+        f"Обработано адресов: {written} за {elapsed:.1f} с "
+        f"({written / elapsed if elapsed else 0:.1f} в секунду)",
+        file=sys.stderr,
+    )
+    write_metrics(args)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="ipgeo", description="Гео-данные IP-адресов")
+    parser.add_argument("--profile", help="Профилировать команду и сохранить результат в файл")
+    parser.add_argument(
+        "--profiler", choices=PROFILERS, default="cprofile",
+        help="cprofile - pstats текущего процесса, py-spy - flamegraph вместе с процессами поиска",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enrich_parser = commands.add_parser(
+        "enrich", help="Обогащение списка IP или журнала трафика"
+    )
+    enrich_parser.add_argument(
+        "inputs", nargs="*", help='Файлы с адресами (текст, CSV, JSONL), "-" или ничего - stdin'
+    )
+    enrich_parser.add_argument(
+        "--input-format", choices=("auto", "text", "csv", "jsonl"), default="auto",
+        help="Формат входа, по умолчанию по расширению",
+    )
+    enrich_parser.add_argument(
+        "--columns", type=split_list,
+        help="Колонки CSV или поля JSONL с адресами через запятую, например src_ip,dst_ip",
+    )
+    enrich_parser.add_argument(
+        "--include-private", action="store_true",
+        help="Не пропускать частные, локальные и групповые адреса",
+    )
+    enrich_parser.add_argument(
+        "--dedupe-window", type=int, default=100000,
+        help="Сколько последних уникальных адресов помнить для удаления повторов",
+    )
+    enrich_parser.add_argument(
+        "-o", "--output", default="-", help='Файл результатов, "-" - stdout (JSONL)'
+    )
+    enrich_parser.add_argument(
+        "--format", choices=sorted(SINKS), help="Формат вывода, по умолчанию по расширению"
+    )
+    enrich_parser.add_argument(
+        "--row-group-size", type=int, help="Строк в группе Parquet / пакете Arrow"
+    )
+    enrich_parser.add_argument("--sources", type=source_list, help="Источники через запятую")
+    enrich_parser.add_argument(
+        "--required", type=split_list,
+        help="Обязательные поля: ответ сразу после их заполнения",
+    )
+    enrich_parser.add_argument(
+        "-c", "--concurrency", type=int, default=8,
+        help="Одновременно обрабатываемых адресов (в каждом процессе)",
+    )
+    enrich_parser.add_argument(
+        "-w", "--workers", type=int, default=1,
+        help="Процессов поиска, адреса распределяются по сетям /24",
+    )
+    add_engine_arguments(enrich_parser)
+    enrich_parser.set_defaults(handler=enrich)
+
+    serve_parser = commands.add_parser("serve", help="HTTP-сервис поиска")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument(
+        "--batch-size", type=int, default=256, help="Максимальный размер пакета"
+    )
+    serve_parser.add_argument(
+        "--batch-delay", type=float, default=0.005, help="Ожидание пакета, секунды"
+    )
+    serve_parser.add_argument(
+        "-c", "--concurrency", type=int, default=16, help="Одновременно обрабатываемых адресов"
+    )
+    add_engine_arguments(serve_parser)
+    serve_parser.set_defaults(handler=serve)
+
+    record_parser = commands.add_parser(
+        "record", help="Запись ответов источников для воспроизведения без сети"
+    )
+    record_parser.add_argument("inputs", nargs="*", help="Файлы с адресами или stdin")
+    record_parser.add_argument("-o", "--output", default="fixtures.har", help="Файл фикстур")
+    record_parser.add_argument("--sources", type=source_list, help="Источники через запятую")
+    record_parser.set_defaults(handler=record)
+
+    bench_parser = commands.add_parser(
+        "bench", help="Замер скорости поиска на записанных ответах"
+    )
+    bench_parser.add_argument("fixtures", help="Файл фикстур из ipgeo record")
+    bench_parser.add_argument(
+        "--modes", type=split_list, default=list(MODES),
+        help=f"Режимы через запятую: {', '.join(MODES)}",
+    )
+    bench_parser.add_argument("-c", "--concurrency", type=int, default=8)
+    bench_parser.add_argument("--rounds", type=int, default=1, help="Повторов набора IP")
+    bench_parser.add_argument("--sources", type=source_list, help="Источники через запятую")
+    bench_parser.add_argument("--json", help="Сохранить результаты в JSON")
+    bench_parser.set_defaults(handler=bench)
+
+    return parser
+
+
+def record(args: argparse.Namespace) -> int:
+    """Запись фикстур для списка IP"""
+    ips = list(read_ips(args.inputs, include_private=True))
+    store = asyncio.run(record_fixtures(ips, args.output, args.sources))
+    print(f"Записано ответов: {len(store.entries)} для {len(ips)} IP в {args.output}")
+    return 0
+
+
+def bench(args: argparse.Namespace) -> int:
+    """Сравнение режимов поиска без обращения к сети"""
+    unknown = [mode for mode in args.modes if mode not in MODES]
+    if unknown:
+        print(f"Неизвестные режимы: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    results = asyncio.run(
+        run_benchmark(args.fixtures, args.modes, args.concurrency, args.rounds, args.sources)
+    )
+    print(format_results(results))
+    if args.json:
+        save_results(results, args.json)
+    return 0
+
+
+def serve(args: argparse.Namespace) -> int:
+    """Запуск HTTP-сервиса с общим пулом браузеров и кэшем"""
+    configure_engine(args)
+    run_service(
+        host=args.host,
+        port=args.port,
+        max_batch=args.batch_size,
+        max_delay=args.batch_delay,
+        max_concurrency=args.concurrency,
+    )
+    write_metrics(args)
+    return 0
+
+
+def main() -> int:
+    args = build_parser().parse_args()
+    profiler = profile_run(args.profile, args.profiler) if args.profile else nullcontext()
+    with profiler:
+        return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
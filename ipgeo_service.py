@@ -0,0 +1,338 @@
+import asyncio
+import importlib
+import time
+from collections import defaultdict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from browser_pool import close_browser_pool, get_browser_pool
+from http_sources import close_http_session
+from ip_inputs import parse_ip
+from lookup_cache import get_lookup_cache
+from resilience import all_guards
+from tracing import render_prometheus
+
+# Движок поиска находится в ip-text.py, имя модуля с дефисом
+engine = importlib.import_module("ip-text")
+
+LookupKey = Tuple[str, Optional[Tuple[str, ...]], Optional[Tuple[str, ...]]]
+
+
+class LookupBatcher:
+    """Объединение одновременных запросов в небольшие пакеты
+
+    Запросы копятся до max_batch штук или max_delay секунд, затем пакет
+    выполняется одним вызовом lookup_many на каждый набор (sources,
+    required), обычно один. Вызовы всех пакетов делят семафоры
+    источников: одновременно к источнику идет не больше max_concurrency
+    запросов. Запрос того же IP с теми же параметрами, пока предыдущий не
+    завершен, ждет уже запущенный поиск.
+    """
+
+    def __init__(
+        self,
+        lookup_many: Callable[..., AsyncIterator[Dict[str, Any]]],
+        max_batch: int = 256,
+        max_delay: float = 0.005,
+        max_concurrency: int = 16,
+    ):
+        self.lookup_many = lookup_many
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_concurrency = max_concurrency
+
+        self._waiting: Dict[LookupKey, asyncio.Future] = {}
+        self._queue: List[LookupKey] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._semaphores: Optional[Dict[str, asyncio.Semaphore]] = None
+        self._tasks: set = set()
+
+        self.requests = 0
+        self.deduplicated = 0
+        self.batches = 0
+        self.batched_keys = 0
+        self.errors = 0
+
+    async def lookup(
+        self,
+        ip_address: str,
+        sources: Optional[List[str]] = None,
+        required_fields: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        """Поиск одного IP через общий пакет"""
+        self.requests += 1
+        key = (
+            ip_address,
+            tuple(sources) if sources else None,
+            tuple(sorted(required_fields)) if required_fields else None,
+        )
+
+        future = self._waiting.get(key)
+        if future is not None:
+            self.deduplicated += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._waiting[key] = future
+            self._queue.append(key)
+            if len(self._queue) >= self.max_batch:
+                self._flush()
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(
+                    self.max_delay, self._flush
+                )
+
+        # shield: отключение одного клиента не отменяет поиск для остальных
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        """Запуск накопленного пакета"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._queue:
+            return
+
+        keys, self._queue = self._queue, []
+        self.batches += 1
+        self.batched_keys += len(keys)
+        task = asyncio.create_task(self._run(keys))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, keys: List[LookupKey]) -> None:
+        if self._semaphores is None:
+            self._semaphores = defaultdict(lambda: asyncio.Semaphore(self.max_concurrency))
+
+        groups: Dict[Tuple[Any, Any], List[str]] = defaultdict(list)
+        for ip_address, sources, required in keys:
+            groups[(sources, required)].append(ip_address)
+        await asyncio.gather(
+            *(self._run_group(ips, sources, required) for (sources, required), ips in groups.items())
+        )
+
+    async def _run_group(
+        self,
+        ips: List[str],
+        sources: Optional[Tuple[str, ...]],
+        required: Optional[Tuple[str, ...]],
+    ) -> None:
+        """Один вызов lookup_many для адресов пакета с одинаковыми параметрами"""
+        error: BaseException = RuntimeError("Поиск прерван")
+        results = self.lookup_many(
+            ips,
+            sources=sources,
+            required_fields=required,
+            max_concurrency=self.max_concurrency,
+            semaphores=self._semaphores,
+        )
+        try:
+            async for result in results:
+                key = (result["combined"]["ip_address"], sources, required)
+                future = self._waiting.pop(key, None)
+                if future is not None:
+                    future.set_result(result)
+        except Exception as e:
+            error = e
+        finally:
+            await results.aclose()
+            # Адреса без результата: ошибка поиска или отмененный пакет
+            # (остановка сервиса) не оставляют клиентов ждать
+            for ip_address in ips:
+                future = self._waiting.pop((ip_address, sources, required), None)
+                if future is not None:
+                    self.errors += 1
+                    future.set_exception(error)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "deduplicated": self.deduplicated,
+            "batches": self.batches,
+            "batched_keys": self.batched_keys,
+            "errors": self.errors,
+            "inflight": len(self._waiting),
+        }
+
+
+def _split(value: Optional[str]) -> Optional[List[str]]:
+    if not value:
+        return None
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def _parse_request_ip(value: Any) -> str:
+    """Проверка адреса из запроса"""
+    ip_address = parse_ip(value, include_private=True)
+    if ip_address is None:
+        raise web.HTTPBadRequest(text=f"Некорректный IP: {value}")
+    return ip_address
+
+
+def _check_fields(sources: Any, required: Any) -> None:
+    """Проверка источников и обязательных полей до постановки в пакет"""
+    for value in (sources, required):
+        if value is not None and not (
+            isinstance(value, list) and all(isinstance(item, str) for item in value)
+        ):
+            raise web.HTTPBadRequest(text="sources и required - списки строк")
+    unknown = [name for name in sources or () if name not in engine.SOURCES]
+    if unknown:
+        raise web.HTTPBadRequest(text=f"Неизвестные источники: {', '.join(unknown)}")
+    try:
+        engine.normalize_required(required)
+    except ValueError as e:
+        raise web.HTTPBadRequest(text=str(e))
+
+
+async def handle_lookup(request: web.Request) -> web.Response:
+    """GET /lookup/{ip}?sources=a,b&required=country,asn"""
+    ip_address = _parse_request_ip(request.match_info["ip"])
+    sources = _split(request.query.get("sources"))
+    required = _split(request.query.get("required"))
+    _check_fields(sources, required)
+
+    result = await request.app["batcher"].lookup(ip_address, sources, required)
+    return web.json_response(result)
+
+
+async def handle_batch(request: web.Request) -> web.Response:
+    """POST /lookup {"ips": [...], "sources": [...], "required": [...]}
+
+    Результаты возвращаются в порядке входных адресов, ошибка одного
+    адреса не прерывает остальные.
+    """
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="Ожидается JSON")
+    if not isinstance(body, dict) or not isinstance(body.get("ips"), list):
+        raise web.HTTPBadRequest(text='Ожидается объект с полем "ips"')
+
+    ips = body["ips"]
+    if len(ips) > request.app["max_batch_request"]:
+        raise web.HTTPRequestEntityTooLarge(
+            max_size=request.app["max_batch_request"], actual_size=len(ips)
+        )
+    sources = body.get("sources")
+    required = body.get("required")
+    _check_fields(sources, required)
+
+    batcher: LookupBatcher = request.app["batcher"]
+
+    async def lookup_one(value: Any) -> Dict[str, Any]:
+        ip_address = parse_ip(value, include_private=True)
+        if ip_address is None:
+            return {"ip_address": value, "error": "Некорректный IP"}
+        try:
+            return await batcher.lookup(ip_address, sources, required)
+        except Exception as e:
+            return {"ip_address": ip_address, "error": str(e)}
+
+    results = await asyncio.gather(*(lookup_one(value) for value in ips))
+    return web.json_response({"results": results})
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    """Состояние сервиса и источников"""
+    guards = {name: guard.breaker.state for name, guard in all_guards().items()}
+    status = "degraded" if guards and all(s == "open" for s in guards.values()) else "ok"
+    return web.json_response(
+        {
+            "status": status,
+            "uptime": time.monotonic() - request.app["started"],
+            "browser_pool": get_browser_pool().started,
+            "cache": get_lookup_cache() is not None,
+            "sources": guards,
+        }
+    )
+
+
+def render_metrics(app: web.Application) -> str:
+    """Метрики в текстовом формате Prometheus"""
+    lines = []
+
+    def metric(name: str, kind: str, samples: List[Tuple[Dict[str, str], Any]]) -> None:
+        lines.append(f"# TYPE ipgeo_{name} {kind}")
+        for labels, value in samples:
+            if value is None:
+                continue
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+            if label_text:
+                lines.append(f"ipgeo_{name}{{{label_text}}} {value}")
+            else:
+                lines.append(f"ipgeo_{name} {value}")
+
+    batcher = app["batcher"].stats()
+    metric("requests_total", "counter", [({}, batcher["requests"])])
+    metric("requests_deduplicated_total", "counter", [({}, batcher["deduplicated"])])
+    metric("batches_total", "counter", [({}, batcher["batches"])])
+    metric("batched_lookups_total", "counter", [({}, batcher["batched_keys"])])
+    metric("lookup_errors_total", "counter", [({}, batcher["errors"])])
+    metric("lookups_inflight", "gauge", [({}, batcher["inflight"])])
+
+    memo = engine.unified_memo.stats()
+    for key in ("hits", "misses", "evictions", "coalesced"):
+        metric(f"memo_{key}_total", "counter", [({}, memo[key])])
+    metric("memo_entries", "gauge", [({}, memo["entries"])])
+    metric("memo_bytes", "gauge", [({}, memo["bytes"])])
+    metric("range_index_entries", "gauge", [({}, len(engine.range_index))])
+    metric("range_index_evictions_total", "counter", [({}, engine.range_index.evictions)])
+
+    per_source = defaultdict(list)
+    for name, guard in all_guards().items():
+        stats = guard.stats()
+        labels = {"source": name}
+        for key in ("calls", "failures", "timeouts", "rejected", "hedged", "trips"):
+            per_source[f"source_{key}_total"].append((labels, stats[key]))
+        per_source["source_timeout_seconds"].append((labels, stats["timeout"]))
+        per_source["source_latency_p95_seconds"].append((labels, stats["p95"]))
+        per_source["source_circuit_open"].append((labels, int(stats["state"] == "open")))
+    for name, samples in per_source.items():
+        metric(name, "counter" if name.endswith("_total") else "gauge", samples)
+
+    # Этапы поиска и счетчики кэша и ошибок, если включена трассировка
+    return "\n".join(lines) + "\n" + render_prometheus()
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render_metrics(request.app), content_type="text/plain")
+
+
+async def _on_cleanup(app: web.Application) -> None:
+    await close_browser_pool()
+    await close_http_session()
+
+
+def create_app(
+    max_batch: int = 256,
+    max_delay: float = 0.005,
+    max_concurrency: int = 16,
+    max_batch_request: int = 1000,
+) -> web.Application:
+    """Приложение сервиса поиска
+
+    Все клиенты используют общие пул браузеров, кэши и защиту источников
+    процесса, поэтому одинаковые адреса от разных клиентов ищутся один раз.
+    """
+    app = web.Application()
+    app["batcher"] = LookupBatcher(
+        engine.lookup_many,
+        max_batch=max_batch,
+        max_delay=max_delay,
+        max_concurrency=max_concurrency,
+    )
+    app["max_batch_request"] = max_batch_request
+    app["started"] = time.monotonic()
+
+    app.router.add_get("/lookup/{ip}", handle_lookup)
+    app.router.add_post("/lookup", handle_batch)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+    app.on_cleanup.append(_on_cleanup)
+    return app
+
+
+def run_service(host: str = "127.0.0.1", port: int = 8080, **options) -> None:
+    """Запуск сервиса до остановки процесса"""
+    web.run_app(create_app(**options), host=host, port=port)
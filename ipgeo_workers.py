@@ -0,0 +1,285 @@
+import asyncio
+import importlib
+import ipaddress
+import multiprocessing
+import os
+import queue
+import sys
+import zlib
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional
+
+from browser_pool import close_browser_pool, configure_browser_pool
+from geo_db import configure_geo_database
+from http_sources import close_http_session, configure_http_sources
+from lookup_cache import configure_lookup_cache, get_lookup_cache
+from tracing import configure_tracing
+
+# Движок поиска находится в ip-text.py, имя модуля с дефисом
+engine = importlib.import_module("ip-text")
+
+# Длина префикса, по которой адреса распределяются между процессами:
+# соседние адреса одной сети попадают в один процесс и его индекс диапазонов
+DEFAULT_SHARD_PREFIX = {4: 24, 6: 48}
+
+
+def shard_key(ip_address: str, prefix: Dict[int, int] = DEFAULT_SHARD_PREFIX) -> bytes:
+    """Сеть адреса, по которой выбирается процесс"""
+    ip = ipaddress.ip_address(ip_address)
+    network = ipaddress.ip_network(f"{ip}/{prefix[ip.version]}", strict=False)
+    return network.network_address.packed
+
+
+def error_result(ip_address: str, error: str) -> Dict[str, Any]:
+    """Результат поиска с ошибкой в формате get_unified_ip_data"""
+    return {
+        "sources": {},
+        "combined": {"ip_address": ip_address, "source": "combined", "error": error},
+    }
+
+
+def worker_main(
+    index: int,
+    tasks: multiprocessing.Queue,
+    results: multiprocessing.Queue,
+    options: Dict[str, Any],
+) -> None:
+    """Точка входа процесса: свой цикл событий и свой пул браузеров"""
+    asyncio.run(_worker_loop(index, tasks, results, options))
+
+
+async def _worker_loop(
+    index: int,
+    tasks: multiprocessing.Queue,
+    results: multiprocessing.Queue,
+    options: Dict[str, Any],
+) -> None:
+    # В файл кэша пишет только супервизор: процессы читают его, а свои
+    # записи (сырые, унифицированные и ошибки источников) отправляют
+    # вместе с результатом
+    cache = configure_lookup_cache(options.get("cache"), queued=True)
+    if "geo_db" in options:
+        configure_geo_database(options["geo_db"])
+    if options.get("base_urls"):
+        configure_http_sources(base_urls=options["base_urls"])
+    configure_browser_pool(**options.get("browser_pool", {}))
+    if options.get("tracing"):
+        # Журнал общий для всех процессов, записи различаются полем pid
+        configure_tracing(**options["tracing"])
+
+    sources = options.get("sources")
+    required_fields = options.get("required_fields")
+    concurrency = options.get("concurrency", 8)
+    pending: set = set()
+
+    async def lookup(ip_address: str) -> None:
+        try:
+            result = await engine.get_unified_ip_data(
+                ip_address, sources, required_fields=required_fields
+            )
+        except Exception as e:
+            result = error_result(ip_address, str(e))
+        results.put((index, ip_address, result, cache.drain() if cache is not None else []))
+
+    try:
+        while True:
+            ip_address = await asyncio.to_thread(tasks.get)
+            if ip_address is None:
+                break
+            while len(pending) >= concurrency:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            pending.add(asyncio.create_task(lookup(ip_address)))
+
+        if pending:
+            await asyncio.wait(pending)
+    finally:
+        await close_browser_pool()
+        await close_http_session()
+        if cache is not None:
+            cache.close()
+
+
+class WorkerSupervisor:
+    """Распределение поиска по процессам с пулом браузеров в каждом
+
+    Адрес попадает в процесс по хэшу своей сети (/24 для IPv4, /48 для
+    IPv6). Супервизор проверяет постоянный кэш до отправки адреса и сам
+    записывает в него результаты процессов и записи их источников: процессы
+    только читают файл кэша. Упавший процесс перезапускается,
+    а его незавершенные адреса ставятся в очередь заново; адрес, на котором
+    процесс падал max_attempts раз, возвращается с ошибкой.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        concurrency: int = 8,
+        max_inflight: Optional[int] = None,
+        max_attempts: int = 3,
+        shard_prefix: Optional[Dict[int, int]] = None,
+        sources: Optional[List[str]] = None,
+        required_fields: Optional[List[str]] = None,
+        worker_options: Optional[Dict[str, Any]] = None,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_inflight = max_inflight or concurrency * 2
+        self.max_attempts = max_attempts
+        self.shard_prefix = shard_prefix or DEFAULT_SHARD_PREFIX
+
+        self.sources = list(sources or engine.SOURCES)
+        self.cache_kind = engine.combined_cache_kind(self.sources)
+        self.options = dict(
+            worker_options or {},
+            sources=self.sources,
+            required_fields=required_fields,
+            concurrency=concurrency,
+        )
+
+        self._context = multiprocessing.get_context("spawn")
+        self._results = self._context.Queue()
+        self._tasks: List[Optional[multiprocessing.Queue]] = [None] * self.workers
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * self.workers
+        self._inflight: List[Counter] = [Counter() for _ in range(self.workers)]
+        self._backlog: List[Deque[str]] = [deque() for _ in range(self.workers)]
+        self._attempts: Counter = Counter()
+
+        self.restarts = 0
+        self.cache_hits = 0
+
+    def shard(self, ip_address: str) -> int:
+        """Номер процесса для адреса"""
+        return zlib.crc32(shard_key(ip_address, self.shard_prefix)) % self.workers
+
+    def _spawn(self, index: int) -> None:
+        cache = get_lookup_cache()
+        options = dict(self.options, cache=cache.path if cache is not None else None)
+        self._tasks[index] = self._context.Queue()
+        process = self._context.Process(
+            target=worker_main,
+            args=(index, self._tasks[index], self._results, options),
+            name=f"ipgeo-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[index] = process
+
+    def start(self) -> None:
+        for index in range(self.workers):
+            if self._processes[index] is None:
+                self._spawn(index)
+
+    def close(self, timeout: float = 30.0) -> None:
+        """Остановка процессов после завершения начатых поисков"""
+        for index, process in enumerate(self._processes):
+            if process is not None and process.is_alive():
+                self._tasks[index].put(None)
+        for index, process in enumerate(self._processes):
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+            self._processes[index] = None
+
+    def __enter__(self) -> "WorkerSupervisor":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def _recover(self) -> List[Dict[str, Any]]:
+        """Перезапуск упавших процессов и повторная постановка их адресов"""
+        failed = []
+        for index, process in enumerate(self._processes):
+            if process is None or process.is_alive():
+                continue
+
+            print(
+                f"Процесс {process.name} завершился с кодом {process.exitcode}, перезапуск",
+                file=sys.stderr,
+            )
+            self.restarts += 1
+            inflight, self._inflight[index] = self._inflight[index], Counter()
+            for ip_address, count in inflight.items():
+                self._attempts[ip_address] += 1
+                if self._attempts[ip_address] >= self.max_attempts:
+                    del self._attempts[ip_address]
+                    failed.extend(
+                        error_result(ip_address, "Процесс поиска аварийно завершился")
+                        for _ in range(count)
+                    )
+                else:
+                    self._backlog[index].extendleft([ip_address] * count)
+            self._spawn(index)
+        return failed
+
+    def _dispatch(self) -> None:
+        """Отправка адресов из очереди в процессы со свободным местом"""
+        for index, backlog in enumerate(self._backlog):
+            inflight = self._inflight[index]
+            while backlog and sum(inflight.values()) < self.max_inflight:
+                ip_address = backlog.popleft()
+                inflight[ip_address] += 1
+                self._tasks[index].put(ip_address)
+
+    def imap(self, ips: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """Результаты поиска по мере готовности, в произвольном порядке
+
+        Входные адреса читаются не дальше, чем на workers * max_inflight
+        вперед, поэтому ips может быть генератором любого размера.
+        """
+        self.start()
+        cache = get_lookup_cache()
+        backlog_limit = self.workers * self.max_inflight
+        source = iter(ips)
+        exhausted = False
+
+        while True:
+            while not exhausted and sum(map(len, self._backlog)) < backlog_limit:
+                ip_address = next(source, None)
+                if ip_address is None:
+                    exhausted = True
+                    break
+                cached = cache.get("combined", ip_address, self.cache_kind) if cache else None
+                if cached is not None:
+                    self.cache_hits += 1
+                    yield cached
+                else:
+                    self._backlog[self.shard(ip_address)].append(ip_address)
+
+            yield from self._recover()
+            self._dispatch()
+            if exhausted and not any(self._backlog) and not any(self._inflight):
+                return
+
+            try:
+                index, ip_address, result, entries = self._results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            # Записи кэша сохраняются и для ответов, которые уже не ждут
+            if cache is not None:
+                for entry in entries:
+                    cache.set(*entry)
+
+            inflight = self._inflight[index]
+            if inflight[ip_address] <= 0:
+                # Ответ процесса, чьи адреса уже поставлены в очередь заново
+                continue
+            inflight[ip_address] -= 1
+            if not inflight[ip_address]:
+                del inflight[ip_address]
+            self._attempts.pop(ip_address, None)
+            yield result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "alive": sum(1 for p in self._processes if p is not None and p.is_alive()),
+            "inflight": sum(sum(c.values()) for c in self._inflight),
+            "backlog": sum(map(len, self._backlog)),
+            "restarts": self.restarts,
+            "cache_hits": self.cache_hits,
+        }
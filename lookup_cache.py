@@ -0,0 +1,221 @@
+import functools
+import json
+import sqlite3
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from tracing import count
+
+
+DEFAULT_CACHE_PATH = "ipgeo_cache.sqlite3"
+
+# Время жизни записей по умолчанию, секунды
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_ERROR_TTL = 10 * 60
+
+# Аргументы LookupCache.set: (source, ip, data, kind, is_error)
+CacheEntry = Tuple[str, str, Dict[str, Any], str, Optional[bool]]
+
+
+class LookupCache:
+    """Постоянный кэш результатов поиска в SQLite
+
+    Ключ записи - (source, ip, kind): kind "raw" хранит сырые данные
+    источника, "unified" - унифицированные и объединенные результаты.
+    Результаты с ошибкой кэшируются отдельно с коротким error_ttl.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        ttl: Union[float, Dict[str, float]] = DEFAULT_TTL,
+        error_ttl: Union[float, Dict[str, float]] = DEFAULT_ERROR_TTL,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS lookups (
+                source TEXT NOT NULL,
+                ip TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                is_error INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (source, ip, kind)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS lookups_expires_at ON lookups (expires_at)"
+        )
+
+    def _ttl_for(self, source: str, is_error: bool) -> float:
+        """TTL записи с учетом настроек отдельного источника"""
+        ttl = self.error_ttl if is_error else self.ttl
+        if isinstance(ttl, dict):
+            default = DEFAULT_ERROR_TTL if is_error else DEFAULT_TTL
+            return ttl.get(source, ttl.get("default", default))
+        return ttl
+
+    def get(self, source: str, ip: str, kind: str = "raw") -> Optional[Dict[str, Any]]:
+        """Получение непросроченной записи или None"""
+        row = self._conn.execute(
+            "SELECT payload FROM lookups"
+            " WHERE source = ? AND ip = ? AND kind = ? AND expires_at > ?",
+            (source, ip, kind, time.time()),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(
+        self,
+        source: str,
+        ip: str,
+        data: Dict[str, Any],
+        kind: str = "raw",
+        is_error: Optional[bool] = None,
+    ) -> None:
+        """Сохранение записи, ошибки определяются по ключу "error" """
+        if is_error is None:
+            is_error = bool(data.get("error"))
+
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO lookups"
+            " (source, ip, kind, payload, is_error, created_at, expires_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                source,
+                ip,
+                kind,
+                json.dumps(data, ensure_ascii=False),
+                int(is_error),
+                now,
+                now + self._ttl_for(source, is_error),
+            ),
+        )
+
+    def delete(self, source: str, ip: str, kind: Optional[str] = None) -> None:
+        """Удаление записей источника для IP"""
+        if kind is None:
+            self._conn.execute(
+                "DELETE FROM lookups WHERE source = ? AND ip = ?", (source, ip)
+            )
+        else:
+            self._conn.execute(
+                "DELETE FROM lookups WHERE source = ? AND ip = ? AND kind = ?",
+                (source, ip, kind),
+            )
+
+    def purge_expired(self) -> int:
+        """Удаление просроченных записей, возвращает их количество"""
+        cursor = self._conn.execute(
+            "DELETE FROM lookups WHERE expires_at <= ?", (time.time(),)
+        )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        """Закрытие соединения с базой"""
+        self._conn.close()
+
+
+class QueuedLookupCache(LookupCache):
+    """Кэш процесса поиска: читает общий файл, записи отдает владельцу
+
+    Записывает в файл один процесс (супервизор), процессы поиска
+    накапливают свои записи, в том числе ошибки источников, и передают их
+    через drain(). До передачи записи читаются из памяти.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, **kwargs):
+        super().__init__(path, **kwargs)
+        self._pending: Dict[Tuple[str, str, str], Tuple[Dict[str, Any], Optional[bool]]] = {}
+
+    def get(self, source: str, ip: str, kind: str = "raw") -> Optional[Dict[str, Any]]:
+        pending = self._pending.get((source, ip, kind))
+        if pending is not None:
+            return pending[0]
+        return super().get(source, ip, kind)
+
+    def set(
+        self,
+        source: str,
+        ip: str,
+        data: Dict[str, Any],
+        kind: str = "raw",
+        is_error: Optional[bool] = None,
+    ) -> None:
+        self._pending[(source, ip, kind)] = (data, is_error)
+
+    def drain(self) -> List[CacheEntry]:
+        """Накопленные записи для LookupCache.set, очередь очищается"""
+        entries = [
+            (source, ip, data, kind, is_error)
+            for (source, ip, kind), (data, is_error) in self._pending.items()
+        ]
+        self._pending.clear()
+        return entries
+
+
+_default_cache: Optional[LookupCache] = None
+_cache_enabled = True
+
+
+def configure_lookup_cache(
+    path: Optional[str] = DEFAULT_CACHE_PATH, queued: bool = False, **kwargs
+) -> Optional[LookupCache]:
+    """Замена общего кэша, path=None отключает кэширование
+
+    queued=True - кэш процесса поиска (QueuedLookupCache).
+    """
+    global _default_cache, _cache_enabled
+    if _default_cache is not None:
+        _default_cache.close()
+
+    _cache_enabled = path is not None
+    cache_class = QueuedLookupCache if queued else LookupCache
+    _default_cache = cache_class(path, **kwargs) if _cache_enabled else None
+    return _default_cache
+
+
+def get_lookup_cache() -> Optional[LookupCache]:
+    """Общий кэш результатов или None, если кэширование отключено"""
+    global _default_cache
+    if _default_cache is None and _cache_enabled:
+        _default_cache = LookupCache()
+    return _default_cache
+
+
+def cached_source(source: str, kind: str = "raw"):
+    """Декоратор сквозного чтения и записи кэша для функций get_*_data"""
+
+    def decorator(
+        fetcher: Callable[[str], Awaitable[Dict]]
+    ) -> Callable[[str], Awaitable[Dict]]:
+        @functools.wraps(fetcher)
+        async def wrapper(ip_address: str) -> Dict:
+            cache = get_lookup_cache()
+            if cache is None:
+                return await fetcher(ip_address)
+
+            cached = cache.get(source, ip_address, kind)
+            if cached is not None:
+                count("cache_hits", source=source, kind=kind)
+                return cached
+
+            count("cache_misses", source=source, kind=kind)
+            data = await fetcher(ip_address)
+            cache.set(source, ip_address, data, kind)
+            return data
+
+        # Доступ к исходной функции в обход кэша
+        wrapper.uncached = fetcher
+        return wrapper
+
+    return decorator
@@ -1,71 +1,120 @@
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, pipeline
-import torch
-import csv
+import argparse
+import os
+
+from traffic_capture import (
+    DEFAULT_CHUNK_SIZE,
+    CaptureResultWriter,
+    capture_features,
+    chunk_rows,
+    iter_capture_chunks,
+    volatile_columns,
+)
+from traffic_cache import CachedClassifier, ClassificationCache
+from traffic_flows import assemble_flows
+from traffic_inference import BACKENDS, configure_threads, load_classifier
 
 model_name = "./models/deberta-v3-base-full"
 
-try:
-
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-
-    model = AutoModelForSequenceClassification.from_pretrained(model_name)
-
-    print("✅ Модель и токенизатор успешно загружены!")
-
-except Exception as e:
-    print(f"❌ Ошибка загрузки модели: {e}")
-    exit(1)
-
-
-classifier = pipeline(
-    "text-classification",
-    model=model,
-    tokenizer=tokenizer,
-    framework="pt",
-    device=0 if torch.cuda.is_available() else -1,
-)
 
+def analyze_network_traffic(classifier, rows, skip=()):
+    """Классификация строк захвата, ошибка пакета дает ERROR только для его строк
+
+    Модель всегда получает строки целиком. С skip кэш сравнивает пакеты по
+    строкам без колонок skip (см. CachedClassifier.classify).
+    """
+    texts = capture_features(rows)
+    if skip:
+        return classifier.classify(texts, key_texts=capture_features(rows, skip))
+    return classifier.classify(texts)
+
+
+def analyze_flows(classifier, flows, writer):
+    """Одна классификация на поток, метка записывается всем его пакетам"""
+    if not flows:
+        return
+    results = classifier.classify([flow.features() for flow in flows])
+    for flow, result in zip(flows, results):
+        writer.write(flow.rows, [result] * flow.packets, flow.indices)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Классификация захвата трафика")
+    parser.add_argument("capture", nargs="?", default=os.path.join("files", "01.csv"))
+    parser.add_argument("-o", "--output", default="traffic_analysis.csv")
+    parser.add_argument("--model", default=model_name)
+    # "eager" - PyTorch как есть, "int8" - динамическое квантование при
+    # загрузке, "onnx" и "onnx-int8" - исходная и квантованная модели
+    # каталога из download_model.py export
+    parser.add_argument("--backend", choices=BACKENDS, default="eager")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument(
+        "--threads", type=int, help="Потоков внутри операций модели, по умолчанию все ядра"
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="Классифицировать каждый пакет, без кэша по шаблонам пакетов",
+    )
+    parser.add_argument("--cache-size", type=int, default=100000, help="Шаблонов в памяти")
+    parser.add_argument("--cache-db", help="Файл SQLite для результатов между запусками")
+    parser.add_argument(
+        "--flows", action="store_true",
+        help="Классифицировать потоки (src, dst, sport, dport, proto) вместо пакетов",
+    )
+    parser.add_argument("--idle-timeout", type=float, default=60.0, help="Секунд без пакетов")
+    parser.add_argument(
+        "--active-timeout", type=float, default=600.0, help="Наибольшая длительность потока"
+    )
+    args = parser.parse_args()
+
+    # Пакеты выполняются по одному: все ядра отдаем потокам внутри операций
+    configure_threads(intra_op=args.threads, inter_op=1)
 
-def analyze_network_traffic(traffic_data):
-    text_features = []
-    for packet in traffic_data:
-        feature_str = (
-            f"SRC:{packet['src_ip']} DST:{packet['dst_ip']} "
-            f"PORT:{packet['dst_port']} PROTO:{packet['protocol']} "
-            f"SIZE:{packet['length']} FLAGS:{packet.get('flags', 'None')}"
+    try:
+        classifier = load_classifier(
+            args.model, args.backend, args.threads, batch_size=args.batch_size
+        )
+        print("✅ Модель и токенизатор успешно загружены!")
+    except Exception as e:
+        print(f"❌ Ошибка загрузки модели: {e}")
+        exit(1)
+
+    cache = None
+    if not args.no_cache:
+        # Пакеты, отличающиеся только номером и временем, классифицируются один раз
+        cache = ClassificationCache(
+            args.cache_size, args.cache_db, namespace=f"{args.model}:{args.backend}"
         )
-        text_features.append(feature_str)
+        classifier = CachedClassifier(classifier, cache)
 
+    # Порция читается, классифицируется и записывается до чтения следующей
     try:
-        results = classifier(text_features)
-    except:
-
-        results = []
-        for text in text_features:
-            try:
-                result = classifier(text)
-                results.extend(result)
-            except Exception as e:
-                print(f"❌ Ошибка при обработке текста: {text[:50]}... - {e}")
-                results.append({"label": "ERROR", "score": 0.0})
-
-    return results
-
-with open(r'files\01.csv', 'r', newline='') as csvfile:
-    reader = csv.reader(csvfile)
-    header = next(reader)
-    data = []
-    for row in reader:
-        data.append(row)
-        
-
-sample_traffic = list(str(data))
-
-
-try:
-    analysis = analyze_network_traffic(sample_traffic)
-    print("📊 Результаты анализа трафика:")
-    for i, result in enumerate(analysis):
-        print(f"Пакет {i+1}: {result}")
-except Exception as e:
-    print(f"❌ Ошибка при анализе трафика: {e}")
+        with CaptureResultWriter(args.output) as writer:
+            chunks = iter_capture_chunks(args.capture, args.chunk_size)
+            if args.flows:
+                # Пакеты записываются при закрытии их потока, с исходными номерами
+                closed = assemble_flows(
+                    ((chunk.columns, chunk_rows(chunk)) for chunk in chunks),
+                    args.idle_timeout,
+                    args.active_timeout,
+                )
+                for flows in closed:
+                    analyze_flows(classifier, flows, writer)
+                    print(f"📊 Обработано пакетов: {writer.rows}, потоков: {len(flows)}")
+            else:
+                for chunk in chunks:
+                    skip = volatile_columns(chunk.columns) if cache is not None else ()
+                    rows = chunk_rows(chunk)
+                    writer.write(rows, analyze_network_traffic(classifier, rows, skip))
+                    print(f"📊 Обработано пакетов: {writer.rows}")
+        print(f"✅ Результаты анализа трафика: {args.output}")
+        print(f"📈 Вызовы модели: {classifier.stats()}")
+    except Exception as e:
+        print(f"❌ Ошибка при анализе трафика: {e}")
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import asyncio
+import sys
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+def estimate_size(value: Any) -> int:
+    """Приблизительный размер объекта в памяти вместе с вложенными данными"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += estimate_size(k) + estimate_size(v)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += estimate_size(item)
+    elif hasattr(value, "__dict__"):
+        size += estimate_size(value.__dict__)
+    elif hasattr(value, "__slots__"):
+        for name in value.__slots__:
+            size += estimate_size(getattr(value, name, None))
+    return size
+
+
+class _LoadAbandoned(Exception):
+    """Загрузка прервана отменой запроса, который ее начал"""
+
+
+class MemoCache:
+    """Кэш в памяти с вытеснением LRU/LFU и объединением одновременных запросов
+
+    Размер ограничен количеством записей (max_entries) и оценкой занимаемой
+    памяти (max_bytes). get_or_load запускает загрузку ключа только один раз:
+    одновременные запросы того же ключа ждут уже выполняющуюся загрузку.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        max_bytes: Optional[int] = 64 * 1024 * 1024,
+        policy: str = "lru",
+        ttl: Optional[float] = None,
+        sizeof: Callable[[Any], int] = estimate_size,
+    ):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Неизвестная политика вытеснения: {policy}")
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.ttl = ttl
+        self.sizeof = sizeof
+
+        # key -> (value, size, expires_at)
+        self._entries: Dict[Hashable, Tuple[Any, int, Optional[float]]] = {}
+        # LRU: порядок использования; LFU: частота -> ключи в порядке вставки
+        self._order: "OrderedDict[Hashable, None]" = OrderedDict()
+        self._freq: Dict[Hashable, int] = {}
+        self._buckets: Dict[int, "OrderedDict[Hashable, None]"] = defaultdict(OrderedDict)
+        self._min_freq = 0
+        self._bytes = 0
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def _touch(self, key: Hashable) -> None:
+        """Обновление позиции ключа при обращении"""
+        if self.policy == "lru":
+            self._order.move_to_end(key)
+            return
+
+        freq = self._freq[key]
+        bucket = self._buckets[freq]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[freq]
+            if self._min_freq == freq:
+                self._min_freq = freq + 1
+        self._freq[key] = freq + 1
+        self._buckets[freq + 1][key] = None
+
+    def _link(self, key: Hashable) -> None:
+        """Регистрация нового ключа в структуре вытеснения"""
+        if self.policy == "lru":
+            self._order[key] = None
+        else:
+            self._freq[key] = 1
+            self._buckets[1][key] = None
+            self._min_freq = 1
+
+    def _unlink(self, key: Hashable) -> None:
+        """Удаление ключа из структуры вытеснения"""
+        if self.policy == "lru":
+            del self._order[key]
+            return
+
+        freq = self._freq.pop(key)
+        bucket = self._buckets[freq]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[freq]
+
+    def _victim(self) -> Hashable:
+        """Ключ, который будет вытеснен следующим"""
+        if self.policy == "lru":
+            return next(iter(self._order))
+
+        if self._min_freq not in self._buckets:
+            self._min_freq = min(self._buckets)
+        return next(iter(self._buckets[self._min_freq]))
+
+    def _remove(self, key: Hashable) -> None:
+        """Удаление записи с учетом занимаемой памяти"""
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        self._unlink(key)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Получение значения с учетом попаданий и промахов"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+            self._remove(key)
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self._touch(key)
+        return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Сохранение значения с вытеснением лишних записей"""
+        if key in self._entries:
+            self._remove(key)
+
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        # Место освобождается до добавления: иначе в LFU новый ключ с
+        # частотой 1 сам оказался бы первым кандидатом на вытеснение
+        while self._entries and (
+            len(self._entries) >= self.max_entries
+            or (self.max_bytes is not None and self._bytes + size > self.max_bytes)
+        ):
+            self._remove(self._victim())
+            self.evictions += 1
+
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._entries[key] = (value, size, expires_at)
+        self._bytes += size
+        self._link(key)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Удаление записи, если она есть"""
+        if key in self._entries:
+            self._remove(key)
+
+    def clear(self) -> None:
+        """Очистка кэша без сброса счетчиков"""
+        self._entries.clear()
+        self._order.clear()
+        self._freq.clear()
+        self._buckets.clear()
+        self._min_freq = 0
+        self._bytes = 0
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+        cacheable: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """Значение из кэша или результат единственной загрузки ключа
+
+        Если cacheable вернул False, результат получают все ожидающие,
+        но в кэш он не сохраняется.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+
+        while True:
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except _LoadAbandoned:
+                # Начавший загрузку запрос отменен, сами ожидающие - нет:
+                # загрузку заново начинает первый из них, остальные ждут его
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.set_exception(_LoadAbandoned())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Помечаем исключение полученным, даже если ожидающих нет
+            future.exception()
+            raise
+        else:
+            if cacheable is None or cacheable(value):
+                self.put(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики для подбора размера кэша"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "coalesced": self.coalesced,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "inflight": len(self._inflight),
+        }
@@ -0,0 +1,191 @@
+import json
+import os
+import sys
+from typing import Any, Callable, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from unified_data import SCHEMA, UnifiedIPBatch
+
+
+def combined_record(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Объединенная запись результата поиска для колоночных форматов"""
+    return result.get("combined", result)
+
+
+class OutputSink:
+    """Приемник результатов поиска, заполняемый по мере их готовности"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+
+    def write(self, result: Dict[str, Any]) -> None:
+        """Запись одного результата"""
+        raise NotImplementedError
+
+    def write_batch(self, batch: UnifiedIPBatch) -> None:
+        """Запись колоночного набора записей"""
+        for row in batch.to_dicts():
+            self.write(row)
+
+    def flush(self) -> None:
+        """Сброс накопленных данных на диск"""
+
+    def close(self) -> None:
+        """Сброс данных и закрытие файла"""
+        self.flush()
+
+    def __enter__(self) -> "OutputSink":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+class JsonLinesSink(OutputSink):
+    """Дописываемый файл JSON Lines: один результат целиком на строку
+
+    Путь "-" означает стандартный вывод.
+    """
+
+    def __init__(self, path: str, flush_every: int = 1000):
+        super().__init__(path)
+        self.flush_every = flush_every
+        self._file = sys.stdout if path == "-" else open(path, "a", encoding="utf-8")
+
+    def write(self, result: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(result, ensure_ascii=False))
+        self._file.write("\n")
+        self.count += 1
+        if self.count % self.flush_every == 0:
+            self._file.flush()
+
+    def write_batch(self, batch: UnifiedIPBatch) -> None:
+        self._file.write(batch.to_json_lines())
+        self.count += len(batch)
+
+    def flush(self) -> None:
+        if not self._file.closed:
+            self._file.flush()
+
+    def close(self) -> None:
+        if self._file is sys.stdout:
+            self._file.flush()
+        elif not self._file.closed:
+            self._file.close()
+
+
+class ColumnarSink(OutputSink):
+    """Общая часть колоночных приемников
+
+    Записи копятся в памяти и сбрасываются блоками по row_group_size строк
+    со схемой unified_data.SCHEMA. record выбирает из результата поиска
+    сохраняемую запись, по умолчанию объединенные данные.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        row_group_size: int = 50000,
+        record: Callable[[Dict[str, Any]], Dict[str, Any]] = combined_record,
+    ):
+        super().__init__(path)
+        self.row_group_size = row_group_size
+        self.record = record
+        self._rows: List[Dict[str, Any]] = []
+        self._closed = False
+
+    def write(self, result: Dict[str, Any]) -> None:
+        self._rows.append(self.record(result))
+        self.count += 1
+        if len(self._rows) >= self.row_group_size:
+            self.flush()
+
+    def write_batch(self, batch: UnifiedIPBatch) -> None:
+        self.flush()
+        self._write_table(batch.to_arrow())
+        self.count += len(batch)
+
+    def flush(self) -> None:
+        if self._rows:
+            table = UnifiedIPBatch.from_records(self._rows).to_arrow()
+            self._rows = []
+            self._write_table(table)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self.flush()
+        self._close_writer()
+        self._closed = True
+
+    def _write_table(self, table: pa.Table) -> None:
+        raise NotImplementedError
+
+    def _close_writer(self) -> None:
+        raise NotImplementedError
+
+
+class ParquetSink(ColumnarSink):
+    """Parquet: каждый сброс записывается отдельной группой строк"""
+
+    def __init__(self, path: str, compression: str = "zstd", **kwargs):
+        super().__init__(path, **kwargs)
+        self._writer = pq.ParquetWriter(path, SCHEMA, compression=compression)
+
+    def _write_table(self, table: pa.Table) -> None:
+        self._writer.write_table(table, row_group_size=max(table.num_rows, 1))
+
+    def _close_writer(self) -> None:
+        self._writer.close()
+
+
+class ArrowStreamSink(ColumnarSink):
+    """Потоковый формат Arrow IPC: каждый сброс - отдельный RecordBatch"""
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(path, **kwargs)
+        self._file = pa.OSFile(path, "wb")
+        self._writer = pa.ipc.new_stream(self._file, SCHEMA)
+
+    def _write_table(self, table: pa.Table) -> None:
+        self._writer.write_table(table)
+
+    def _close_writer(self) -> None:
+        self._writer.close()
+        self._file.close()
+
+
+SINKS = {
+    "jsonl": JsonLinesSink,
+    "parquet": ParquetSink,
+    "arrow": ArrowStreamSink,
+}
+
+# Расширения файлов для определения формата по пути
+EXTENSIONS = {
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+    ".arrows": "arrow",
+    ".ipc": "arrow",
+}
+
+
+def sink_format(path: str, format: Optional[str] = None) -> str:
+    """Формат вывода: заданный явно или по расширению файла"""
+    if format is None:
+        format = "jsonl" if path == "-" else EXTENSIONS.get(os.path.splitext(path)[1].lower())
+        if format is None:
+            raise ValueError(f"Не удалось определить формат вывода по имени {path}")
+    if format not in SINKS:
+        raise ValueError(f"Неизвестный формат вывода: {format}")
+    return format
+
+
+def open_sink(path: str, format: Optional[str] = None, **options) -> OutputSink:
+    """Приемник результатов по формату или расширению файла"""
+    return SINKS[sink_format(path, format)](path, **options)
@@ -0,0 +1,149 @@
+import ipaddress
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+# Поля, общие для всех адресов одного диапазона
+RANGE_FIELDS = (
+    "country",
+    "country_code",
+    "region",
+    "city",
+    "zip_code",
+    "latitude",
+    "longitude",
+    "timezone",
+    "isp",
+    "asn",
+    "organization",
+    "asn_organization",
+    "company",
+    "asn_type",
+    "is_anycast",
+    "abuse_email",
+    "ip_range",
+)
+
+_RANGE_SPLIT = re.compile(r"\s*[-–]\s*")
+
+
+def parse_ip_range(ip_range: str) -> List[IPNetwork]:
+    """Разбор диапазона в виде CIDR, "начало - конец" или одиночного адреса"""
+    ip_range = ip_range.strip()
+    if "/" in ip_range:
+        return [ipaddress.ip_network(ip_range, strict=False)]
+
+    parts = _RANGE_SPLIT.split(ip_range)
+    if len(parts) == 2:
+        first = ipaddress.ip_address(parts[0])
+        last = ipaddress.ip_address(parts[1])
+        return list(ipaddress.summarize_address_range(first, last))
+
+    return [ipaddress.ip_network(ip_range)]
+
+
+class RangeIndex:
+    """Индекс диапазонов IP для ответа на соседние адреса без запросов
+
+    Диапазоны раскладываются на CIDR-префиксы и хранятся в хэш-таблицах по
+    длине префикса с целочисленным ключом сети. Поиск проверяет известные
+    длины от самой длинной к короткой, поэтому находит наиболее точный
+    диапазон за число шагов не больше длины адреса в битах.
+
+    Хранится не больше max_entries префиксов: при переполнении вытесняется
+    префикс, к которому дольше всего не обращались (LRU).
+    """
+
+    def __init__(
+        self, min_prefixlen: Optional[Dict[int, int]] = None, max_entries: int = 100000
+    ):
+        # Слишком широкие диапазоны не индексируем: гео внутри них различается
+        self.min_prefixlen = min_prefixlen or {4: 16, 6: 32}
+        self.max_entries = max_entries
+        self._tables: Dict[int, Dict[int, Dict[int, Dict[str, Any]]]] = {4: {}, 6: {}}
+        self._prefixlens: Dict[int, List[int]] = {4: [], 6: []}
+        self._max_prefixlen = {4: 32, 6: 128}
+        # (версия, длина префикса, сеть) в порядке использования
+        self._order: "OrderedDict[Tuple[int, int, int], None]" = OrderedDict()
+
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def add_network(self, network: IPNetwork, fields: Dict[str, Any]) -> bool:
+        """Добавление одного префикса, возвращает False для слишком широких"""
+        version = network.version
+        if network.prefixlen < self.min_prefixlen[version]:
+            return False
+
+        tables = self._tables[version]
+        if network.prefixlen not in tables:
+            tables[network.prefixlen] = {}
+            self._prefixlens[version] = sorted(tables, reverse=True)
+        key = int(network.network_address)
+        tables[network.prefixlen][key] = fields
+        entry = (version, network.prefixlen, key)
+        self._order[entry] = None
+        self._order.move_to_end(entry)
+        while len(self._order) > self.max_entries:
+            self._evict()
+        return True
+
+    def _evict(self) -> None:
+        """Удаление префикса, к которому дольше всего не обращались"""
+        (version, prefixlen, key), _ = self._order.popitem(last=False)
+        tables = self._tables[version]
+        del tables[prefixlen][key]
+        if not tables[prefixlen]:
+            del tables[prefixlen]
+            self._prefixlens[version] = sorted(tables, reverse=True)
+        self.evictions += 1
+
+    def add(self, ip_range: str, fields: Dict[str, Any]) -> int:
+        """Добавление диапазона, возвращает количество проиндексированных префиксов"""
+        try:
+            networks = parse_ip_range(ip_range)
+        except ValueError:
+            return 0
+        return sum(self.add_network(network, fields) for network in networks)
+
+    def lookup(self, ip_address: str) -> Optional[Dict[str, Any]]:
+        """Поля наиболее точного диапазона, содержащего адрес, или None"""
+        try:
+            address = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return None
+
+        version = address.version
+        value = int(address)
+        bits = self._max_prefixlen[version]
+        tables = self._tables[version]
+        for prefixlen in self._prefixlens[version]:
+            network = value >> (bits - prefixlen) << (bits - prefixlen)
+            fields = tables[prefixlen].get(network)
+            if fields is not None:
+                self._order.move_to_end((version, prefixlen, network))
+                return fields
+        return None
+
+    def add_record(self, record: Dict[str, Any]) -> int:
+        """Индексация объединенной записи UnifiedIPData.to_dict() по ее ip_range"""
+        ip_range = record.get("ip_range")
+        ip_address = record.get("ip_address")
+        if not ip_range or record.get("range_derived"):
+            return 0
+
+        fields = {k: record[k] for k in RANGE_FIELDS if record.get(k) is not None}
+        try:
+            networks = parse_ip_range(ip_range)
+            address = ipaddress.ip_address(ip_address) if ip_address else None
+        except ValueError:
+            return 0
+
+        # Диапазон, не содержащий сам адрес, считаем ошибкой источника
+        if address is not None and not any(address in network for network in networks):
+            return 0
+        return sum(self.add_network(network, fields) for network in networks)
@@ -0,0 +1,360 @@
+import asyncio
+import bisect
+import contextvars
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Границы корзин гистограммы задержек, секунды
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+class SourceUnavailableError(Exception):
+    """Источник пропущен или не ответил вовремя"""
+
+
+class CircuitOpenError(SourceUnavailableError):
+    """Источник временно отключен автоматическим выключателем"""
+
+
+class SourceTimeoutError(SourceUnavailableError):
+    """Источник не ответил за адаптивный таймаут"""
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с окном последних значений для квантилей"""
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS, window: int = 200):
+        self.buckets = buckets
+        self.counts: List[int] = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._recent: Deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        """Учет одного измерения"""
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self._recent.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Квантиль по последним измерениям или None, если их нет"""
+        if not self._recent:
+            return None
+        values = sorted(self._recent)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    @property
+    def samples(self) -> int:
+        """Количество измерений в окне"""
+        return len(self._recent)
+
+
+class CircuitBreaker:
+    """Выключатель: после серии ошибок источник пропускается на время cool_down
+
+    По истечении cool_down пропускается один пробный запрос: при успехе
+    выключатель замыкается, при ошибке снова размыкается.
+    """
+
+    def __init__(self, failure_threshold: int = 5, cool_down: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cool_down = cool_down
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """Можно ли обращаться к источнику сейчас"""
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.cool_down:
+                return False
+            self.state = "half_open"
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def release(self) -> None:
+        """Освобождение пробного запроса без учета результата"""
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.trips += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def retry_in(self) -> float:
+        """Секунд до следующей попытки"""
+        return max(0.0, self.cool_down - (time.monotonic() - self.opened_at))
+
+
+class CallClock:
+    """Часы одного вызова источника, которые не идут в очереди за ресурсом
+
+    Пока вызов ждет общий ресурс (страницу пула браузеров), срок таймаута
+    отодвигается, а время ожидания не входит в задержку источника.
+    Ожидания нескольких попыток одного вызова могут пересекаться, время
+    считается один раз.
+    """
+
+    def __init__(self, deadline: asyncio.Timeout):
+        self.deadline: Optional[asyncio.Timeout] = deadline
+        self._waited = 0.0
+        self._waiting = 0
+        self._wait_started = 0.0
+        self._remaining: Optional[float] = None
+
+    @property
+    def waited(self) -> float:
+        """Секунд в очереди, включая текущее ожидание"""
+        if self._waiting:
+            return self._waited + time.monotonic() - self._wait_started
+        return self._waited
+
+    def pause(self) -> None:
+        self._waiting += 1
+        if self._waiting > 1:
+            return
+        self._wait_started = time.monotonic()
+        when = self.deadline.when() if self.deadline is not None else None
+        if when is not None:
+            self._remaining = when - asyncio.get_running_loop().time()
+            self.deadline.reschedule(None)
+
+    def resume(self) -> None:
+        self._waiting -= 1
+        if self._waiting:
+            return
+        self._waited += time.monotonic() - self._wait_started
+        if self._remaining is not None and self.deadline is not None:
+            self.deadline.reschedule(asyncio.get_running_loop().time() + self._remaining)
+        self._remaining = None
+
+    def close(self) -> None:
+        """Конец вызова: отмененные попытки больше не двигают срок"""
+        self.deadline = None
+
+
+_call_clock: contextvars.ContextVar[Optional[CallClock]] = contextvars.ContextVar(
+    "source_call_clock", default=None
+)
+
+
+@contextmanager
+def queue_wait() -> Iterator[None]:
+    """Ожидание общего ресурса вне таймаута и задержки текущего источника"""
+    clock = _call_clock.get()
+    if clock is None:
+        yield
+        return
+    clock.pause()
+    try:
+        yield
+    finally:
+        clock.resume()
+
+
+class SourceGuard:
+    """Защита вызовов одного источника
+
+    Таймаут подстраивается под p95 успешных ответов (timeout_multiplier *
+    p95 в пределах min_timeout..max_timeout), выключатель пропускает
+    источник после серии ошибок, а при hedge=True запрос, не ответивший за
+    p95, дублируется второй попыткой - побеждает первый успешный ответ.
+    Ожидание внутри queue_wait() не входит ни в таймаут, ни в задержку.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_timeout: float = 20.0,
+        min_timeout: float = 2.0,
+        max_timeout: float = 30.0,
+        timeout_multiplier: float = 2.0,
+        min_samples: int = 20,
+        hedge: bool = False,
+        hedge_after: Optional[float] = None,
+        failure_threshold: int = 5,
+        cool_down: float = 30.0,
+    ):
+        self.name = name
+        self.initial_timeout = initial_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.min_samples = min_samples
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+
+        self.histogram = LatencyHistogram()
+        self.breaker = CircuitBreaker(failure_threshold, cool_down)
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.hedged = 0
+
+    def timeout(self) -> float:
+        """Текущий адаптивный таймаут"""
+        if self.histogram.samples < self.min_samples:
+            return self.initial_timeout
+        p95 = self.histogram.quantile(0.95)
+        return min(self.max_timeout, max(self.min_timeout, p95 * self.timeout_multiplier))
+
+    def hedge_delay(self) -> Optional[float]:
+        """Задержка перед дублирующей попыткой или None"""
+        if not self.hedge:
+            return None
+        if self.hedge_after is not None:
+            return self.hedge_after
+        if self.histogram.samples < self.min_samples:
+            return None
+        return self.histogram.quantile(0.95)
+
+    async def _attempt(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        is_failure: Optional[Callable[[T], bool]],
+    ) -> T:
+        """Вызов с необязательной дублирующей попыткой"""
+        delay = self.hedge_delay()
+        first = asyncio.ensure_future(fn())
+        if delay is None:
+            return await first
+
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        self.hedged += 1
+        tasks = {first, asyncio.ensure_future(fn())}
+        result: Any = None
+        error: Optional[BaseException] = None
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    result = task.result()
+                    if is_failure is None or not is_failure(result):
+                        return result
+            # Обе попытки неудачны: возвращаем последний ответ с ошибкой
+            if result is not None:
+                return result
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        is_failure: Optional[Callable[[T], bool]] = None,
+    ) -> T:
+        """Вызов источника через выключатель, таймаут и дублирование"""
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise CircuitOpenError(
+                f"{self.name}: источник отключен, повтор через {self.breaker.retry_in():.0f} с"
+            )
+
+        self.calls += 1
+        timeout = self.timeout()
+        started = time.monotonic()
+        clock: Optional[CallClock] = None
+        try:
+            async with asyncio.timeout(timeout) as deadline:
+                clock = CallClock(deadline)
+                token = _call_clock.set(clock)
+                try:
+                    result = await self._attempt(fn, is_failure)
+                finally:
+                    clock.close()
+                    _call_clock.reset(token)
+        except TimeoutError:
+            self.timeouts += 1
+            self.failures += 1
+            self.breaker.record_failure()
+            raise SourceTimeoutError(f"{self.name}: нет ответа за {timeout:.1f} с")
+        except asyncio.CancelledError:
+            # Отмена вызывающей стороной не говорит о состоянии источника
+            self.breaker.release()
+            raise
+        except Exception:
+            self.failures += 1
+            self.breaker.record_failure()
+            raise
+
+        if is_failure is not None and is_failure(result):
+            self.failures += 1
+            self.breaker.record_failure()
+        else:
+            # Задержки учитываем только для успешных ответов, иначе таймаут
+            # мертвого источника рос бы вместе с его же таймаутами
+            self.histogram.observe(time.monotonic() - started - clock.waited)
+            self.breaker.record_success()
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Состояние и счетчики источника"""
+        return {
+            "state": self.breaker.state,
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "hedged": self.hedged,
+            "trips": self.breaker.trips,
+            "timeout": self.timeout(),
+            "p50": self.histogram.quantile(0.5),
+            "p95": self.histogram.quantile(0.95),
+        }
+
+
+_guards: Dict[str, SourceGuard] = {}
+_guard_settings: Dict[str, Dict[str, Any]] = {}
+
+
+def configure_guard(source: str, **settings) -> SourceGuard:
+    """Настройка защиты источника, накопленная статистика сбрасывается"""
+    _guard_settings[source] = settings
+    _guards[source] = SourceGuard(source, **settings)
+    return _guards[source]
+
+
+def get_guard(source: str) -> SourceGuard:
+    """Защита источника, создается при первом обращении"""
+    guard = _guards.get(source)
+    if guard is None:
+        guard = _guards[source] = SourceGuard(source, **_guard_settings.get(source, {}))
+    return guard
+
+
+def reset_guards() -> None:
+    """Сброс статистики и состояния всех защит, настройки сохраняются"""
+    _guards.clear()
+
+
+def all_guards() -> Dict[str, SourceGuard]:
+    """Все созданные защиты источников"""
+    return dict(_guards)
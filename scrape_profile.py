@@ -0,0 +1,96 @@
+from dataclasses import dataclass, field, replace
+from typing import Dict, FrozenSet, Optional, Tuple
+from urllib.parse import urlsplit
+
+# Типы ресурсов, не влияющие на извлекаемые поля
+DEFAULT_BLOCKED_RESOURCE_TYPES = frozenset({"image", "media", "font", "stylesheet"})
+
+# Реклама, аналитика и карты: сторонние домены, которые только замедляют загрузку
+DEFAULT_BLOCKED_DOMAINS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "googlesyndication.com",
+    "googleadservices.com",
+    "doubleclick.net",
+    "adservice.google.com",
+    "facebook.net",
+    "facebook.com",
+    "hotjar.com",
+    "clarity.ms",
+    "cloudflareinsights.com",
+    "quantserve.com",
+    "scorecardresearch.com",
+    "openstreetmap.org",
+    "tile.openstreetmap.org",
+)
+
+
+def _domain_matches(host: str, domains: Tuple[str, ...]) -> bool:
+    """Совпадение хоста с доменом или его поддоменом"""
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+
+@dataclass(frozen=True)
+class ScrapeProfile:
+    """Настройки загрузки страниц одного источника"""
+
+    name: str
+    device: Optional[str] = None
+    blocked_resource_types: FrozenSet[str] = DEFAULT_BLOCKED_RESOURCE_TYPES
+    blocked_domains: Tuple[str, ...] = DEFAULT_BLOCKED_DOMAINS
+    # Если задано, загружаются только ресурсы этих доменов
+    allowed_domains: Optional[Tuple[str, ...]] = None
+    wait_until: str = "domcontentloaded"
+    goto_timeout: int = 15000
+    selector_timeout: int = 10000
+    type_delay: int = 0
+    extra_http_headers: Dict[str, str] = field(default_factory=dict)
+
+    def is_blocked(self, url: str, resource_type: str) -> bool:
+        """Нужно ли отменить загрузку ресурса"""
+        if resource_type in self.blocked_resource_types:
+            return True
+
+        host = urlsplit(url).hostname or ""
+        if _domain_matches(host, self.blocked_domains):
+            return True
+        if self.allowed_domains is not None and resource_type != "document":
+            return not _domain_matches(host, self.allowed_domains)
+        return False
+
+    async def apply(self, context) -> None:
+        """Установка перехвата запросов для контекста браузера"""
+        if self.extra_http_headers:
+            await context.set_extra_http_headers(self.extra_http_headers)
+
+        if not (self.blocked_resource_types or self.blocked_domains or self.allowed_domains):
+            return
+
+        async def handle(route):
+            request = route.request
+            if self.is_blocked(request.url, request.resource_type):
+                await route.abort()
+            else:
+                await route.continue_()
+
+        await context.route("**/*", handle)
+
+
+# Профили источников. ipapi.com работает через JS, поэтому скрипты не блокируем
+PROFILES: Dict[str, ScrapeProfile] = {
+    "ipapi.com": ScrapeProfile(name="ipapi.com", device="Desktop Firefox"),
+    "ipinfo.io": ScrapeProfile(name="ipinfo.io"),
+    "db-ip.com": ScrapeProfile(name="db-ip.com"),
+    "whatismyipaddress.com": ScrapeProfile(name="whatismyipaddress.com"),
+}
+
+
+def get_profile(source: str) -> ScrapeProfile:
+    """Профиль источника или профиль по умолчанию"""
+    return PROFILES.get(source) or ScrapeProfile(name=source)
+
+
+def configure_profile(source: str, **changes) -> ScrapeProfile:
+    """Изменение настроек профиля источника"""
+    PROFILES[source] = replace(get_profile(source), **changes)
+    return PROFILES[source]
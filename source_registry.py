@@ -0,0 +1,171 @@
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Поля записи, не участвующие в объединении источников
+SERVICE_FIELDS = ("source",)
+
+
+def to_float(value: Any) -> Optional[float]:
+    """Число с плавающей точкой или None"""
+    return float(value) if value not in (None, "") else None
+
+
+def to_int(value: Any) -> Optional[int]:
+    """Целое число с удалением разделителей разрядов или None"""
+    if value in (None, ""):
+        return None
+    if isinstance(value, str):
+        value = value.replace(",", "")
+    return int(value)
+
+
+def coordinate(index: int) -> Callable[[Any], Optional[float]]:
+    """Координата с номером index из строки вида 'широта, долгота'"""
+
+    def convert(value: Any) -> Optional[float]:
+        if not value:
+            return None
+        parts = str(value).split(",")
+        if len(parts) < 2:
+            return None
+        return float(parts[index].strip())
+
+    return convert
+
+
+def is_empty(value: Any) -> bool:
+    """Значение отсутствует и не должно перекрывать другие источники"""
+    return value is None or value == ""
+
+
+@dataclass(frozen=True)
+class FieldMapping:
+    """Поле унифицированной записи из поля сырых данных источника
+
+    priority переопределяет приоритет источника для этого поля.
+    """
+
+    target: str
+    key: str
+    convert: Optional[Callable[[Any], Any]] = None
+    priority: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class SourceSpec:
+    """Описание источника: загрузка, соответствие полей и приоритет"""
+
+    name: str
+    fetcher: Callable[[str], Awaitable[Dict]]
+    fields: Tuple[FieldMapping, ...]
+    priority: int = 0
+
+    def field_priority(self, target: str) -> int:
+        """Приоритет источника для поля"""
+        for mapping in self.fields:
+            if mapping.target == target and mapping.priority is not None:
+                return mapping.priority
+        return self.priority
+
+
+class SourceRegistry:
+    """Реестр источников с табличным преобразованием и объединением записей
+
+    Для каждого набора источников один раз строится план объединения:
+    для каждого поля - источники в порядке убывания приоритета. Объединение
+    берет первое непустое значение по плану без ветвлений по полям.
+    """
+
+    def __init__(self, fields: Iterable[str]):
+        self.fields = tuple(name for name in fields if name not in SERVICE_FIELDS)
+        self._sources: Dict[str, SourceSpec] = {}
+        self._plans: Dict[Tuple[str, ...], Tuple[Tuple[str, Tuple[str, ...]], ...]] = {}
+
+    def register(self, spec: SourceSpec) -> SourceSpec:
+        """Добавление или замена источника"""
+        unknown = [m.target for m in spec.fields if m.target not in self.fields]
+        if unknown:
+            raise ValueError(f"{spec.name}: неизвестные поля {', '.join(unknown)}")
+        self._sources[spec.name] = spec
+        self._plans.clear()
+        return spec
+
+    def unregister(self, name: str) -> None:
+        """Удаление источника"""
+        del self._sources[name]
+        self._plans.clear()
+
+    def __getitem__(self, name: str) -> SourceSpec:
+        return self._sources[name]
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._sources
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._sources)
+
+    def __len__(self) -> int:
+        return len(self._sources)
+
+    def transform(self, name: str, raw: Dict[str, Any]) -> Dict[str, Any]:
+        """Преобразование сырых данных источника в поля унифицированной записи
+
+        Значения, которые не удалось преобразовать, пропускаются.
+        """
+        if "error" in raw:
+            return {"error": raw["error"]}
+
+        data = {}
+        for mapping in self._sources[name].fields:
+            value = raw.get(mapping.key)
+            if mapping.convert is not None:
+                try:
+                    value = mapping.convert(value)
+                except (ValueError, TypeError, AttributeError, IndexError):
+                    value = None
+            if not is_empty(value):
+                data[mapping.target] = value
+        return data
+
+    def _priority(self, source: str, target: str) -> int:
+        spec = self._sources.get(source)
+        return spec.field_priority(target) if spec is not None else 0
+
+    def merge_plan(self, sources: Iterable[str]) -> Tuple[Tuple[str, Tuple[str, ...]], ...]:
+        """План объединения: поле и источники по убыванию приоритета"""
+        key = tuple(sources)
+        plan = self._plans.get(key)
+        if plan is None:
+            # sorted устойчива: при равном приоритете сохраняется порядок источников
+            plan = tuple(
+                (target, tuple(sorted(key, key=lambda s: -self._priority(s, target))))
+                for target in self.fields
+            )
+            self._plans[key] = plan
+        return plan
+
+    def merge(self, records: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """Объединение записей источников: source -> поля записи"""
+        return self.merge_batch([records])[0]
+
+    def merge_batch(self, batch: List[Dict[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Объединение записей для множества IP
+
+        Записи с одинаковым набором источников объединяются по общему плану
+        поле за полем, по всей группе сразу.
+        """
+        merged: List[Dict[str, Any]] = [{} for _ in batch]
+        groups: Dict[Tuple[str, ...], List[int]] = {}
+        for i, records in enumerate(batch):
+            groups.setdefault(tuple(records), []).append(i)
+
+        for sources, rows in groups.items():
+            for target, order in self.merge_plan(sources):
+                for i in rows:
+                    records = batch[i]
+                    for source in order:
+                        value = records[source].get(target)
+                        if not is_empty(value):
+                            merged[i][target] = value
+                            break
+        return merged
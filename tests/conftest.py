@@ -0,0 +1,26 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+# Модули проекта лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    """Движок поиска из ip-text.py без постоянного кэша и локальной базы"""
+    from geo_db import configure_geo_database
+    from lookup_cache import configure_lookup_cache
+    from range_index import RangeIndex
+    from resilience import reset_guards
+
+    engine = importlib.import_module("ip-text")
+    configure_lookup_cache(None)
+    configure_geo_database(None)
+    reset_guards()
+    monkeypatch.setattr(engine, "range_index", RangeIndex())
+    engine.configure_unified_memo(max_entries=1000, max_bytes=None, ttl=600)
+    yield engine
+    reset_guards()
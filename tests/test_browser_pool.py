@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+import browser_pool
+from browser_pool import BrowserPool
+
+
+class FakePage:
+    def is_closed(self):
+        return False
+
+
+class FakeContext:
+    def __init__(self, browser):
+        self.browser = browser
+
+    def set_default_timeout(self, timeout):
+        pass
+
+    def set_default_navigation_timeout(self, timeout):
+        pass
+
+    async def new_page(self):
+        return FakePage()
+
+    async def close(self):
+        pass
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.closed = False
+
+    def is_connected(self):
+        return not self.closed
+
+    async def new_context(self, **options):
+        return FakeContext(self)
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeChromium:
+    def __init__(self):
+        self.launched = []
+
+    async def launch(self, **options):
+        self.launched.append(FakeBrowser())
+        return self.launched[-1]
+
+
+class FakePlaywright:
+    def __init__(self):
+        self.chromium = FakeChromium()
+        self.devices = {}
+
+    async def start(self):
+        return self
+
+    async def stop(self):
+        pass
+
+
+@pytest.fixture
+def playwright(monkeypatch):
+    fake = FakePlaywright()
+    monkeypatch.setattr(browser_pool, "async_playwright", lambda: fake)
+    return fake
+
+
+def test_pool_reuses_browser(playwright):
+    async def scenario():
+        pool = BrowserPool(browsers=1, contexts_per_browser=2)
+        for _ in range(3):
+            async with pool.page():
+                pass
+        await pool.close()
+
+    asyncio.run(scenario())
+    assert len(playwright.chromium.launched) == 1
+
+
+def test_relaunch_starts_browser_per_lease(playwright):
+    async def scenario():
+        pool = BrowserPool(browsers=2, contexts_per_browser=1, relaunch=True)
+        await pool.start()
+        assert playwright.chromium.launched == []
+        for _ in range(3):
+            async with pool.page():
+                pass
+        await pool.close()
+
+    asyncio.run(scenario())
+    launched = playwright.chromium.launched
+    assert len(launched) == 3
+    assert all(browser.closed for browser in launched)
+
+
+def test_relaunch_requires_one_context_per_browser():
+    with pytest.raises(ValueError):
+        BrowserPool(contexts_per_browser=4, relaunch=True)
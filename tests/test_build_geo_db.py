@@ -0,0 +1,112 @@
+import ipaddress
+
+from build_geo_db import GeoDatabaseBuilder, extract_records, flatten_ranges, normalize_record
+from geo_db import GeoDatabase
+
+
+def span(network):
+    network = ipaddress.ip_network(network)
+    return int(network.network_address), int(network.broadcast_address)
+
+
+def test_normalize_record_maps_raw_source_fields():
+    record = normalize_record(
+        {
+            "asn_number": "AS15169",
+            "coordinates": "37.4056, -122.0775",
+            "postal_code": "94043",
+            "city": " Mountain View ",
+            "is_anycast": "yes",
+            "source": "whatismyipaddress.com",
+        }
+    )
+
+    assert record == {
+        "asn": "AS15169",
+        "zip_code": "94043",
+        "city": "Mountain View",
+        "latitude": 37.4056,
+        "longitude": -122.0775,
+    }
+    assert normalize_record({"latitude": "1.5", "coordinates": "10, 20"}) == {
+        "latitude": 1.5,
+        "longitude": 20.0,
+    }
+    assert normalize_record({"coordinates": "north, east"}) == {}
+
+
+def test_extract_records_reads_all_result_shapes():
+    snapshot = {
+        "combined_data": {
+            "ip_address": "8.8.8.8",
+            "sources": {
+                "ipinfo.io": {"city": "Mountain View", "ip_range": "8.8.8.0/24"},
+                "ipapi.com": {"error": "timeout", "city": "Nowhere"},
+                "whatismyipaddress.com": {"city": "Other", "asn_number": "AS15169"},
+            },
+        }
+    }
+    unified = {"combined": {"ip_address": "1.1.1.1", "country": "Australia"}}
+    derived = {"ip_address": "1.1.1.2", "country": "Australia", "range_derived": True}
+    range_only = {"ip_address": "1.1.1.3", "ip_range": "1.1.1.0/24"}
+
+    records = list(extract_records([snapshot, unified, derived, range_only, "noise"]))
+
+    assert records == [
+        ("8.8.8.8", {"city": "Mountain View", "ip_range": "8.8.8.0/24", "asn": "AS15169"}),
+        ("1.1.1.1", {"country": "Australia"}),
+    ]
+
+
+def test_flatten_ranges_lets_nested_ranges_override():
+    outer = span("10.0.0.0/8")
+    inner = span("10.1.0.0/16")
+    innermost = span("10.1.2.0/24")
+    disjoint = span("192.0.2.0/24")
+
+    ranges = flatten_ranges({outer: 0, inner: 1, innermost: 2, disjoint: 3})
+
+    assert ranges == [
+        (outer[0], inner[0] - 1, 0),
+        (inner[0], innermost[0] - 1, 1),
+        innermost + (2,),
+        (innermost[1] + 1, inner[1], 1),
+        (inner[1] + 1, outer[1], 0),
+        disjoint + (3,),
+    ]
+
+
+def test_flatten_ranges_merges_adjacent_ranges_of_one_record():
+    first = span("192.0.2.0/25")
+    second = span("192.0.2.128/25")
+
+    assert flatten_ranges({first: 5, second: 5}) == [(first[0], second[1], 5)]
+    assert flatten_ranges({first: 5, second: 6}) == [first + (5,), second + (6,)]
+
+
+def test_built_database_round_trip(tmp_path):
+    builder = GeoDatabaseBuilder()
+    builder.add("8.8.8.8", {"ip_range": "8.8.0.0/16", "country": "United States"})
+    builder.add("8.8.8.8", {"ip_range": "8.8.8.0/24", "city": "Mountain View", "latitude": 37.4})
+    builder.add("2001:4860::8888", {"ip_range": "2001:4860::/32", "asn": "AS15169"})
+    builder.add("192.0.2.1", {"is_anycast": True})
+    path = str(tmp_path / "ipgeo.db")
+
+    stats = builder.build(path)
+
+    assert stats["v4_ranges"] == 4
+    assert stats["v6_ranges"] == 1
+    with GeoDatabase(path) as db:
+        assert db.lookup("8.8.8.8") == {
+            "city": "Mountain View",
+            "ip_range": "8.8.8.0/24",
+            "latitude": 37.4,
+        }
+        assert db.lookup("8.8.4.4") == {"country": "United States", "ip_range": "8.8.0.0/16"}
+        assert db.lookup("192.0.2.1") == {"is_anycast": True}
+        assert db.lookup("192.0.2.2") is None
+        assert db.lookup("2001:4860:4860::8888") == {
+            "asn": "AS15169",
+            "ip_range": "2001:4860::/32",
+        }
+        assert db.lookup("2001:db8::1") is None
@@ -0,0 +1,60 @@
+import asyncio
+import os
+
+import aiohttp
+
+from fixtures import FixtureReplay, FixtureStore
+from http_sources import BASE_URLS, close_http_session
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "sources.har")
+
+
+def test_original_url_resolves_root_relative_paths():
+    replay = FixtureReplay(FixtureStore())
+    replay._schemes = {"ipinfo.io": "https"}
+    page = f"{replay.base_url}/ipinfo.io/8.8.8.8"
+
+    assert replay.original_url(page) == "https://ipinfo.io/8.8.8.8"
+    assert replay.original_url("https://cdn.example/app.js") == "https://cdn.example/app.js"
+    assert (
+        replay.original_url(f"{replay.base_url}/static/js/app.js", referer=page)
+        == "https://ipinfo.io/static/js/app.js"
+    )
+    assert replay.original_url(f"{replay.base_url}/static/js/app.js") == "/static/js/app.js"
+
+
+def test_replay_serves_recorded_sources(engine, monkeypatch):
+    store = FixtureStore.load(FIXTURES)
+    monkeypatch.setitem(engine.TRANSPORTS, "ipinfo.io", "http")
+    monkeypatch.setitem(engine.TRANSPORTS, "db-ip.com", "http")
+
+    async def scenario():
+        async with FixtureReplay(store) as replay:
+            assert BASE_URLS["ipinfo.io"] == f"{replay.base_url}/ipinfo.io"
+            try:
+                result = await engine.get_unified_ip_data(
+                    store.ips[0], sources=["ipinfo.io", "db-ip.com"]
+                )
+
+                # Ресурс страницы с путем от корня находится и по Referer, и по пути
+                async with aiohttp.ClientSession() as session:
+                    script = f"{replay.base_url}/static/js/app.js"
+                    referer = {"Referer": f"{replay.base_url}/ipinfo.io/8.8.8.8"}
+                    async with session.get(script, headers=referer) as response:
+                        assert response.status == 200
+                    async with session.get(script) as response:
+                        assert response.status == 200
+                    async with session.get(f"{replay.base_url}/db-ip.com/1.1.1.1") as response:
+                        assert response.status == 404
+            finally:
+                await close_http_session()
+        assert BASE_URLS["ipinfo.io"] == "https://ipinfo.io"
+        return result, replay.misses
+
+    result, misses = asyncio.run(scenario())
+    combined = result["combined"]
+    assert not combined.get("error")
+    assert combined["ip_range"] == "8.8.8.0/24"
+    assert combined["city"] == "Mountain View"
+    assert combined["abuse_email"] == "network-abuse@google.com"
+    assert misses == 1
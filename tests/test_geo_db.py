@@ -0,0 +1,72 @@
+import pytest
+
+from build_geo_db import GeoDatabaseBuilder
+from geo_db import GeoDatabase, configure_geo_database, get_geo_database
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    builder = GeoDatabaseBuilder()
+    builder.add("198.51.100.1", {"ip_range": "198.51.100.0/24", "country": "Germany"})
+    builder.add("203.0.113.1", {"ip_range": "203.0.113.0/25", "country": "Japan"})
+    builder.add("2001:db8::1", {"ip_range": "2001:db8::/48", "country": "France"})
+    path = str(tmp_path / "ipgeo.db")
+    builder.build(path)
+    yield path
+    configure_geo_database(None)
+
+
+def test_lookup_hits_and_misses(db_path):
+    with GeoDatabase(db_path) as db:
+        assert (db.v4_count, db.v6_count) == (2, 1)
+        assert db.lookup("198.51.100.0")["country"] == "Germany"
+        assert db.lookup("198.51.100.255")["country"] == "Germany"
+        assert db.lookup("203.0.113.127")["country"] == "Japan"
+        assert db.lookup("203.0.113.128") is None
+        assert db.lookup("198.51.101.0") is None
+        assert db.lookup("0.0.0.0") is None
+        assert db.lookup("255.255.255.255") is None
+        assert db.lookup("not-an-ip") is None
+
+
+def test_ipv4_and_ipv6_tables_are_separate(db_path):
+    with GeoDatabase(db_path) as db:
+        assert db.lookup("2001:db8:0:ffff::1")["country"] == "France"
+        assert db.lookup("2001:db8:1::1") is None
+        # Адрес IPv6 с тем же целым значением, что и IPv4 из базы, не находится
+        assert db.lookup("::c633:6401") is None
+        assert db.lookup("::ffff:198.51.100.1") is None
+
+
+@pytest.mark.parametrize(
+    "content",
+    [b"", b"IPGEODB1", b"NOTAGEODATABASE" * 10],
+    ids=["empty", "truncated-header", "bad-magic"],
+)
+def test_corrupt_file_is_rejected(tmp_path, content):
+    path = tmp_path / "broken.db"
+    path.write_bytes(content)
+
+    with pytest.raises(ValueError):
+        GeoDatabase(str(path))
+
+    assert configure_geo_database(str(path)) is None
+    assert get_geo_database() is None
+
+
+def test_truncated_tables_are_rejected(db_path, tmp_path):
+    with open(db_path, "rb") as f:
+        data = f.read()
+    path = tmp_path / "truncated.db"
+    path.write_bytes(data[:-8])
+
+    with pytest.raises(ValueError):
+        GeoDatabase(str(path))
+
+
+def test_missing_file_disables_database(db_path, tmp_path):
+    assert configure_geo_database(str(tmp_path / "missing.db")) is None
+
+    db = configure_geo_database(db_path)
+    assert db is get_geo_database()
+    assert db.lookup("198.51.100.7")["country"] == "Germany"
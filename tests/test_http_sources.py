@@ -0,0 +1,88 @@
+import asyncio
+import os
+
+from aiohttp import web
+
+import http_sources
+from http_sources import (
+    BASE_URLS,
+    close_http_session,
+    get_dbip_data_http,
+    get_ipinfo_data_http,
+    parse_html,
+)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+async def serve_fixtures(pages):
+    """Локальный сервер страниц: путь /{хост}/{ip} -> файл фикстуры"""
+
+    async def handle(request):
+        name = pages.get(request.path)
+        if name is None:
+            return web.Response(status=404, text="Not found")
+        return web.Response(text=read_fixture(name), content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+
+def test_http_sources_from_fixture_pages(monkeypatch):
+    pages = {
+        "/ipinfo.io/8.8.8.8": "ipinfo_8.8.8.8.html",
+        "/db-ip.com/8.8.8.8": "dbip_8.8.8.8.html",
+    }
+
+    async def scenario():
+        runner, base_url = await serve_fixtures(pages)
+        for name in ("ipinfo.io", "db-ip.com"):
+            monkeypatch.setitem(BASE_URLS, name, f"{base_url}/{name}")
+        try:
+            return (
+                await get_ipinfo_data_http("8.8.8.8"),
+                await get_dbip_data_http("8.8.8.8"),
+                await get_dbip_data_http("1.1.1.1"),
+            )
+        finally:
+            await close_http_session()
+            await runner.cleanup()
+
+    ipinfo, dbip, missing = asyncio.run(scenario())
+
+    assert ipinfo["asn_number"] == "AS15169"
+    assert ipinfo["ip_range"] == "8.8.8.0/24"
+    assert ipinfo["hosted_domains_count"] == 11273
+    assert ipinfo["is_anycast"] is True
+    assert ipinfo["abuse_email"] == "network-abuse@google.com"
+
+    assert dbip["isp"] == "Google LLC"
+    assert dbip["ip_version"] == "IPv4 Public"
+    assert dbip["city"] == "Mountain View"
+    assert dbip["timezone"] == "America/Los_Angeles"
+    assert (dbip["latitude"], dbip["longitude"]) == (37.4223, -122.085)
+    assert (dbip["is_crawler"], dbip["is_proxy"], dbip["is_attack_source"]) == (True, True, False)
+
+    assert missing["source"] == "db-ip.com"
+    assert "404" in missing["error"]
+
+
+def test_threat_columns_follow_cell_position():
+    # Отметка в четвертой ячейке не относится ни к одной проверке
+    html = (
+        "<div class='menu results shadow'><table><tr><th>ISP</th><td>X</td></tr></table></div>"
+        "<table><tr><td></td><td><i class='fa-times text-success'></i></td><td></td>"
+        "<td><i class='fa-times text-success'></i></td></tr></table>"
+    )
+    data = http_sources.extract_dbip(parse_html(html))
+    assert (data["is_crawler"], data["is_proxy"], data["is_attack_source"]) == (False, True, False)
@@ -0,0 +1,84 @@
+import asyncio
+import io
+import json
+
+import pytest
+
+from ip_inputs import dedupe, iter_csv, iter_jsonl, iterate_in_thread, parse_ip, read_ips
+
+
+def test_iter_csv_uses_default_columns():
+    data = "src_ip,port,dst_ip\n8.8.8.8,53,1.1.1.1\n9.9.9.9,53\n"
+
+    assert list(iter_csv(io.StringIO(data))) == ["8.8.8.8", "1.1.1.1", "9.9.9.9"]
+
+
+def test_iter_csv_selects_columns():
+    data = "a,b,c\n1,2,3\n4,5,6\n"
+
+    assert list(iter_csv(io.StringIO(data), ["c", "a"])) == ["3", "1", "6", "4"]
+    # Без известных колонок берутся все ячейки
+    assert list(iter_csv(io.StringIO(data))) == ["1", "2", "3", "4", "5", "6"]
+    assert list(iter_csv(io.StringIO(""))) == []
+
+
+def test_iter_csv_missing_column_is_an_error():
+    with pytest.raises(ValueError, match="nope"):
+        list(iter_csv(io.StringIO("a,b\n1,2\n"), ["a", "nope"]))
+
+
+def test_iter_jsonl_reads_fields_and_bare_values():
+    lines = [
+        json.dumps({"src_ip": "8.8.8.8", "dst_ip": "1.1.1.1", "port": 53}),
+        "",
+        json.dumps("9.9.9.9"),
+        json.dumps({"host": "208.67.222.222"}),
+    ]
+    text = "\n".join(lines) + "\n"
+
+    assert list(iter_jsonl(io.StringIO(text))) == ["8.8.8.8", "1.1.1.1", "9.9.9.9"]
+    assert list(iter_jsonl(io.StringIO(text), ["host"])) == ["9.9.9.9", "208.67.222.222"]
+
+
+@pytest.mark.parametrize(
+    "value, public, any_ip",
+    [
+        ("8.8.8.8", "8.8.8.8", "8.8.8.8"),
+        (" 2001:4860:4860:0:0:0:0:8888 ", "2001:4860:4860::8888", "2001:4860:4860::8888"),
+        ("10.0.0.1", None, "10.0.0.1"),
+        ("127.0.0.1", None, "127.0.0.1"),
+        ("fe80::1", None, "fe80::1"),
+        ("224.0.0.251", None, "224.0.0.251"),
+        ("not-an-ip", None, None),
+        ("", None, None),
+        (None, None, None),
+        (134744072, None, None),
+    ],
+)
+def test_parse_ip_filters_private_addresses(value, public, any_ip):
+    assert parse_ip(value) == public
+    assert parse_ip(value, include_private=True) == any_ip
+
+
+def test_dedupe_window():
+    assert list(dedupe(["a", "b", "a", "c", "b"], window=3)) == ["a", "b", "c"]
+
+    # "a" вытесняется из окна из двух значений и снова пропускается
+    assert list(dedupe(["a", "b", "c", "a"], window=2)) == ["a", "b", "c", "a"]
+    # Повтор обновляет позицию: вытесняется давно не встречавшийся "b"
+    assert list(dedupe(["a", "b", "a", "c", "a", "b"], window=2)) == ["a", "b", "c", "b"]
+
+
+def test_read_ips_combines_parsing_filter_and_dedupe(tmp_path):
+    path = tmp_path / "ips.csv"
+    path.write_text("ip\n8.8.8.8\n10.0.0.1\nbad\n8.8.8.8\n1.1.1.1\n", encoding="utf-8")
+
+    assert list(read_ips([str(path)])) == ["8.8.8.8", "1.1.1.1"]
+    assert list(read_ips([str(path)], include_private=True)) == ["8.8.8.8", "10.0.0.1", "1.1.1.1"]
+
+
+def test_iterate_in_thread_keeps_order():
+    async def collect():
+        return [item async for item in iterate_in_thread(iter(range(25)), chunk_size=10)]
+
+    assert asyncio.run(collect()) == list(range(25))
@@ -0,0 +1,13 @@
+import pytest
+
+import ipgeo
+
+
+def test_sources_are_validated_at_parsing(capsys):
+    parser = ipgeo.build_parser()
+    args = parser.parse_args(["enrich", "ips.txt", "--sources", "ipinfo.io, db-ip.com"])
+    assert args.sources == ["ipinfo.io", "db-ip.com"]
+
+    with pytest.raises(SystemExit):
+        parser.parse_args(["enrich", "ips.txt", "--sources", "ipinfo.io,nope"])
+    assert "Неизвестные источники: nope" in capsys.readouterr().err
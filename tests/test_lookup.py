@@ -0,0 +1,128 @@
+import asyncio
+
+from build_geo_db import GeoDatabaseBuilder
+from geo_db import configure_geo_database
+from source_registry import FieldMapping, SourceRegistry, SourceSpec
+from unified_data import FIELD_NAMES
+
+
+def make_sources(fast, slow):
+    sources = SourceRegistry(FIELD_NAMES)
+    sources.register(
+        SourceSpec(
+            "fast",
+            fast,
+            (FieldMapping("country", "country"), FieldMapping("ip_range", "ip_range")),
+            priority=10,
+        )
+    )
+    sources.register(
+        SourceSpec(
+            "slow",
+            slow,
+            (FieldMapping("city", "city"), FieldMapping("asn", "asn")),
+        )
+    )
+    return sources
+
+
+def test_partial_result_is_not_indexed(engine, monkeypatch):
+    async def fast(ip_address):
+        return {"country": "US", "ip_range": "203.0.113.0/24"}
+
+    async def slow(ip_address):
+        await asyncio.sleep(0.05)
+        return {"city": "Reston", "asn": "AS64500"}
+
+    monkeypatch.setattr(engine, "SOURCES", make_sources(fast, slow))
+
+    async def scenario():
+        partial = await engine.get_unified_ip_data("203.0.113.10", required_fields=["country"])
+        assert partial["pending"] == ["slow"]
+
+        neighbour = await engine.get_unified_ip_data("203.0.113.20")
+        assert "pending" not in neighbour
+        assert not neighbour["combined"].get("range_derived")
+        assert neighbour["combined"]["city"] == "Reston"
+
+        # Полный результат индексируется, следующий сосед отвечается из индекса
+        third = await engine.get_unified_ip_data("203.0.113.30")
+        assert third["combined"]["range_derived"]
+        assert third["combined"]["city"] == "Reston"
+
+    asyncio.run(scenario())
+
+
+def test_error_result_is_not_memoized(engine, monkeypatch):
+    calls = []
+
+    async def fast(ip_address):
+        calls.append(ip_address)
+        if len(calls) == 1:
+            raise RuntimeError("источник недоступен")
+        return {"country": "US", "ip_range": "198.51.100.0/24"}
+
+    monkeypatch.setattr(engine, "SOURCES", make_sources(fast, fast))
+
+    async def scenario():
+        failed = await engine.get_unified_ip_data("198.51.100.7", sources=["fast"])
+        assert failed["combined"].get("error")
+
+        # Повторный запрос снова идет в источник, а не получает ошибку из памяти
+        recovered = await engine.get_unified_ip_data("198.51.100.7", sources=["fast"])
+        assert not recovered["combined"].get("error")
+        assert recovered["combined"]["country"] == "US"
+        assert len(calls) == 2
+
+    asyncio.run(scenario())
+
+
+def test_unknown_source_gives_error_record(engine):
+    result = asyncio.run(engine.get_unified_ip_data("192.0.2.1", sources=["nope"]))
+    assert result["sources"]["nope"]["error"] == "Неизвестный источник: nope"
+    assert result["combined"].get("error")
+
+
+def test_local_answers_respect_required_fields_and_sources(engine, monkeypatch, tmp_path):
+    calls = []
+
+    async def fast(ip_address):
+        calls.append(("fast", ip_address))
+        return {"country": "US", "ip_range": "203.0.113.0/24"}
+
+    async def slow(ip_address):
+        calls.append(("slow", ip_address))
+        return {"city": "Reston", "asn": "AS64500"}
+
+    monkeypatch.setattr(engine, "SOURCES", make_sources(fast, slow))
+    builder = GeoDatabaseBuilder()
+    builder.add("198.51.100.1", {"ip_range": "198.51.100.0/24", "country": "DE"})
+    path = str(tmp_path / "ipgeo.db")
+    builder.build(path)
+    configure_geo_database(path)
+
+    async def scenario():
+        local = await engine.get_unified_ip_data("198.51.100.1")
+        assert list(local["sources"]) == ["geo-db"]
+        assert not calls
+
+        # В базе нет города: поиск продолжается по источникам
+        live = await engine.get_unified_ip_data("198.51.100.2", required_fields=["city"])
+        assert "geo-db" not in live["sources"]
+        assert live["combined"]["city"] == "Reston"
+
+        explicit = await engine.get_unified_ip_data("198.51.100.3", sources=["slow"])
+        assert list(explicit["sources"]) == ["slow"]
+
+        calls.clear()
+        await engine.get_unified_ip_data("203.0.113.1")
+        indexed = await engine.get_unified_ip_data("203.0.113.2", required_fields=["asn"])
+        assert indexed["combined"]["range_derived"]
+        explicit = await engine.get_unified_ip_data("203.0.113.3", sources=["slow"])
+        assert not explicit["combined"].get("range_derived")
+        assert calls == [("fast", "203.0.113.1"), ("slow", "203.0.113.1"), ("slow", "203.0.113.3")]
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        configure_geo_database(None)
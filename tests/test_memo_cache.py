@@ -0,0 +1,55 @@
+import asyncio
+
+from memo_cache import MemoCache
+
+
+def test_waiter_survives_cancelled_leader():
+    cache = MemoCache(max_entries=10, max_bytes=None)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def scenario():
+        leader = asyncio.create_task(cache.get_or_load("ip", loader))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(cache.get_or_load("ip", loader)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        results = await asyncio.gather(*waiters)
+        assert leader.cancelled()
+        # Один из ожидающих повторил загрузку, остальные получили ее результат
+        assert results == [2, 2, 2]
+        assert len(calls) == 2
+
+    asyncio.run(scenario())
+
+
+def test_lfu_admits_new_key_into_warm_cache():
+    cache = MemoCache(max_entries=2, max_bytes=None, policy="lfu")
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.get("b")
+    cache.get("b")
+
+    cache.put("c", 3)
+
+    assert "c" in cache
+    assert "b" in cache
+    assert "a" not in cache
+    assert len(cache) == 2
+
+
+def test_lru_evicts_least_recently_used():
+    cache = MemoCache(max_entries=2, max_bytes=None)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+
+    cache.put("c", 3)
+
+    assert {key for key in ("a", "b", "c") if key in cache} == {"a", "c"}
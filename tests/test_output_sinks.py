@@ -0,0 +1,48 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from output_sinks import ArrowStreamSink, ParquetSink
+from unified_data import SCHEMA, UnifiedIPBatch
+
+
+def plain_table():
+    """Таблица внешнего источника: строки без словаря, колонки не по порядку"""
+    return pa.table(
+        {
+            "country": ["US", "US", None],
+            "source": ["ipinfo", "dbip", "ipinfo"],
+            "ip_address": ["192.0.2.1", "192.0.2.2", "192.0.2.3"],
+            "latitude": [38.9, None, 51.5],
+        }
+    )
+
+
+def test_from_arrow_restores_schema():
+    table = UnifiedIPBatch.from_arrow(plain_table()).to_arrow()
+
+    assert table.schema.equals(SCHEMA)
+    assert pa.types.is_dictionary(table.schema.field("country").type)
+    assert not table.schema.field("ip_address").nullable
+    assert table.column("country").to_pylist() == ["US", "US", None]
+    assert table.column("city").null_count == 3
+
+
+@pytest.mark.parametrize("sink_class", [ParquetSink, ArrowStreamSink])
+def test_write_batch_round_trip(tmp_path, sink_class):
+    path = str(tmp_path / "out")
+    batch = UnifiedIPBatch.from_arrow(plain_table())
+    with sink_class(path) as sink:
+        sink.write_batch(batch)
+        sink.write({"combined": {"ip_address": "192.0.2.4", "source": "dbip", "city": "Paris"}})
+
+    if sink_class is ParquetSink:
+        table = pq.read_table(path)
+    else:
+        with pa.OSFile(path, "rb") as source:
+            table = pa.ipc.open_stream(source).read_all()
+
+    assert table.schema.equals(SCHEMA)
+    assert table.num_rows == 4
+    assert table.column("country").to_pylist() == ["US", "US", None, None]
+    assert table.column("city").to_pylist() == [None, None, None, "Paris"]
@@ -0,0 +1,89 @@
+import ipaddress
+
+import pytest
+
+from range_index import RangeIndex, parse_ip_range
+
+
+def test_parse_ip_range_forms():
+    assert parse_ip_range("8.8.8.0/24") == [ipaddress.ip_network("8.8.8.0/24")]
+    # Адрес хоста в CIDR приводится к сети
+    assert parse_ip_range(" 8.8.8.8/24 ") == [ipaddress.ip_network("8.8.8.0/24")]
+    assert parse_ip_range("192.0.2.0 - 192.0.2.255") == [ipaddress.ip_network("192.0.2.0/24")]
+    assert parse_ip_range("192.0.2.0–192.0.2.5") == [
+        ipaddress.ip_network("192.0.2.0/30"),
+        ipaddress.ip_network("192.0.2.4/31"),
+    ]
+    assert parse_ip_range("2001:db8::-2001:db8::ffff") == [
+        ipaddress.ip_network("2001:db8::/112")
+    ]
+    assert parse_ip_range("192.0.2.7") == [ipaddress.ip_network("192.0.2.7/32")]
+    with pytest.raises(ValueError):
+        parse_ip_range("192.0.2.9 - 192.0.2.1")
+    with pytest.raises(ValueError):
+        parse_ip_range("not a range")
+
+
+def test_lookup_prefers_longest_prefix():
+    index = RangeIndex()
+    index.add("10.1.0.0/16", {"city": "wide"})
+    index.add("10.1.2.0/24", {"city": "narrow"})
+    index.add("2001:db8::/48", {"city": "v6"})
+
+    assert index.lookup("10.1.2.3") == {"city": "narrow"}
+    assert index.lookup("10.1.3.3") == {"city": "wide"}
+    assert index.lookup("10.2.0.1") is None
+    assert index.lookup("2001:db8::1") == {"city": "v6"}
+    assert index.lookup("2001:db9::1") is None
+    assert index.lookup("not-an-ip") is None
+
+
+def test_ranges_below_min_prefixlen_are_rejected():
+    index = RangeIndex(min_prefixlen={4: 16, 6: 32})
+
+    assert index.add("10.0.0.0/8", {"city": "too wide"}) == 0
+    assert index.add("2001::/16", {"city": "too wide"}) == 0
+    assert index.add("10.0.0.0/16", {"city": "ok"}) == 1
+    assert len(index) == 1
+    assert index.lookup("10.5.0.1") is None
+
+
+def test_add_record_requires_range_to_contain_address():
+    index = RangeIndex()
+
+    assert index.add_record({"ip_address": "198.51.100.7", "ip_range": "203.0.113.0/24"}) == 0
+    assert index.add_record(
+        {"ip_address": "203.0.113.5", "ip_range": "203.0.113.0/24", "range_derived": True}
+    ) == 0
+    assert index.add_record({"ip_address": "203.0.113.5", "ip_range": "garbage"}) == 0
+    assert len(index) == 0
+
+    record = {
+        "ip_address": "203.0.113.5",
+        "ip_range": "203.0.113.0/24",
+        "city": "Reston",
+        "source": "combined",
+        "latitude": None,
+    }
+    assert index.add_record(record) == 1
+    assert index.lookup("203.0.113.200") == {"ip_range": "203.0.113.0/24", "city": "Reston"}
+
+
+def test_max_entries_evicts_least_recently_used():
+    index = RangeIndex(max_entries=2)
+    index.add("10.1.0.0/16", {"city": "a"})
+    index.add("10.2.0.0/24", {"city": "b"})
+    assert index.lookup("10.1.0.1") == {"city": "a"}
+
+    index.add("10.3.0.0/24", {"city": "c"})
+
+    assert len(index) == 2
+    assert index.evictions == 1
+    assert index.lookup("10.2.0.1") is None
+    assert index.lookup("10.1.0.1") == {"city": "a"}
+    assert index.lookup("10.3.0.1") == {"city": "c"}
+
+    # Повторное добавление того же префикса не занимает новое место
+    index.add("10.3.0.0/24", {"city": "c2"})
+    assert len(index) == 2
+    assert index.lookup("10.3.0.1") == {"city": "c2"}
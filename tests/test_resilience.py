@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from resilience import SourceGuard, SourceTimeoutError, queue_wait
+
+
+def test_queue_wait_is_outside_timeout_and_latency():
+    guard = SourceGuard("test", initial_timeout=0.2)
+
+    async def fetch():
+        with queue_wait():
+            await asyncio.sleep(0.4)
+        await asyncio.sleep(0.05)
+        return {"ok": True}
+
+    assert asyncio.run(guard.call(fetch)) == {"ok": True}
+    assert guard.timeouts == 0
+    assert guard.histogram.quantile(0.5) < 0.2
+
+
+def test_work_after_queue_wait_still_times_out():
+    guard = SourceGuard("test", initial_timeout=0.2)
+
+    async def fetch():
+        with queue_wait():
+            await asyncio.sleep(0.1)
+        await asyncio.sleep(0.4)
+
+    with pytest.raises(SourceTimeoutError):
+        asyncio.run(guard.call(fetch))
+    assert guard.timeouts == 1
+    assert guard.breaker.consecutive_failures == 1
+
+
+def test_overlapping_hedged_waits_count_once():
+    guard = SourceGuard("test", initial_timeout=1.0, hedge=True, hedge_after=0.05)
+
+    async def fetch():
+        with queue_wait():
+            await asyncio.sleep(0.3)
+        return {"ok": True}
+
+    assert asyncio.run(guard.call(fetch)) == {"ok": True}
+    assert guard.hedged == 1
+    assert guard.histogram.quantile(0.5) < 0.1
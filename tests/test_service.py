@@ -0,0 +1,180 @@
+import asyncio
+import os
+import re
+from collections import Counter
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from fixtures import FixtureReplay, FixtureStore
+from ipgeo_service import LookupBatcher, create_app, render_metrics
+from resilience import configure_guard
+from source_registry import FieldMapping, SourceRegistry, SourceSpec
+from tracing import configure_tracing
+from unified_data import FIELD_NAMES
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "sources.har")
+SOURCES = "ipinfo.io,db-ip.com"
+
+
+def test_batcher_sends_batch_through_one_lookup_many():
+    calls = []
+
+    async def lookup_many(ips, sources=None, required_fields=None, max_concurrency=8, semaphores=None):
+        calls.append((list(ips), sources, required_fields))
+        await asyncio.sleep(0.01)
+        for ip_address in reversed(ips):
+            async with semaphores["fast"]:
+                yield {"combined": {"ip_address": ip_address}}
+
+    async def scenario():
+        batcher = LookupBatcher(lookup_many, max_delay=0.001)
+        results = await asyncio.gather(
+            batcher.lookup("192.0.2.1"),
+            batcher.lookup("192.0.2.1"),
+            batcher.lookup("192.0.2.2"),
+            batcher.lookup("192.0.2.3", required_fields=["country"]),
+        )
+        return batcher, results
+
+    batcher, results = asyncio.run(scenario())
+    assert sorted(calls, key=lambda call: call[0]) == [
+        (["192.0.2.1", "192.0.2.2"], None, None),
+        (["192.0.2.3"], None, ("country",)),
+    ]
+    assert [result["combined"]["ip_address"] for result in results] == [
+        "192.0.2.1", "192.0.2.1", "192.0.2.2", "192.0.2.3"
+    ]
+    assert results[0] is results[1]
+    assert batcher.stats()["deduplicated"] == 1
+    assert batcher.stats()["batches"] == 1
+    assert batcher.stats()["inflight"] == 0
+
+
+def test_batcher_fails_waiters_without_result():
+    async def lookup_many(ips, **options):
+        yield {"combined": {"ip_address": ips[0]}}
+        raise ValueError("source down")
+
+    async def scenario():
+        batcher = LookupBatcher(lookup_many, max_delay=0.001)
+        return batcher, await asyncio.gather(
+            batcher.lookup("192.0.2.1"), batcher.lookup("192.0.2.2"), return_exceptions=True
+        )
+
+    batcher, results = asyncio.run(scenario())
+    assert results[0]["combined"]["ip_address"] == "192.0.2.1"
+    assert isinstance(results[1], ValueError)
+    assert batcher.stats()["errors"] == 1
+
+
+def test_cancelled_batch_resolves_waiters():
+    async def scenario():
+        running = asyncio.Event()
+
+        async def lookup_many(ips, **options):
+            running.set()
+            await asyncio.sleep(60)
+            yield {}
+
+        batcher = LookupBatcher(lookup_many, max_delay=0.001)
+        request = asyncio.create_task(batcher.lookup("192.0.2.1"))
+        await running.wait()
+        for task in list(batcher._tasks):
+            task.cancel()
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(request, 1)
+        return batcher
+
+    batcher = asyncio.run(scenario())
+    assert batcher.stats()["inflight"] == 0
+    assert batcher.stats()["errors"] == 1
+
+
+def test_metrics_have_unique_families(engine, monkeypatch):
+    async def stalled(ip_address):
+        await asyncio.sleep(1)
+        return {}
+
+    sources = SourceRegistry(FIELD_NAMES)
+    sources.register(SourceSpec("stalled", stalled, (FieldMapping("country", "country"),)))
+    monkeypatch.setattr(engine, "SOURCES", sources)
+    configure_guard("stalled", initial_timeout=0.05)
+    configure_tracing(True)
+    try:
+        unified = asyncio.run(engine.fetch_unified_source("stalled", "192.0.2.1"))
+        assert unified.error
+        body = render_metrics(create_app())
+    finally:
+        configure_tracing(False)
+
+    families = Counter(re.findall(r"^# TYPE (\S+) ", body, re.MULTILINE))
+    series = Counter(
+        line.rsplit(" ", 1)[0] for line in body.splitlines() if line and not line.startswith("#")
+    )
+    assert families["ipgeo_source_timeouts_total"] == 1
+    assert 'ipgeo_source_timeouts_total{source="stalled"}' in series
+    assert [name for name, n in families.items() if n > 1] == []
+    assert [name for name, n in series.items() if n > 1] == []
+
+
+def test_http_endpoints_use_recorded_sources(engine, monkeypatch):
+    store = FixtureStore.load(FIXTURES)
+    monkeypatch.setitem(engine.TRANSPORTS, "ipinfo.io", "http")
+    monkeypatch.setitem(engine.TRANSPORTS, "db-ip.com", "http")
+
+    async def scenario():
+        responses = {}
+        async with FixtureReplay(store):
+            async with TestClient(TestServer(create_app(max_delay=0.001))) as client:
+                response = await client.get("/lookup/8.8.8.8", params={"sources": SOURCES})
+                responses["single"] = (response.status, await response.json())
+
+                response = await client.post(
+                    "/lookup",
+                    json={"ips": ["1.1.1.1", "not-an-ip", "8.8.8.8"], "sources": SOURCES.split(",")},
+                )
+                responses["batch"] = (response.status, await response.json())
+
+                response = await client.get("/lookup/not-an-ip")
+                responses["bad_ip"] = response.status
+                response = await client.get("/lookup/8.8.8.8", params={"sources": "nowhere"})
+                responses["bad_source"] = response.status
+                response = await client.post("/lookup", json={"ips": ["8.8.8.8"], "sources": ["nowhere"]})
+                responses["bad_batch_source"] = response.status
+
+                response = await client.get("/health")
+                responses["health"] = (response.status, await response.json())
+                response = await client.get("/metrics")
+                responses["metrics"] = (response.status, await response.text())
+        return responses
+
+    responses = asyncio.run(scenario())
+
+    status, single = responses["single"]
+    assert status == 200
+    assert single["combined"]["ip_address"] == "8.8.8.8"
+    assert single["combined"]["city"] == "Mountain View"
+    assert set(single["sources"]) == {"ipinfo.io", "db-ip.com"}
+
+    status, batch = responses["batch"]
+    assert status == 200
+    results = batch["results"]
+    assert results[0]["combined"]["ip_address"] == "1.1.1.1"
+    assert results[1] == {"ip_address": "not-an-ip", "error": "Некорректный IP"}
+    assert results[2]["combined"]["ip_address"] == "8.8.8.8"
+    assert results[2]["combined"]["ip_range"] == "8.8.8.0/24"
+
+    assert responses["bad_ip"] == 400
+    assert responses["bad_source"] == 400
+    assert responses["bad_batch_source"] == 400
+
+    status, health = responses["health"]
+    assert status == 200
+    assert health["status"] == "ok"
+    assert set(health["sources"]) >= {"ipinfo.io", "db-ip.com"}
+
+    status, metrics = responses["metrics"]
+    assert status == 200
+    assert "ipgeo_requests_total 3" in metrics.splitlines()
+    assert "ipgeo_batches_total 2" in metrics.splitlines()
@@ -0,0 +1,122 @@
+import pytest
+
+from source_registry import (
+    FieldMapping,
+    SourceRegistry,
+    SourceSpec,
+    coordinate,
+    to_float,
+    to_int,
+)
+from unified_data import FIELD_NAMES
+
+
+async def no_fetch(ip_address):
+    return {}
+
+
+def make_registry():
+    registry = SourceRegistry(FIELD_NAMES)
+    registry.register(
+        SourceSpec(
+            "primary",
+            no_fetch,
+            (
+                FieldMapping("country", "country"),
+                FieldMapping("latitude", "coordinates", coordinate(0)),
+                FieldMapping("hosted_domains_count", "domains", to_int),
+                FieldMapping("is_private", "is_private"),
+                FieldMapping("is_anycast", "is_anycast"),
+            ),
+            priority=30,
+        )
+    )
+    registry.register(
+        SourceSpec(
+            "precise",
+            no_fetch,
+            (
+                FieldMapping("country", "country"),
+                FieldMapping("latitude", "lat", to_float),
+                FieldMapping("is_private", "is_private", priority=50),
+                FieldMapping("is_anycast", "is_anycast", priority=50),
+            ),
+            priority=10,
+        )
+    )
+    return registry
+
+
+def test_failed_conversion_skips_only_that_field():
+    registry = make_registry()
+
+    data = registry.transform(
+        "primary",
+        {"country": "US", "coordinates": "somewhere", "domains": "many", "is_private": False},
+    )
+
+    assert data == {"country": "US", "is_private": False}
+    assert registry.transform("precise", {"lat": [1, 2], "country": ""}) == {}
+    assert registry.transform("precise", {"error": "timeout", "country": "US"}) == {
+        "error": "timeout"
+    }
+
+
+def test_register_rejects_unknown_fields():
+    registry = SourceRegistry(FIELD_NAMES)
+
+    with pytest.raises(ValueError):
+        registry.register(SourceSpec("bad", no_fetch, (FieldMapping("planet", "planet"),)))
+    assert "bad" not in registry
+
+
+def test_field_priority_overrides_source_priority():
+    registry = make_registry()
+    records = {
+        "primary": {"country": "US", "is_private": True, "is_anycast": True},
+        "precise": {"country": "CA", "is_private": False, "is_anycast": False},
+    }
+
+    merged = registry.merge(records)
+
+    assert merged["country"] == "US"
+    # Флаги берутся из источника с более высоким приоритетом поля, даже если False
+    assert merged["is_private"] is False
+    assert merged["is_anycast"] is False
+    assert dict(registry.merge_plan(["primary", "precise"]))["is_private"] == (
+        "precise",
+        "primary",
+    )
+
+    # Пустое значение приоритетного источника не перекрывает остальные
+    del records["precise"]["is_anycast"]
+    assert registry.merge(records)["is_anycast"] is True
+
+
+def test_real_sources_prefer_ipinfo_flags(engine):
+    plan = dict(engine.SOURCES.merge_plan(["db-ip.com", "ipapi.com", "ipinfo.io"]))
+
+    assert plan["is_private"][0] == "ipinfo.io"
+    assert plan["is_anycast"][:2] == ("ipinfo.io", "db-ip.com")
+    assert plan["country"][0] == "ipapi.com"
+
+
+def test_merge_batch_merges_each_ip_with_its_own_sources():
+    registry = make_registry()
+    batch = [
+        {"primary": {"country": "US"}, "precise": {"country": "CA", "latitude": 1.5}},
+        {"precise": {"country": "MX"}},
+        {"primary": {}, "precise": {"country": "BR", "is_private": True}},
+        {"precise": {"country": "AR"}, "primary": {"country": "CL"}},
+    ]
+
+    merged = registry.merge_batch(batch)
+
+    assert merged == [
+        {"country": "US", "latitude": 1.5},
+        {"country": "MX"},
+        {"country": "BR", "is_private": True},
+        {"country": "CL"},
+    ]
+    # Порядок источников в записи задает свой план, приоритет от него не зависит
+    assert len(registry._plans) == 3
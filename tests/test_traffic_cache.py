@@ -0,0 +1,120 @@
+import pytest
+
+pytest.importorskip("xxhash")
+
+from traffic_cache import CachedClassifier, ClassificationCache, feature_key  # noqa: E402
+from traffic_capture import volatile_columns  # noqa: E402
+
+
+class RecordingClassifier:
+    """Классификатор-заглушка: запоминает входы, ERROR для строк с 'bad'"""
+
+    def __init__(self):
+        self.calls = []
+
+    def classify(self, texts):
+        self.calls.append(list(texts))
+        return [
+            {"label": "ERROR" if "bad" in text else "BENIGN", "score": 0.5 + len(text) / 100}
+            for text in texts
+        ]
+
+    def stats(self):
+        return {"calls": len(self.calls)}
+
+
+def test_feature_key_is_stable_hex_digest():
+    key = feature_key("TCP 443 → 51000 [ACK]")
+
+    assert key == feature_key("TCP 443 → 51000 [ACK]")
+    assert key != feature_key("TCP 443 → 51000 [SYN]")
+    assert len(key) == 16
+    int(key, 16)
+
+
+def test_cache_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ClassificationCache(path=path, namespace="model:eager")
+    cache.set_many({"a": {"label": "BENIGN", "score": 0.9}, "b": {"label": "ERROR", "score": 0.0}})
+    cache.close()
+
+    reopened = ClassificationCache(path=path, namespace="model:eager")
+    assert reopened.get_many(["a", "b"]) == {"a": {"label": "BENIGN", "score": 0.9}}
+    assert reopened.stats()["disk_hits"] == 1
+    # Второй раз ключ находится в памяти
+    assert reopened.get_many(["a"]) == {"a": {"label": "BENIGN", "score": 0.9}}
+    assert reopened.stats()["disk_hits"] == 1
+    reopened.close()
+
+    other = ClassificationCache(path=path, namespace="model:onnx")
+    assert other.get_many(["a"]) == {}
+    other.close()
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = ClassificationCache(max_entries=2)
+    cache.set_many({"a": {"label": "A", "score": 1.0}, "b": {"label": "B", "score": 1.0}})
+    cache.get_many(["a"])
+    cache.set_many({"c": {"label": "C", "score": 1.0}})
+
+    assert set(cache.get_many(["a", "b", "c"])) == {"a", "c"}
+
+
+def test_cached_classifier_deduplicates_within_chunk():
+    model = RecordingClassifier()
+    classifier = CachedClassifier(model, ClassificationCache())
+
+    results = classifier.classify(["x", "y", "x", "x"])
+    again = classifier.classify(["y", "z"])
+
+    assert model.calls == [["x", "y"], ["z"]]
+    assert [r["label"] for r in results] == ["BENIGN"] * 4
+    assert results[0] == results[2] and results[0] is not results[2]
+    assert again[0] == results[1]
+    assert classifier.cache.stats()["hits"] == 3
+    assert classifier.cache.stats()["misses"] == 3
+
+
+def test_error_labels_are_not_cached():
+    model = RecordingClassifier()
+    classifier = CachedClassifier(model, ClassificationCache())
+
+    assert classifier.classify(["bad", "bad"])[1]["label"] == "ERROR"
+    classifier.classify(["bad"])
+
+    assert model.calls == [["bad"], ["bad"]]
+    assert classifier.cache.stats()["entries"] == 0
+
+
+def test_key_texts_group_rows_but_model_gets_full_text():
+    model = RecordingClassifier()
+    classifier = CachedClassifier(model, ClassificationCache())
+
+    results = classifier.classify(["1 0.1 dns", "2 0.2 dns"], key_texts=["dns", "dns"])
+
+    assert model.calls == [["1 0.1 dns"]]
+    assert results[0] == results[1]
+
+
+def test_model_input_does_not_depend_on_cache():
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    from main import analyze_network_traffic
+
+    columns = ["No.", "Time", "Protocol", "Info"]
+    rows = [
+        ["1", "0.001", "TCP", "443 → 51000 [ACK] Seq=1 Ack=1"],
+        ["2", "0.002", "TCP", "443 → 51000 [ACK] Seq=2 Ack=2"],
+    ]
+
+    plain = RecordingClassifier()
+    analyze_network_traffic(plain, rows)
+    model = RecordingClassifier()
+    analyze_network_traffic(
+        CachedClassifier(model, ClassificationCache()), rows, volatile_columns(columns)
+    )
+
+    full = [" ".join(row) for row in rows]
+    assert plain.calls == [full]
+    # С кэшем пакеты совпадают без номера, времени и Seq/Ack, в модель идет первый целиком
+    assert model.calls == [full[:1]]
@@ -0,0 +1,87 @@
+import csv
+
+import pytest
+
+pytest.importorskip("pandas")
+
+from traffic_capture import (  # noqa: E402
+    CaptureResultWriter,
+    capture_features,
+    chunk_rows,
+    iter_capture_chunks,
+    volatile_columns,
+)
+
+COLUMNS = ["No.", "Time", "Protocol", "Info"]
+
+
+@pytest.fixture
+def capture(tmp_path):
+    """Экспорт Wireshark из 5 пакетов с пустым значением и запятой в описании"""
+    path = tmp_path / "capture.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for i in range(1, 6):
+            writer.writerow([str(i), f"0.00{i}", "TCP" if i != 3 else "", f"Seq={i}, Len=0"])
+    return str(path)
+
+
+def read_output(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def test_chunks_keep_values_as_strings(capture):
+    chunks = list(iter_capture_chunks(capture, chunk_size=2))
+
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    rows = [row for chunk in chunks for row in chunk_rows(chunk)]
+    assert rows[0] == ["1", "0.001", "TCP", "Seq=1, Len=0"]
+    assert rows[2] == ["3", "0.003", "", "Seq=3, Len=0"]
+    assert rows[-1][0] == "5"
+    assert volatile_columns(chunks[0].columns) == [0, 1]
+    assert capture_features(rows[:1]) == ["1 0.001 TCP Seq=1, Len=0"]
+    assert capture_features(rows[:1], [0, 1]) == ["TCP Seq=*, Len=0"]
+
+
+def test_writer_continues_index_across_chunks(capture, tmp_path):
+    output = str(tmp_path / "result.csv")
+
+    with CaptureResultWriter(output) as writer:
+        for chunk in iter_capture_chunks(capture, chunk_size=2):
+            rows = chunk_rows(chunk)
+            writer.write(rows, [{"label": "BENIGN", "score": 0.9}] * len(rows))
+        writer.write([], [])
+
+    lines = read_output(output)
+    assert writer.rows == 5
+    # Заголовок один, последняя короткая порция записана
+    assert lines[0] == ["Packet Index", "Category", "Confidence"] + [
+        f"Field_{i}" for i in range(4)
+    ]
+    assert [line[0] for line in lines[1:]] == ["0", "1", "2", "3", "4"]
+    assert lines[-1] == ["4", "BENIGN", "0.9", "5", "0.005", "TCP", "Seq=5, Len=0"]
+    assert sum(line[0] == "Packet Index" for line in lines) == 1
+
+
+def test_writer_uses_explicit_indices(tmp_path):
+    output = str(tmp_path / "result.csv")
+
+    with CaptureResultWriter(output) as writer:
+        writer.write([["b"], ["a"]], [{"label": "X", "score": 1.0}] * 2, indices=[7, 3])
+
+    assert [line[:2] for line in read_output(output)[1:]] == [["7", "X"], ["3", "X"]]
+
+
+def test_empty_capture_writes_nothing(tmp_path):
+    path = tmp_path / "empty.csv"
+    path.write_text(",".join(COLUMNS) + "\n", encoding="utf-8")
+    output = str(tmp_path / "result.csv")
+
+    with CaptureResultWriter(output) as writer:
+        for chunk in iter_capture_chunks(str(path)):
+            writer.write(chunk_rows(chunk), [])
+
+    assert read_output(output) == []
+    assert writer.rows == 0
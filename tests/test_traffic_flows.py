@@ -0,0 +1,55 @@
+import pytest
+
+pytest.importorskip("pandas")
+
+from traffic_flows import FlowAssembler, parse_time  # noqa: E402
+
+COLUMNS = ["No.", "Time", "Source", "Destination", "Protocol", "Length", "Info"]
+
+
+def packet(time, sport="51234", info="[ACK] Seq=1"):
+    return ["1", time, "10.0.0.1", "10.0.0.2", "TCP", "60", f"{sport} → 443 {info}"]
+
+
+def test_parse_relative_time():
+    assert parse_time(" 0.250000 ") == 0.25
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "2024-01-02 10:15:30.5",
+        "2024-01-02T10:15:30.500000123",
+        "Jan  2, 2024 10:15:30.500000000 UTC",
+    ],
+)
+def test_parse_absolute_time(value):
+    assert parse_time(value) - parse_time("2024-01-02 10:15:30") == pytest.approx(0.5)
+
+
+def test_unparseable_time_is_an_error():
+    assembler = FlowAssembler(COLUMNS)
+    with pytest.raises(ValueError):
+        assembler.add(0, packet("вчера"))
+
+
+def test_absolute_times_expire_idle_flows():
+    assembler = FlowAssembler(COLUMNS, idle_timeout=60)
+    assert assembler.add(0, packet("2024-01-02 10:00:00")) == []
+    closed = assembler.add(1, packet("2024-01-02 10:05:00", sport="51235"))
+    assert [flow.packets for flow in closed] == [1]
+    assert assembler.active == 1
+
+
+def test_connections_to_same_service_share_features():
+    assembler = FlowAssembler(COLUMNS)
+    assembler.add(0, packet("0.0", sport="51234"))
+    assembler.add(1, packet("0.1", sport="51234"))
+    assembler.add(2, packet("5.0", sport="60001"))
+    assembler.add(3, packet("5.1", sport="60001"))
+    first, second = assembler.flush()
+
+    assert first.key != second.key
+    assert first.features() == second.features()
+    assert "PORT:443 " in first.features()
+    assert "IAT:0.100/0.100/0.000/0.100 " in first.features()
@@ -0,0 +1,108 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+import traffic_inference  # noqa: E402
+from traffic_inference import load_backend, load_classifier  # noqa: E402
+
+VOCAB = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "src", "dst", "tcp", "udp", "dns", "443"]
+
+
+@pytest.fixture(scope="module")
+def model_dir(tmp_path_factory):
+    """Маленький случайный классификатор BERT с токенизатором"""
+    path = str(tmp_path_factory.mktemp("model"))
+    vocab = os.path.join(path, "vocab.txt")
+    with open(vocab, "w", encoding="utf-8") as f:
+        f.write("\n".join(VOCAB) + "\n")
+    tokenizer = transformers.BertTokenizerFast(vocab)
+    config = transformers.BertConfig(
+        vocab_size=len(VOCAB),
+        hidden_size=16,
+        num_hidden_layers=1,
+        num_attention_heads=2,
+        intermediate_size=32,
+        num_labels=2,
+        id2label={0: "BENIGN", 1: "ATTACK"},
+        label2id={"BENIGN": 0, "ATTACK": 1},
+    )
+    torch.manual_seed(0)
+    transformers.BertForSequenceClassification(config).save_pretrained(path)
+    tokenizer.save_pretrained(path)
+    return path
+
+
+@pytest.fixture(scope="module")
+def onnx_dir(model_dir, tmp_path_factory):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnx")
+    download_model = pytest.importorskip("download_model")
+    path = str(tmp_path_factory.mktemp("onnx"))
+    download_model.export_onnx(model_dir, path)
+    return path
+
+
+def test_onnx_backends_are_explicit(onnx_dir):
+    fp32 = load_backend(onnx_dir, "onnx")
+    int8 = load_backend(onnx_dir, "onnx-int8")
+    assert (fp32.name, int8.name) == ("onnx", "onnx-int8")
+    assert traffic_inference.onnx_model_file(onnx_dir, "onnx").endswith("model.onnx")
+    assert traffic_inference.onnx_model_file(onnx_dir, "onnx-int8").endswith("model.int8.onnx")
+
+    results = load_classifier(onnx_dir, "onnx-int8").classify(["src dst tcp 443", "dns udp"])
+    assert all(r["label"] in ("BENIGN", "ATTACK") for r in results)
+
+
+def test_missing_int8_file_is_an_error(onnx_dir, tmp_path):
+    for name in os.listdir(onnx_dir):
+        if name != "model.int8.onnx":
+            with open(os.path.join(onnx_dir, name), "rb") as src:
+                (tmp_path / name).write_bytes(src.read())
+    with pytest.raises(FileNotFoundError):
+        load_backend(str(tmp_path), "onnx-int8")
+
+
+def test_check_parity_without_comparable_rows(model_dir, tmp_path, monkeypatch, capsys):
+    download_model = pytest.importorskip("download_model")
+    capture = tmp_path / "capture.csv"
+    capture.write_text("No.,Source,Destination,Protocol\n1,src,dst,tcp\n", encoding="utf-8")
+
+    class Broken:
+        def forward(self, batch):
+            raise RuntimeError("сбой модели")
+
+    original = download_model.load_classifier
+
+    def load(path, backend):
+        classifier = original(path, "eager")
+        if backend != "eager":
+            classifier.backend = Broken()
+            classifier.backend.name = backend
+        return classifier
+
+    monkeypatch.setattr(download_model, "load_classifier", load)
+    report = download_model.check_parity(model_dir, model_dir, str(capture), "int8")
+    assert report["label_agreement"] is None
+    assert "нет строк для сверки" in capsys.readouterr().out
+
+
+def test_tokenizer_error_fails_only_its_batch(model_dir):
+    classifier = load_classifier(model_dir, "eager", batch_size=2)
+    tokenizer = classifier.tokenizer
+
+    def tokenize(texts, **options):
+        if any("dns" in text for text in texts):
+            raise ValueError("сбой токенизатора")
+        return tokenizer(texts, **options)
+
+    classifier.tokenizer = tokenize
+    texts = ["src dst tcp 443 443 443", "dns", "udp", "src dst tcp 443 443"]
+    results = classifier.classify(texts)
+
+    # Короткие строки "dns" и "udp" попадают в один пакет
+    assert [r["label"] for r in results[1:3]] == ["ERROR", "ERROR"]
+    assert all(r["label"] in ("BENIGN", "ATTACK") for r in (results[0], results[3]))
+    assert classifier.stats() == {"batches": 2, "failed_batches": 1}
@@ -0,0 +1,63 @@
+import asyncio
+import queue
+
+import ipgeo_workers
+from lookup_cache import LookupCache, configure_lookup_cache
+
+from test_lookup import make_sources
+
+
+def run_worker(options, ips):
+    tasks, results = queue.Queue(), queue.Queue()
+    for ip_address in ips:
+        tasks.put(ip_address)
+    tasks.put(None)
+    try:
+        asyncio.run(ipgeo_workers._worker_loop(0, tasks, results, options))
+    finally:
+        configure_lookup_cache(None)
+    return [results.get_nowait() for _ in range(results.qsize())]
+
+
+def test_worker_sends_cache_entries(engine, monkeypatch, tmp_path):
+    async def fast(ip_address):
+        return {"country": "US", "ip_range": "192.0.2.0/24"}
+
+    async def slow(ip_address):
+        return {"source": "slow", "error": "timeout"}
+
+    monkeypatch.setattr(engine, "SOURCES", make_sources(fast, slow))
+    path = str(tmp_path / "cache.sqlite3")
+    supervisor_cache = LookupCache(path)
+
+    (index, ip_address, result, entries), = run_worker(
+        {"cache": path, "sources": ["fast", "slow"]}, ["192.0.2.1"]
+    )
+    assert (index, ip_address) == (0, "192.0.2.1")
+    assert result["combined"]["country"] == "US"
+
+    # Процесс ничего не пишет в файл сам, записи получает супервизор
+    assert supervisor_cache.get("fast", ip_address, "unified") is None
+    for entry in entries:
+        supervisor_cache.set(*entry)
+    assert supervisor_cache.get("fast", ip_address, "unified")["country"] == "US"
+    assert supervisor_cache.get("slow", ip_address, "unified")["error"] == "timeout"
+    supervisor_cache.close()
+
+
+def test_worker_honours_required_fields(engine, monkeypatch):
+    async def fast(ip_address):
+        return {"country": "US", "ip_range": "192.0.2.0/24"}
+
+    async def slow(ip_address):
+        await asyncio.sleep(1)
+        return {"city": "Reston"}
+
+    monkeypatch.setattr(engine, "SOURCES", make_sources(fast, slow))
+
+    (_, _, result, entries), = run_worker(
+        {"cache": None, "sources": ["fast", "slow"], "required_fields": ["country"]},
+        ["192.0.2.1"],
+    )
+    assert result["pending"] == ["slow"]
+    assert entries == []
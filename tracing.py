@@ -0,0 +1,305 @@
+import contextvars
+import cProfile
+import itertools
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from resilience import LatencyHistogram
+
+# Границы корзин гистограммы этапов, секунды: этапы короче запросов целиком
+STAGE_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _NoopSpan:
+    """Этап при отключенной трассировке: ничего не измеряет"""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+    def set(self, **attrs) -> None:
+        return None
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "ipgeo_span", default=None
+)
+_span_ids = itertools.count(1)
+
+
+class Span:
+    """Замер одного этапа поиска
+
+    Вложенные этапы получают идентификатор трассы и родителя через
+    contextvars, поэтому связь сохраняется и между задачами asyncio.
+    В гистограмму этап попадает с меткой source, остальные атрибуты
+    пишутся только в журнал.
+    """
+
+    __slots__ = ("tracer", "name", "attrs", "trace_id", "span_id", "parent_id", "started", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, attrs: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.trace_id = ""
+        self.span_id = 0
+        self.parent_id: Optional[int] = None
+        self.started = 0.0
+        self._token = None
+
+    def set(self, **attrs) -> None:
+        """Дополнительные атрибуты этапа, например результат"""
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "Span":
+        parent = _current_span.get()
+        if parent is not None:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+        else:
+            self.trace_id = os.urandom(8).hex()
+        self.span_id = next(_span_ids)
+        self._token = _current_span.set(self)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        duration = time.perf_counter() - self.started
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = f"{exc_type.__name__}: {exc}"
+        self.tracer.finish(self, duration)
+
+
+class Tracer:
+    """Сбор длительностей этапов и счетчиков с выводом в журнал JSON
+
+    log - файл или поток для журнала: по строке JSON на каждый этап и
+    событие. Без log этапы только накапливаются в гистограммах.
+    """
+
+    def __init__(self, log: Optional[IO[str]] = None, buckets: tuple = STAGE_BUCKETS):
+        self.log = log
+        self.buckets = buckets
+        self.histograms: Dict[Tuple[str, Optional[str]], LatencyHistogram] = {}
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+
+    def span(self, name: str, **attrs) -> Span:
+        return Span(self, name, attrs)
+
+    def finish(self, span: Span, duration: float) -> None:
+        """Учет завершенного этапа"""
+        key = (span.name, span.attrs.get("source"))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = LatencyHistogram(self.buckets, window=1000)
+        histogram.observe(duration)
+
+        if self.log is not None:
+            self.write(
+                {
+                    "type": "span",
+                    "name": span.name,
+                    "trace": span.trace_id,
+                    "span": span.span_id,
+                    "parent": span.parent_id,
+                    "duration": round(duration, 6),
+                    **span.attrs,
+                }
+            )
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def event(self, name: str, **attrs) -> None:
+        """Отдельное событие в журнале, привязанное к текущему этапу"""
+        if self.log is None:
+            return
+        record = {"type": "event", "name": name}
+        span = _current_span.get()
+        if span is not None:
+            record.update(trace=span.trace_id, parent=span.span_id)
+        record.update(attrs)
+        self.write(record)
+
+    def write(self, record: Dict[str, Any]) -> None:
+        record["ts"] = round(time.time(), 6)
+        record["pid"] = os.getpid()
+        self.log.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self.log.flush()
+
+    def stages(self) -> List[Dict[str, Any]]:
+        """Сводка по этапам: количество, сумма и квантили"""
+        return [
+            {
+                "stage": name,
+                "source": source,
+                "count": h.count,
+                "seconds": h.sum,
+                "p50": h.quantile(0.5),
+                "p95": h.quantile(0.95),
+            }
+            for (name, source), h in sorted(
+                self.histograms.items(), key=lambda item: (item[0][0], item[0][1] or "")
+            )
+        ]
+
+    def render_prometheus(self, prefix: str = "ipgeo") -> str:
+        """Этапы и счетчики в текстовом формате Prometheus"""
+        lines = []
+        if self.histograms:
+            lines.append(f"# TYPE {prefix}_stage_seconds histogram")
+        for (name, source), histogram in sorted(
+            self.histograms.items(), key=lambda item: (item[0][0], item[0][1] or "")
+        ):
+            labels = f'stage="{name}"' + (f',source="{source}"' if source else "")
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{prefix}_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"{prefix}_stage_seconds_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"{prefix}_stage_seconds_count{{{labels}}} {histogram.count}")
+
+        typed = set()
+        for (name, labels), value in sorted(self.counters.items()):
+            metric = f"{prefix}_{name}_total"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+_tracer: Optional[Tracer] = None
+_log_file: Optional[IO[str]] = None
+
+
+def configure_tracing(
+    enabled: bool = True, log: Optional[Union[str, IO[str]]] = None, **kwargs
+) -> Optional[Tracer]:
+    """Включение или отключение трассировки
+
+    log - путь к журналу JSON (дописывается), "-" для stderr или открытый
+    поток. При enabled=False span и count сводятся к проверке одной
+    глобальной переменной.
+    """
+    global _tracer, _log_file
+    if _log_file is not None:
+        _log_file.close()
+        _log_file = None
+
+    if not enabled:
+        _tracer = None
+        return None
+
+    stream = log
+    if log == "-":
+        stream = sys.stderr
+    elif isinstance(log, str):
+        stream = _log_file = open(log, "a", encoding="utf-8")
+    _tracer = Tracer(stream, **kwargs)
+    return _tracer
+
+
+def get_tracer() -> Optional[Tracer]:
+    """Текущий сборщик или None, если трассировка отключена"""
+    return _tracer
+
+
+def span(name: str, **attrs) -> Union[Span, _NoopSpan]:
+    """Замер этапа: with span("page.goto", source=...): ..."""
+    tracer = _tracer
+    if tracer is None:
+        return NOOP_SPAN
+    return Span(tracer, name, attrs)
+
+
+def count(name: str, value: float = 1, **labels) -> None:
+    """Увеличение счетчика с метками"""
+    tracer = _tracer
+    if tracer is not None:
+        tracer.count(name, value, **labels)
+
+
+def event(name: str, **attrs) -> None:
+    """Событие в журнале трассировки"""
+    tracer = _tracer
+    if tracer is not None:
+        tracer.event(name, **attrs)
+
+
+def record_error(stage: str, error: BaseException, **labels) -> None:
+    """Учет ошибки этапа: счетчик errors и событие с текстом ошибки"""
+    tracer = _tracer
+    if tracer is not None:
+        tracer.count("errors", stage=stage, **labels)
+        tracer.event("error", stage=stage, error=f"{type(error).__name__}: {error}", **labels)
+
+
+def render_prometheus(prefix: str = "ipgeo") -> str:
+    """Метрики трассировки или пустая строка, если она отключена"""
+    tracer = _tracer
+    return tracer.render_prometheus(prefix) if tracer is not None else ""
+
+
+PROFILERS = ("cprofile", "py-spy")
+
+
+@contextmanager
+def profile_run(path: str, profiler: str = "cprofile", rate: int = 100) -> Iterator[None]:
+    """Профилирование блока с сохранением результата в path
+
+    cprofile - детерминированный профиль текущего потока в формате pstats.
+    py-spy - выборочный профиль всего процесса вместе с дочерними
+    процессами поиска (flamegraph SVG), py-spy должен быть в PATH.
+    """
+    if profiler == "cprofile":
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(path)
+        return
+
+    if profiler != "py-spy":
+        raise ValueError(f"Неизвестный профилировщик: {profiler}")
+    executable = shutil.which("py-spy")
+    if executable is None:
+        raise RuntimeError("py-spy не найден в PATH")
+
+    process = subprocess.Popen(
+        [
+            executable, "record", "--pid", str(os.getpid()), "--rate", str(rate),
+            "--subprocesses", "--output", path,
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        yield
+    finally:
+        # По SIGINT py-spy прекращает выборку и записывает результат
+        process.send_signal(signal.SIGINT)
+        process.wait()
@@ -0,0 +1,154 @@
+import sqlite3
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+import xxhash
+
+from tracing import count
+
+
+def feature_key(text: str) -> str:
+    """Ключ строки признаков: 64-битный xxh3 в шестнадцатеричном виде"""
+    return xxhash.xxh3_64_hexdigest(text.encode("utf-8"))
+
+
+class ClassificationCache:
+    """Метки и уверенность по ключу строки признаков
+
+    В памяти хранятся max_entries последних использованных ключей (LRU).
+    С path результаты дополнительно пишутся в SQLite и переживают
+    перезапуск. namespace отделяет результаты разных моделей и вариантов
+    модели в одном файле.
+    """
+
+    def __init__(
+        self, max_entries: int = 100000, path: Optional[str] = None, namespace: str = ""
+    ):
+        self.max_entries = max_entries
+        self.path = path
+        self.namespace = namespace
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if path is not None:
+            self._conn = sqlite3.connect(path, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS classifications (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    label TEXT NOT NULL,
+                    score REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                ) WITHOUT ROWID
+                """
+            )
+
+    def _remember(self, key: str, result: Dict[str, Any]) -> None:
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Найденные результаты для набора ключей"""
+        found = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                found[key] = result
+            else:
+                missing.append(key)
+
+        if self._conn is not None and missing:
+            # Ограничение SQLite на число параметров запроса
+            for start in range(0, len(missing), 500):
+                part = missing[start:start + 500]
+                rows = self._conn.execute(
+                    "SELECT key, label, score FROM classifications"
+                    f" WHERE namespace = ? AND key IN ({','.join('?' * len(part))})",
+                    (self.namespace, *part),
+                ).fetchall()
+                for key, label, score in rows:
+                    found[key] = {"label": label, "score": score}
+                    self._remember(key, found[key])
+                    self.disk_hits += 1
+        return found
+
+    def set_many(self, results: Dict[str, Dict[str, Any]]) -> None:
+        """Сохранение результатов, ошибки не кэшируются"""
+        results = {k: r for k, r in results.items() if r["label"] != "ERROR"}
+        for key, result in results.items():
+            self._remember(key, result)
+        if self._conn is not None and results:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO classifications (namespace, key, label, score)"
+                    " VALUES (?, ?, ?, ?)",
+                    [(self.namespace, k, r["label"], r["score"]) for k, r in results.items()],
+                )
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+
+class CachedClassifier:
+    """Классификатор, который отправляет в модель только новые строки
+
+    Одинаковые строки внутри порции и уже встречавшиеся раньше
+    классифицируются один раз, остальные получают сохраненный результат.
+    """
+
+    def __init__(self, classifier, cache: ClassificationCache):
+        self.classifier = classifier
+        self.cache = cache
+
+    def classify(
+        self, texts: Sequence[str], key_texts: Optional[Sequence[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Результаты для texts в том же порядке
+
+        key_texts - строки для ключей кэша вместо самих texts (например,
+        без номера и времени пакета); в модель всегда идут texts.
+        """
+        keys = [feature_key(text) for text in (key_texts if key_texts is not None else texts)]
+        known = self.cache.get_many(keys)
+
+        unique: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in known and key not in unique:
+                unique[key] = text
+
+        self.cache.hits += len(texts) - len(unique)
+        self.cache.misses += len(unique)
+        count("classification_cache_hits", len(texts) - len(unique))
+        count("classification_cache_misses", len(unique))
+
+        if unique:
+            results = self.classifier.classify(list(unique.values()))
+            fresh = dict(zip(unique, results))
+            self.cache.set_many(fresh)
+            known.update(fresh)
+        return [dict(known[key]) for key in keys]
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.classifier.stats(), cache=self.cache.stats())
@@ -0,0 +1,117 @@
+import csv
+import re
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import pandas as pd
+
+# Размер порции строк захвата: от него, а не от размера файла, зависит
+# потребление памяти
+DEFAULT_CHUNK_SIZE = 10000
+
+# Колонки, которые различаются у одинаковых по содержанию пакетов: номер
+# и время. Сравниваются без учета регистра
+VOLATILE_COLUMNS = {"no.", "no", "packet index", "index", "time", "timestamp"}
+
+# Изменчивые части описания пакета: номера последовательности TCP,
+# метки времени и идентификаторы DNS-запросов
+VOLATILE_INFO = (
+    (re.compile(r"\b(Seq|Ack|TSval|TSecr)=\d+"), r"\1=*"),
+    (re.compile(r"\b(query|query response) 0x[0-9a-fA-F]+\b"), r"\1 0x*"),
+)
+
+
+def iter_capture_chunks(
+    path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, encoding: str = "utf-8"
+) -> Iterator[pd.DataFrame]:
+    """Порции строк экспорта захвата (CSV Wireshark) по chunk_size строк
+
+    Все значения читаются строками без замены пустых на NaN, как их
+    показывает Wireshark. Следующая порция читается только после
+    обработки предыдущей.
+    """
+    with pd.read_csv(
+        path,
+        chunksize=chunk_size,
+        dtype=str,
+        keep_default_na=False,
+        encoding=encoding,
+    ) as reader:
+        yield from reader
+
+
+def chunk_rows(chunk: pd.DataFrame) -> List[List[str]]:
+    """Строки порции списками значений в порядке колонок"""
+    return [list(values) for values in zip(*(chunk[column].tolist() for column in chunk.columns))]
+
+
+def volatile_columns(columns: Sequence[str]) -> List[int]:
+    """Номера изменчивых колонок по заголовку захвата"""
+    return [i for i, name in enumerate(columns) if str(name).strip().lower() in VOLATILE_COLUMNS]
+
+
+def normalize_info(text: str) -> str:
+    """Описание пакета без номеров последовательности и идентификаторов"""
+    for pattern, replacement in VOLATILE_INFO:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def row_features(row: Sequence[str], skip: Sequence[int] = ()) -> str:
+    """Строка признаков пакета: значения колонок через пробел
+
+    Без skip это вход модели. С непустым skip колонки skip пропускаются, а
+    описание пакета нормализуется: одинаковые пакеты дают одинаковую
+    строку, по ней строится ключ кэша классификаций.
+    """
+    if not skip:
+        return " ".join(row)
+    return " ".join(normalize_info(value) for i, value in enumerate(row) if i not in skip)
+
+
+def capture_features(rows: Sequence[Sequence[str]], skip: Sequence[int] = ()) -> List[str]:
+    skip = frozenset(skip)
+    return [row_features(row, skip) for row in rows]
+
+
+class CaptureResultWriter:
+    """Запись результатов классификации по мере обработки порций
+
+    Формат совпадает с detailed_traffic_analysis.csv: номер пакета,
+    метка, уверенность и исходные колонки как Field_0..Field_N.
+    """
+
+    def __init__(self, path: str, encoding: str = "utf-8"):
+        self.path = path
+        self.rows = 0
+        self._file = open(path, "w", newline="", encoding=encoding)
+        self._writer = csv.writer(self._file)
+        self._columns: Optional[int] = None
+
+    def write(
+        self,
+        rows: Sequence[Sequence[str]],
+        results: Sequence[Dict[str, Any]],
+        indices: Optional[Sequence[int]] = None,
+    ) -> None:
+        """Запись порции; indices - номера пакетов, если порядок не входной"""
+        if self._columns is None and rows:
+            self._columns = len(rows[0])
+            self._writer.writerow(
+                ["Packet Index", "Category", "Confidence"]
+                + [f"Field_{i}" for i in range(self._columns)]
+            )
+        if indices is None:
+            indices = range(self.rows, self.rows + len(rows))
+        for index, row, result in zip(indices, rows, results):
+            self._writer.writerow([index, result["label"], result["score"], *row])
+            self.rows += 1
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "CaptureResultWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
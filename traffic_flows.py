@@ -0,0 +1,272 @@
+import math
+import re
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from traffic_capture import normalize_info
+
+# Допустимые названия колонок экспорта захвата, без учета регистра
+CAPTURE_COLUMNS = {
+    "time": ("time", "timestamp", "frame.time_relative"),
+    "source": ("source", "src", "ip.src"),
+    "destination": ("destination", "dst", "ip.dst"),
+    "protocol": ("protocol", "proto"),
+    "length": ("length", "len", "frame.len"),
+    "info": ("info",),
+    "src_port": ("source port", "src port", "srcport", "tcp.srcport", "udp.srcport"),
+    "dst_port": ("destination port", "dst port", "dstport", "tcp.dstport", "udp.dstport"),
+}
+REQUIRED_COLUMNS = ("time", "source", "destination", "protocol")
+
+# Порты в описании пакета, если в экспорте нет отдельных колонок:
+# "51234 → 443 [SYN] ..." (TCP) и "Source port: 5353  Destination port: 5353" (UDP)
+PORTS_ARROW = re.compile(r"^\s*(\d+)\s*(?:→|->|>)\s*(\d+)\b")
+PORTS_UDP = re.compile(r"Source port:\s*(\d+)\s+Destination port:\s*(\d+)")
+# Абсолютное время Wireshark: "Jan  2, 2024 10:15:30.123456789 UTC"
+WIRESHARK_TIME = re.compile(r"^(\w{3})\s+(\d{1,2}), (\d{4}) (\d{2}:\d{2}:\d{2})(?:\.(\d+))?")
+# Доли секунды длиннее микросекунд (наносекунды Wireshark)
+LONG_FRACTION = re.compile(r"(\.\d{6})\d+")
+TCP_FLAGS = re.compile(r"\[((?:SYN|ACK|FIN|RST|PSH|URG|ECE|CWR|NS)(?:,\s*[A-Z]+)*)\]")
+
+FlowKey = Tuple[str, str, str, str, str]
+
+
+def capture_columns(columns: Sequence[str]) -> Dict[str, int]:
+    """Номера колонок захвата по заголовку"""
+    positions = {str(name).strip().lower(): i for i, name in enumerate(columns)}
+    found = {}
+    for name, aliases in CAPTURE_COLUMNS.items():
+        for alias in aliases:
+            if alias in positions:
+                found[name] = positions[alias]
+                break
+    missing = [name for name in REQUIRED_COLUMNS if name not in found]
+    if missing:
+        raise ValueError(f"В захвате нет колонок: {', '.join(missing)}")
+    return found
+
+
+def parse_ports(info: str) -> Tuple[str, str]:
+    """Порты источника и назначения из описания пакета или пустые строки"""
+    match = PORTS_ARROW.match(info) or PORTS_UDP.search(info)
+    return (match.group(1), match.group(2)) if match else ("", "")
+
+
+def parse_time(value: str) -> float:
+    """Время пакета в секундах: относительное или абсолютное
+
+    Относительное время - число секунд от начала захвата, абсолютное -
+    дата ISO 8601 или формат Wireshark. Время без часового пояса
+    считается местным; в одном захвате формат одинаковый, поэтому
+    промежутки между пакетами от этого не зависят.
+    """
+    text = value.strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(LONG_FRACTION.sub(r"\1", text)).timestamp()
+    except ValueError:
+        pass
+    match = WIRESHARK_TIME.match(text)
+    if match:
+        month, day, year, clock, fraction = match.groups()
+        moment = datetime.strptime(f"{month} {day} {year} {clock}", "%b %d %Y %H:%M:%S")
+        return moment.timestamp() + float(f"0.{fraction or 0}")
+    raise ValueError(f"Не удалось разобрать время пакета: {value!r}")
+
+
+def service_port(sport: str, dport: str) -> str:
+    """Порт службы потока: меньший из двух
+
+    Второй порт эфемерный, назначается клиенту заново для каждого
+    соединения и только мешает одинаковым потокам совпадать.
+    """
+    ports = [int(port) for port in (sport, dport) if port.isdigit()]
+    return str(min(ports)) if ports else ""
+
+
+def strip_ports(info: str) -> str:
+    """Описание пакета без портов, они уже есть в признаках потока"""
+    return PORTS_UDP.sub("", PORTS_ARROW.sub("", info, count=1), count=1).strip()
+
+
+def parse_flags(info: str) -> List[str]:
+    """Флаги TCP из описания пакета: [SYN, ACK] -> ["SYN", "ACK"]"""
+    match = TCP_FLAGS.search(info)
+    return [flag.strip() for flag in match.group(1).split(",")] if match else []
+
+
+@dataclass
+class Flow:
+    """Пакеты одного направления 5-кортежа между таймаутами"""
+
+    key: FlowKey
+    first_seen: float
+    last_seen: float
+    info: str
+    indices: List[int] = field(default_factory=list)
+    rows: List[Sequence[str]] = field(default_factory=list)
+    times: List[float] = field(default_factory=list)
+    sizes: List[int] = field(default_factory=list)
+    flags: Counter = field(default_factory=Counter)
+
+    @property
+    def packets(self) -> int:
+        return len(self.indices)
+
+    def stats(self) -> Dict[str, float]:
+        """Агрегированные признаки потока"""
+        gaps = [b - a for a, b in zip(self.times, self.times[1:])]
+        mean_gap = sum(gaps) / len(gaps) if gaps else 0.0
+        return {
+            "packets": self.packets,
+            "bytes": sum(self.sizes),
+            "size_min": min(self.sizes),
+            "size_max": max(self.sizes),
+            "size_mean": sum(self.sizes) / len(self.sizes),
+            "duration": self.last_seen - self.first_seen,
+            "iat_mean": mean_gap,
+            "iat_std": (
+                math.sqrt(sum((gap - mean_gap) ** 2 for gap in gaps) / len(gaps)) if gaps else 0.0
+            ),
+            "iat_min": min(gaps, default=0.0),
+            "iat_max": max(gaps, default=0.0),
+        }
+
+    def features(self) -> str:
+        """Строка признаков потока для модели
+
+        Значения округлены, а из портов остается только порт службы
+        (service_port), чтобы похожие потоки давали одинаковую строку и
+        попадали в кэш классификации. IAT - мин/среднее/СКО/макс
+        промежутков между пакетами.
+        """
+        src, dst, sport, dport, proto = self.key
+        stats = self.stats()
+        flags = ",".join(f"{flag}={n}" for flag, n in sorted(self.flags.items())) or "None"
+        return (
+            f"FLOW PROTO:{proto} SRC:{src} DST:{dst} PORT:{service_port(sport, dport)} "
+            f"PACKETS:{stats['packets']} BYTES:{stats['bytes']} "
+            f"SIZE:{stats['size_min']}/{stats['size_mean']:.0f}/{stats['size_max']} "
+            f"DURATION:{stats['duration']:.3f} "
+            f"IAT:{stats['iat_min']:.3f}/{stats['iat_mean']:.3f}/{stats['iat_std']:.3f}/"
+            f"{stats['iat_max']:.3f} "
+            f"FLAGS:{flags} INFO:{normalize_info(strip_ports(self.info))}"
+        )
+
+
+class FlowAssembler:
+    """Сборка пакетов в потоки по (src, dst, sport, dport, proto)
+
+    Поток закрывается, если в нем не было пакетов idle_timeout секунд или
+    он длится дольше active_timeout; следующий пакет того же 5-кортежа
+    начинает новый поток. Время пакетов считается неубывающим, как в
+    экспорте захвата, поэтому простаивающие потоки закрываются по ходу
+    чтения и в памяти остаются только активные. Время, которое не удалось
+    разобрать (parse_time), - ошибка: без него потоки не закрывались бы.
+    """
+
+    def __init__(
+        self,
+        columns: Sequence[str],
+        idle_timeout: float = 60.0,
+        active_timeout: float = 600.0,
+    ):
+        self.columns = capture_columns(columns)
+        self.idle_timeout = idle_timeout
+        self.active_timeout = active_timeout
+        # Активные потоки в порядке последнего пакета: первым идет самый давний
+        self._active: "OrderedDict[FlowKey, Flow]" = OrderedDict()
+        self._now = 0.0
+
+        self.packets = 0
+        self.flows = 0
+
+    def _value(self, row: Sequence[str], name: str) -> str:
+        index = self.columns.get(name)
+        return row[index] if index is not None else ""
+
+    def add(self, index: int, row: Sequence[str]) -> List[Flow]:
+        """Учет пакета, возвращает закрывшиеся к этому моменту потоки"""
+        now = parse_time(self._value(row, "time"))
+        self._now = max(self._now, now)
+        closed = self.expire(self._now)
+
+        info = self._value(row, "info")
+        sport, dport = self._value(row, "src_port"), self._value(row, "dst_port")
+        if not sport and not dport:
+            sport, dport = parse_ports(info)
+        key = (
+            self._value(row, "source"),
+            self._value(row, "destination"),
+            sport,
+            dport,
+            self._value(row, "protocol"),
+        )
+
+        flow = self._active.get(key)
+        if flow is not None and now - flow.first_seen > self.active_timeout:
+            closed.append(self._active.pop(key))
+            flow = None
+        if flow is None:
+            flow = self._active[key] = Flow(key, now, now, info)
+            self.flows += 1
+        else:
+            self._active.move_to_end(key)
+
+        try:
+            size = int(self._value(row, "length") or 0)
+        except ValueError:
+            size = 0
+        flow.last_seen = now
+        flow.indices.append(index)
+        flow.rows.append(row)
+        flow.times.append(now)
+        flow.sizes.append(size)
+        flow.flags.update(parse_flags(info))
+        self.packets += 1
+        return closed
+
+    def expire(self, now: float) -> List[Flow]:
+        """Закрытие потоков без пакетов дольше idle_timeout"""
+        closed = []
+        while self._active:
+            key, flow = next(iter(self._active.items()))
+            if now - flow.last_seen <= self.idle_timeout:
+                break
+            closed.append(self._active.pop(key))
+        return closed
+
+    def flush(self) -> List[Flow]:
+        """Закрытие всех потоков в конце захвата"""
+        closed = list(self._active.values())
+        self._active.clear()
+        return closed
+
+    @property
+    def active(self) -> int:
+        return len(self._active)
+
+
+def assemble_flows(
+    chunks: Iterable[Tuple[Sequence[str], Sequence[Sequence[str]]]],
+    idle_timeout: float = 60.0,
+    active_timeout: float = 600.0,
+) -> Iterator[List[Flow]]:
+    """Закрывшиеся потоки после каждой порции (заголовок, строки) и в конце"""
+    assembler: Optional[FlowAssembler] = None
+    index = 0
+    for columns, rows in chunks:
+        if assembler is None:
+            assembler = FlowAssembler(columns, idle_timeout, active_timeout)
+        closed = []
+        for row in rows:
+            closed.extend(assembler.add(index, row))
+            index += 1
+        yield closed
+    if assembler is not None:
+        yield assembler.flush()
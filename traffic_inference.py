@@ -0,0 +1,242 @@
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+import torch
+from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
+
+from tracing import record_error, span
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+ERROR_RESULT = {"label": "ERROR", "score": 0.0}
+
+# Файлы модели в каталоге экспорта ONNX (см. download_model.py export)
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model.int8.onnx"
+
+# Вариант модели ONNX -> файл каталога экспорта
+ONNX_FILES = {"onnx": ONNX_FILE, "onnx-int8": ONNX_INT8_FILE}
+
+
+def configure_threads(intra_op: Optional[int] = None, inter_op: Optional[int] = None) -> None:
+    """Настройка потоков PyTorch для инференса на CPU
+
+    intra_op - потоков внутри одной операции (матричные умножения пакета),
+    inter_op - параллельных операций графа. Пакеты выполняются по одному,
+    поэтому inter_op=1 обычно быстрее: все ядра отдаются intra_op.
+    Число inter_op потоков можно задать только до первого вычисления.
+    """
+    if intra_op is not None:
+        torch.set_num_threads(intra_op)
+    if inter_op is not None:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError:
+            # Пул уже создан: оставляем текущее значение
+            pass
+
+
+class EagerBackend:
+    """Модель PyTorch без изменений"""
+
+    name = "eager"
+
+    def __init__(self, model):
+        self.model = model.eval()
+        self.id2label = dict(model.config.id2label)
+
+    def forward(self, batch: Dict[str, torch.Tensor]) -> torch.Tensor:
+        """Логиты модели для выровненного пакета"""
+        return self.model(**batch).logits
+
+
+class Int8Backend(EagerBackend):
+    """Динамическое квантование линейных слоев в int8 при загрузке
+
+    Веса Linear хранятся в int8, активации квантуются на лету: на CPU это
+    основная часть вычислений трансформера.
+    """
+
+    name = "int8"
+
+    def __init__(self, model):
+        quantized = torch.ao.quantization.quantize_dynamic(
+            model.eval(), {torch.nn.Linear}, dtype=torch.qint8
+        )
+        super().__init__(quantized)
+
+
+class OnnxBackend:
+    """Экспортированная модель ONNX через ONNX Runtime на CPU"""
+
+    def __init__(
+        self,
+        path: str,
+        id2label: Dict[int, str],
+        num_threads: Optional[int] = None,
+        name: str = "onnx",
+    ):
+        self.name = name
+        if onnxruntime is None:
+            raise RuntimeError("Для модели ONNX нужен пакет onnxruntime")
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [item.name for item in self.session.get_inputs()]
+        self.id2label = dict(id2label)
+
+    def forward(self, batch: Dict[str, torch.Tensor]) -> torch.Tensor:
+        feed = {name: batch[name].numpy() for name in self.input_names if name in batch}
+        return torch.from_numpy(self.session.run(None, feed)[0])
+
+
+BACKENDS = ("eager", "int8", "onnx", "onnx-int8")
+
+
+def onnx_model_file(model_dir: str, backend: str = "onnx") -> str:
+    """Файл ONNX каталога экспорта для варианта модели"""
+    path = os.path.join(model_dir, ONNX_FILES[backend])
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Нет файла модели {backend}: {path}")
+    return path
+
+
+def load_backend(model_dir: str, backend: str = "eager", num_threads: Optional[int] = None):
+    """Модель из каталога в выбранном варианте
+
+    eager и int8 загружают веса PyTorch, onnx и onnx-int8 - исходный и
+    квантованный файлы из каталога экспорта.
+    """
+    if backend in ONNX_FILES:
+        config = AutoConfig.from_pretrained(model_dir)
+        return OnnxBackend(
+            onnx_model_file(model_dir, backend), config.id2label, num_threads, name=backend
+        )
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный вариант модели: {backend}")
+
+    model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+    return Int8Backend(model) if backend == "int8" else EagerBackend(model)
+
+
+def load_classifier(
+    model_dir: str, backend: str = "eager", num_threads: Optional[int] = None, **options
+) -> "TrafficClassifier":
+    """Классификатор с токенизатором из того же каталога
+
+    options передаются в TrafficClassifier.
+    """
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    return TrafficClassifier(load_backend(model_dir, backend, num_threads), tokenizer, **options)
+
+
+class TrafficClassifier:
+    """Пакетная классификация строк признаков пакетов
+
+    Строки сортируются по длине и режутся на пакеты по batch_size: в пакет
+    попадают строки близкой длины, и выравнивание почти не добавляет
+    лишних токенов. Пакет токенизируется и выполняется под
+    torch.inference_mode(). Ошибка пакета, в том числе при токенизации,
+    помечает только его строки результатом ERROR, остальные пакеты
+    продолжают работу.
+
+    backend - EagerBackend, Int8Backend или OnnxBackend: объект с id2label
+    и методом forward(пакет) -> логиты.
+    """
+
+    def __init__(
+        self,
+        backend,
+        tokenizer,
+        batch_size: int = 32,
+        max_length: int = 128,
+        pad_to_multiple_of: Optional[int] = 8,
+    ):
+        self.backend = backend
+        self.tokenizer = tokenizer
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.pad_to_multiple_of = pad_to_multiple_of
+        self.id2label = backend.id2label
+
+        self.batches = 0
+        self.failed_batches = 0
+
+    def _run_batch(self, texts: List[str], batch_span=None) -> List[Dict[str, Any]]:
+        with span("inference.tokenize", rows=len(texts)):
+            batch = self.tokenizer(
+                texts,
+                truncation=True,
+                max_length=self.max_length,
+                padding=True,
+                pad_to_multiple_of=self.pad_to_multiple_of,
+                return_tensors="pt",
+            )
+        if batch_span is not None:
+            batch_span.set(tokens=batch["input_ids"].shape[1])
+        with torch.inference_mode():
+            probabilities = torch.softmax(self.backend.forward(dict(batch)).float(), dim=-1)
+        scores, labels = probabilities.max(dim=-1)
+        return [
+            {"label": self.id2label.get(label, f"LABEL_{label}"), "score": score}
+            for label, score in zip(labels.tolist(), scores.tolist())
+        ]
+
+    def classify(self, texts: Sequence[str]) -> List[Dict[str, Any]]:
+        """Метка и уверенность для каждой строки в порядке входа"""
+        if not texts:
+            return []
+
+        # Длина строки в символах почти всегда упорядочивает строки так же,
+        # как число токенов, и не требует токенизации всего входа заранее
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            indices = order[start:start + self.batch_size]
+            self.batches += 1
+            try:
+                with span(
+                    "inference.batch", backend=self.backend.name, rows=len(indices)
+                ) as batch_span:
+                    batch_results = self._run_batch([texts[i] for i in indices], batch_span)
+            except Exception as e:
+                self.failed_batches += 1
+                record_error("inference", e, backend=self.backend.name)
+                batch_results = [dict(ERROR_RESULT) for _ in indices]
+            for i, result in zip(indices, batch_results):
+                results[i] = result
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {"batches": self.batches, "failed_batches": self.failed_batches}
+
+
+def compare_classifiers(
+    texts: Sequence[str], reference: TrafficClassifier, candidate: TrafficClassifier
+) -> Dict[str, Any]:
+    """Сверка меток и уверенности двух вариантов модели на одних строках"""
+    expected = reference.classify(texts)
+    actual = candidate.classify(texts)
+    pairs = [
+        (e, a) for e, a in zip(expected, actual)
+        if e["label"] != "ERROR" and a["label"] != "ERROR"
+    ]
+    differences = [abs(e["score"] - a["score"]) for e, a in pairs]
+    return {
+        "rows": len(texts),
+        "compared": len(pairs),
+        "label_agreement": (
+            sum(e["label"] == a["label"] for e, a in pairs) / len(pairs) if pairs else None
+        ),
+        "max_score_diff": max(differences, default=None),
+        "mean_score_diff": sum(differences) / len(differences) if differences else None,
+    }
@@ -0,0 +1,182 @@
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import pyarrow as pa
+
+
+@dataclass(slots=True)
+class UnifiedIPData:
+    """Унифицированная структура данных IP"""
+
+    ip_address: str
+    source: str
+    country: Optional[str] = None
+    country_code: Optional[str] = None
+    region: Optional[str] = None
+    city: Optional[str] = None
+    zip_code: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    isp: Optional[str] = None
+    asn: Optional[str] = None
+    organization: Optional[str] = None
+    asn_organization: Optional[str] = None
+    hostname: Optional[str] = None
+    ip_range: Optional[str] = None
+    company: Optional[str] = None
+    hosted_domains_count: Optional[int] = None
+    is_private: Optional[bool] = None
+    is_anycast: Optional[bool] = None
+    asn_type: Optional[str] = None
+    district: Optional[str] = None
+    abuse_email: Optional[str] = None
+    timezone: Optional[str] = None
+    range_derived: Optional[bool] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Преобразование в словарь"""
+        return _compact({name: getattr(self, name) for name in FIELD_NAMES})
+
+    def to_json(self) -> str:
+        """Преобразование в JSON"""
+        return json.dumps(self.to_dict(), indent=2, ensure_ascii=False)
+
+
+FIELD_NAMES = tuple(UnifiedIPData.__dataclass_fields__)
+
+# Поля, которые присутствуют в словаре записи даже без значения
+REQUIRED_FIELDS = ("ip_address", "source")
+
+# Строковые колонки хранятся со словарным кодированием: страны, ASN и
+# провайдеры повторяются в миллионах записей. IP уникальны, их не кодируем
+_STRING = pa.dictionary(pa.int32(), pa.string())
+
+SCHEMA = pa.schema(
+    [
+        pa.field(
+            name,
+            {
+                "ip_address": pa.string(),
+                "latitude": pa.float64(),
+                "longitude": pa.float64(),
+                "hosted_domains_count": pa.int64(),
+                "is_private": pa.bool_(),
+                "is_anycast": pa.bool_(),
+                "range_derived": pa.bool_(),
+            }.get(name, _STRING),
+            nullable=name not in REQUIRED_FIELDS,
+        )
+        for name in FIELD_NAMES
+    ]
+)
+
+
+def _compact(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Удаление пустых полей, кроме обязательных"""
+    return {k: v for k, v in row.items() if v is not None or k in REQUIRED_FIELDS}
+
+
+class UnifiedIPBatch:
+    """Колоночный набор унифицированных записей поверх pyarrow.Table
+
+    Строковые колонки закодированы словарем, поэтому миллионы записей
+    занимают память порядка числа различных значений, а не числа записей.
+    Преобразование в pyarrow и обратно выполняется без копирования.
+    """
+
+    __slots__ = ("table",)
+
+    def __init__(self, table: pa.Table):
+        self.table = table
+
+    @classmethod
+    def from_records(
+        cls, records: Iterable[Union[UnifiedIPData, Dict[str, Any]]]
+    ) -> "UnifiedIPBatch":
+        """Сборка набора из записей или их словарей"""
+        columns: Dict[str, List[Any]] = {name: [] for name in FIELD_NAMES}
+        for record in records:
+            if isinstance(record, UnifiedIPData):
+                for name in FIELD_NAMES:
+                    columns[name].append(getattr(record, name))
+            else:
+                for name in FIELD_NAMES:
+                    columns[name].append(record.get(name))
+
+        arrays = [
+            pa.array(columns[field.name], type=field.type) for field in SCHEMA
+        ]
+        return cls(pa.Table.from_arrays(arrays, schema=SCHEMA))
+
+    @classmethod
+    def from_arrow(cls, data: Union[pa.Table, pa.RecordBatch]) -> "UnifiedIPBatch":
+        """Набор поверх таблицы pyarrow без копирования
+
+        Отсутствующие колонки добавляются пустыми, порядок колонок
+        приводится к SCHEMA. Колонки другого типа (например, строки без
+        словарного кодирования) приводятся к типу SCHEMA, совпадающие
+        не копируются.
+        """
+        if isinstance(data, pa.RecordBatch):
+            data = pa.Table.from_batches([data])
+
+        arrays = []
+        for field in SCHEMA:
+            if field.name in data.column_names:
+                column = data.column(field.name)
+                if column.type != field.type:
+                    column = column.cast(field.type)
+                arrays.append(column)
+            else:
+                arrays.append(pa.nulls(data.num_rows, type=field.type))
+        return cls(pa.Table.from_arrays(arrays, schema=SCHEMA))
+
+    @classmethod
+    def concat(cls, batches: Sequence["UnifiedIPBatch"]) -> "UnifiedIPBatch":
+        """Объединение наборов без копирования данных колонок"""
+        if not batches:
+            return cls.from_records([])
+        tables = [batch.table for batch in batches]
+        return cls(pa.concat_tables(tables, promote_options="permissive"))
+
+    def to_arrow(self) -> pa.Table:
+        """Таблица pyarrow набора"""
+        return self.table
+
+    def __len__(self) -> int:
+        return self.table.num_rows
+
+    def __getitem__(self, index: int) -> UnifiedIPData:
+        row = self.table.slice(index, 1).to_pylist()
+        if not row:
+            raise IndexError(index)
+        return UnifiedIPData(**row[0])
+
+    def __iter__(self) -> Iterator[UnifiedIPData]:
+        for row in self.table.to_pylist():
+            yield UnifiedIPData(**row)
+
+    @property
+    def nbytes(self) -> int:
+        """Размер данных колонок в байтах"""
+        return self.table.nbytes
+
+    def column(self, name: str) -> pa.ChunkedArray:
+        """Колонка набора"""
+        return self.table.column(name)
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Словари всех записей, как UnifiedIPData.to_dict"""
+        return [_compact(row) for row in self.table.to_pylist()]
+
+    def to_json_lines(self) -> str:
+        """Записи в формате JSON Lines"""
+        return "".join(
+            json.dumps(row, ensure_ascii=False) + "\n" for row in self.to_dicts()
+        )
+
+    def to_json(self) -> str:
+        """Записи в виде JSON-массива"""
+        return json.dumps(self.to_dicts(), ensure_ascii=False)